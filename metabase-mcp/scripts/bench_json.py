@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+JSON decode/encode benchmark for large Metabase query results
+
+Builds a synthetic /dataset response (the same rows as scripts/fake_metabase.py) and
+times the two JSON steps of an execute_query call with each installed JSON backend:
+decoding the Metabase response body, and encoding the tool result for the MCP client.
+FastMCP's default tool serializer (pydantic-core, indented) is measured as the encode
+baseline.
+
+    uv run python scripts/bench_json.py --rows 100000 --runs 5
+
+For the end-to-end effect, compare tool calls with each backend:
+
+    METABASE_JSON_BACKEND=json uv run python scripts/bench_tools.py --rows 100000
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import pydantic_core
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPTS_DIR.parent))
+
+from fake_metabase import dataset_body  # noqa: E402
+
+
+def timed(fn, runs: int) -> float:
+    """Median wall time of fn() in milliseconds"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON backends on query results")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    from server import JSON_BACKENDS, select_json_backend
+
+    body = dataset_body(args.rows)
+    result = select_json_backend("json")[1](body)
+    print(f"{args.rows} rows, {len(body) / 2**20:.1f} MiB response body")
+    print(f"{'backend':<16}{'decode ms':>12}{'encode ms':>12}{'output MiB':>12}")
+
+    baseline = pydantic_core.to_json(result, fallback=str, indent=2)
+    encode_ms = timed(lambda: pydantic_core.to_json(result, fallback=str, indent=2), args.runs)
+    print(f"{'fastmcp default':<16}{'':>12}{encode_ms:>12.1f}{len(baseline) / 2**20:>12.1f}")
+
+    for name in JSON_BACKENDS:
+        try:
+            _, loads, dumps = select_json_backend(name)
+        except ValueError:
+            print(f"{name:<16}{'not installed':>12}")
+            continue
+        decode_ms = timed(lambda: loads(body), args.runs)
+        encode_ms = timed(lambda: dumps(result), args.runs)
+        size = len(dumps(result)) / 2**20
+        print(f"{name:<16}{decode_ms:>12.1f}{encode_ms:>12.1f}{size:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
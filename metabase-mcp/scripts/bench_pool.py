@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Connection pool benchmark for the Metabase HTTP client
+
+Starts the local stub Metabase (scripts/fake_metabase.py) and measures requests per
+second for the previous default client (httpx.AsyncClient(timeout=30.0)) and for the
+tuned client built by server.create_http_client(), at several concurrency levels.
+
+Loopback connections are nearly free, so requests go through a small TCP proxy that
+delays every new connection by --handshake-ms to model the TCP/TLS setup cost of
+reaching a remote Metabase. Set it to 0 to measure the raw stub.
+
+Two traffic shapes are measured: "sustained" back-to-back load, and "bursty" load where
+bursts of concurrent calls (one agent turn fanning out) are separated by idle gaps
+longer than httpx's default 5s keepalive expiry.
+
+    uv run python scripts/bench_pool.py --requests 2000 --concurrency 10 50 100
+"""
+
+import argparse
+import asyncio
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPTS_DIR.parent))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(port: int, latency_ms: float, rows: int = 100) -> subprocess.Popen:
+    """Start the stub Metabase and wait until it accepts connections"""
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            str(SCRIPTS_DIR / "fake_metabase.py"),
+            "--port",
+            str(port),
+            "--latency-ms",
+            str(latency_ms),
+            "--rows",
+            str(rows),
+        ]
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/table/1/query_metadata", timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Stub Metabase did not start")
+
+
+async def start_handshake_proxy(target_port: int, handshake_ms: float) -> asyncio.Server:
+    """Forward connections to the stub, delaying each new one by handshake_ms"""
+
+    async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        try:
+            await asyncio.sleep(handshake_ms / 1000)
+            upstream_reader, upstream_writer = await asyncio.open_connection(
+                "127.0.0.1", target_port
+            )
+            await asyncio.gather(
+                pipe(client_reader, upstream_writer), pipe(upstream_reader, client_writer)
+            )
+        except asyncio.CancelledError:
+            # Connections still open when the benchmark exits
+            pass
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+async def run_load(
+    client: httpx.AsyncClient, base_url: str, total: int, concurrency: int
+) -> dict[str, float]:
+    """Issue `total` GETs with at most `concurrency` in flight and collect latencies"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(f"{base_url}/api/table/{i % 50 + 1}/query_metadata")
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def run_bursts(
+    client: httpx.AsyncClient, base_url: str, bursts: int, concurrency: int, gap: float
+) -> dict[str, float]:
+    """Issue `bursts` rounds of `concurrency` parallel GETs separated by `gap` seconds idle"""
+    results = []
+    for burst in range(bursts):
+        if burst:
+            await asyncio.sleep(gap)
+        results.append(await run_load(client, base_url, concurrency, concurrency))
+    return {
+        "rps": statistics.mean(r["rps"] for r in results),
+        "p50_ms": statistics.median(r["p50_ms"] for r in results),
+        "p99_ms": max(r["p99_ms"] for r in results),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark Metabase HTTP client pooling")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--handshake-ms", type=float, default=30)
+    parser.add_argument("--bursts", type=int, default=4)
+    parser.add_argument("--gap-seconds", type=float, default=6)
+    args = parser.parse_args()
+
+    from server import create_http_client
+
+    port = free_port()
+    stub = start_stub(port, args.latency_ms)
+    base_url = f"http://127.0.0.1:{port}"
+    proxy = None
+    if args.handshake_ms > 0:
+        proxy = await start_handshake_proxy(port, args.handshake_ms)
+        base_url = f"http://127.0.0.1:{proxy.sockets[0].getsockname()[1]}"
+
+    clients = {
+        "default": lambda: httpx.AsyncClient(timeout=30.0),
+        "tuned": create_http_client,
+    }
+
+    try:
+        print(
+            f"{'shape':<11}{'client':<10}{'concurrency':>12}"
+            f"{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+        )
+        for concurrency in args.concurrency:
+            for name, factory in clients.items():
+                async with factory() as client:
+                    # Warm up the pool so both clients start from the same state
+                    await run_load(client, base_url, concurrency, concurrency)
+                    sustained = await run_load(client, base_url, args.requests, concurrency)
+                    bursty = await run_bursts(
+                        client, base_url, args.bursts, concurrency, args.gap_seconds
+                    )
+                for shape, result in (("sustained", sustained), ("bursty", bursty)):
+                    print(
+                        f"{shape:<11}{name:<10}{concurrency:>12}{result['rps']:>10.0f}"
+                        f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+                    )
+    finally:
+        if proxy is not None:
+            proxy.close()
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the Metabase MCP server
+
+Spawns the server over stdio the way Cursor and Claude Desktop do, against the local
+stub Metabase (scripts/fake_metabase.py), and measures how long each fresh process takes
+to answer `initialize`, to list its tools and to return the first tool call. It also
+times a bare `import server`, the cost paid by scripts that reuse the client.
+
+Pass several --server files to compare revisions; runs are interleaved so they see the
+same machine load:
+
+    git show HEAD~1:metabase-mcp/server.py > /tmp/server_before.py
+    uv run python scripts/bench_startup.py --server server.py /tmp/server_before.py
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPTS_DIR.parent))
+
+from bench_pool import free_port, start_stub  # noqa: E402
+
+# Requests sent after the server has answered initialize, in order
+REQUESTS = [
+    ("tools_list_ms", {"method": "tools/list"}),
+    (
+        "first_call_ms",
+        {"method": "tools/call", "params": {"name": "list_databases", "arguments": {}}},
+    ),
+]
+
+
+def server_env(base_url: str) -> dict[str, str]:
+    env = {
+        **os.environ,
+        "METABASE_URL": base_url,
+        "METABASE_API_KEY": "bench-key",
+        "METABASE_CATALOG_PATH": "none",
+        "METABASE_TRACING": "",
+    }
+    env.pop("METABASE_USER_EMAIL", None)
+    return env
+
+
+def send(process: subprocess.Popen, message: dict) -> None:
+    process.stdin.write(json.dumps({"jsonrpc": "2.0", **message}) + "\n")
+    process.stdin.flush()
+
+
+def receive(process: subprocess.Popen, request_id: int) -> dict:
+    """Read stdout until the response to request_id arrives"""
+    while line := process.stdout.readline():
+        message = json.loads(line)
+        if message.get("id") == request_id:
+            if "error" in message:
+                raise RuntimeError(f"Request {request_id} failed: {message['error']}")
+            return message
+    raise RuntimeError("Server exited before answering")
+
+
+def spawn_once(server: Path, env: dict[str, str]) -> dict[str, float]:
+    """Start one stdio server and time its first responses from the moment of the spawn"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(server)],
+        cwd=server.parent,
+        env=env,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    timings = {}
+    try:
+        send(
+            process,
+            {
+                "id": 0,
+                "method": "initialize",
+                "params": {
+                    "protocolVersion": "2025-03-26",
+                    "capabilities": {},
+                    "clientInfo": {"name": "bench_startup", "version": "0"},
+                },
+            },
+        )
+        receive(process, 0)
+        timings["initialize_ms"] = (time.perf_counter() - started) * 1000
+        send(process, {"method": "notifications/initialized"})
+        for request_id, (name, request) in enumerate(REQUESTS, start=1):
+            send(process, {"id": request_id, **request})
+            receive(process, request_id)
+            timings[name] = (time.perf_counter() - started) * 1000
+    finally:
+        process.stdin.close()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    return timings
+
+
+def import_once(server: Path, env: dict[str, str]) -> float:
+    """Time a fresh interpreter that only imports the server module"""
+    code = f"import sys; sys.path.insert(0, {str(server.parent)!r}); import {server.stem}"
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=env, check=True, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MCP server cold start over stdio")
+    parser.add_argument(
+        "--server", type=Path, nargs="+", default=[SCRIPTS_DIR.parent / "server.py"]
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    servers = [path.resolve() for path in args.server]
+    port = free_port()
+    stub = start_stub(port, args.latency_ms)
+    env = server_env(f"http://127.0.0.1:{port}")
+    samples: dict[Path, list[dict[str, float]]] = {server: [] for server in servers}
+    try:
+        for server in servers:
+            # Warm the OS file cache and write the imported module's bytecode cache
+            spawn_once(server, env)
+            import_once(server, env)
+        for _ in range(args.runs):
+            for server in servers:
+                timings = spawn_once(server, env)
+                timings["import_ms"] = import_once(server, env)
+                samples[server].append(timings)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    columns = ["import_ms", "initialize_ms", "tools_list_ms", "first_call_ms"]
+    results = []
+    print(f"{'server':<32}" + "".join(f"{name:>16}" for name in columns))
+    for server in servers:
+        medians = {
+            name: statistics.median(run[name] for run in samples[server]) for name in columns
+        }
+        results.append({"server": str(server), "runs": args.runs, **medians})
+        print(f"{server.name:<32}" + "".join(f"{medians[name]:>16.1f}" for name in columns))
+    print(f"(median of {args.runs} runs; stdio timings are measured from process spawn)")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Tool-level benchmark suite for the Metabase MCP server
+
+Starts the local stub Metabase (scripts/fake_metabase.py) once per payload size and
+drives the server in-process through fastmcp.Client, so every call pays the same MCP
+framing and serialization as a real client. Each (tool, payload size, concurrency)
+scenario runs in a fresh worker process, so the peak RSS reported is its own.
+
+Reported per scenario: tool calls per second, p50/p99 call latency, and the worker's
+peak resident memory, in total and above its baseline after importing the server.
+The result cache is bypassed (use_cache=false) and requests are varied so they are not
+coalesced; metadata tools are served from the catalog as in production.
+
+    uv run python scripts/bench_tools.py --rows 100 10000 --concurrency 1 10 50
+    uv run python scripts/bench_tools.py --tools execute_query --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPTS_DIR.parent))
+
+from bench_pool import free_port, start_stub  # noqa: E402
+
+# Arguments for call number i of each tool; the flag marks tools whose cost depends on
+# the result size, which are measured at every --rows value
+TOOLS = {
+    "execute_query": (
+        True,
+        lambda i: {
+            "database_id": 5,
+            "query": f"SELECT * FROM ad_spend_daily -- call {i}",
+            "use_cache": False,
+        },
+    ),
+    "execute_card": (True, lambda i: {"card_id": i + 1, "use_cache": False}),
+    "execute_dashboard": (
+        True,
+        lambda i: {"dashboard_id": 25, "parameters": {"platform": f"p{i}"}, "use_cache": False},
+    ),
+    "list_tables": (False, lambda i: {"database_id": 5}),
+    "get_table_fields": (False, lambda i: {"table_id": i % 50 + 1}),
+    "search_schema": (False, lambda i: {"query": f"spend revenue field {i % 12}"}),
+    "list_cards": (False, lambda i: {"database_id": 5, "limit": 20}),
+}
+
+
+def rss_mib() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run_worker(tool: str, calls: int, concurrency: int) -> dict:
+    """Measure one scenario against the stub named by METABASE_URL"""
+    from fastmcp import Client
+
+    from server import mcp
+
+    make_arguments = TOOLS[tool][1]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def one(client: Client, i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await client.call_tool(tool, make_arguments(i))
+            latencies.append(time.perf_counter() - started)
+
+    async with Client(mcp) as client:
+        baseline = rss_mib()
+        # Warm up connections and the metadata catalog
+        await asyncio.gather(*(one(client, i) for i in range(concurrency)))
+        latencies.clear()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, concurrency + i) for i in range(calls)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    peak = rss_mib()
+    return {
+        "calls_per_second": calls / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000,
+        "peak_rss_mib": peak,
+        "rss_growth_mib": peak - baseline,
+    }
+
+
+def run_scenario(base_url: str, tool: str, rows: int, concurrency: int, calls: int) -> dict:
+    """Run one scenario in a fresh worker process and return its measurements"""
+    env = {
+        **os.environ,
+        "METABASE_URL": base_url,
+        "METABASE_API_KEY": "bench-key",
+        "METABASE_CATALOG_PATH": "none",
+        "METABASE_TRACING": "",
+    }
+    env.pop("METABASE_USER_EMAIL", None)
+    output = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--worker",
+            tool,
+            "--calls",
+            str(calls),
+            "--concurrency",
+            str(concurrency),
+        ],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return {"tool": tool, "rows": rows, "concurrency": concurrency, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MCP tools against a stub Metabase")
+    parser.add_argument("--tools", nargs="+", choices=list(TOOLS), default=list(TOOLS))
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 10000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--worker", choices=list(TOOLS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(run_worker(args.worker, args.calls, args.concurrency[0]))))
+        return
+
+    results = []
+    print(
+        f"{'tool':<20}{'rows':>8}{'concurrency':>13}{'calls/s':>10}"
+        f"{'p50 ms':>10}{'p99 ms':>10}{'peak RSS MiB':>14}{'growth':>9}"
+    )
+    for index, rows in enumerate(args.rows):
+        tools = [tool for tool in args.tools if TOOLS[tool][0] or index == 0]
+        port = free_port()
+        stub = start_stub(port, args.latency_ms, rows)
+        try:
+            for tool in tools:
+                for concurrency in args.concurrency:
+                    result = run_scenario(
+                        f"http://127.0.0.1:{port}", tool, rows, concurrency, args.calls
+                    )
+                    results.append(result)
+                    print(
+                        f"{tool:<20}{rows if TOOLS[tool][0] else '-':>8}{concurrency:>13}"
+                        f"{result['calls_per_second']:>10.0f}{result['p50_ms']:>10.1f}"
+                        f"{result['p99_ms']:>10.1f}{result['peak_rss_mib']:>14.1f}"
+                        f"{result['rss_growth_mib']:>9.1f}",
+                        flush=True,
+                    )
+        finally:
+            stub.terminate()
+            stub.wait()
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
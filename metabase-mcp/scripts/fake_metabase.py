@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Local stub of the Metabase API for benchmarks
+
+Serves canned responses for the endpoints the MCP server uses (query, card, dashboard,
+metadata and session endpoints), with a configurable artificial latency and result size.
+Run it directly or start it from a benchmark:
+
+    uv run python scripts/fake_metabase.py --port 3999 --latency-ms 20 --rows 500
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+LATENCY_SECONDS = float(os.getenv("FAKE_METABASE_LATENCY_MS", "0")) / 1000
+ROWS = int(os.getenv("FAKE_METABASE_ROWS", "100"))
+TABLES = 50
+CARDS = 50
+DASHCARDS = 9
+
+COLS = [
+    {"name": "date", "display_name": "Date", "base_type": "type/Date"},
+    {"name": "platform", "display_name": "Platform", "base_type": "type/Text"},
+    {"name": "campaign_key", "display_name": "Campaign Key", "base_type": "type/Text"},
+    {"name": "total_spend", "display_name": "Total Spend", "base_type": "type/Float"},
+    {"name": "total_revenue", "display_name": "Total Revenue", "base_type": "type/Float"},
+]
+
+
+def dataset_response(rows: int, database_id: int = 5) -> dict:
+    """Build a /dataset style response with the given number of rows"""
+    data_rows = [
+        [
+            f"2025-09-{(i % 30) + 1:02d}",
+            "google" if i % 2 else "meta",
+            f"campaign_{i % 40}",
+            round(10 + (i % 97) * 1.5, 2),
+            round(25 + (i % 89) * 3.25, 2),
+        ]
+        for i in range(rows)
+    ]
+    return {
+        "status": "completed",
+        "database_id": database_id,
+        "row_count": rows,
+        "data": {"rows": data_rows, "cols": COLS},
+    }
+
+
+def table_metadata(table_id: int, database_id: int = 5, fields: int = 12) -> dict:
+    """Build a /table/{id}/query_metadata style response"""
+    return {
+        "id": table_id,
+        "db_id": database_id,
+        "schema": "analytics",
+        "name": f"table_{table_id}",
+        "display_name": f"Table {table_id}",
+        "description": None,
+        "entity_type": "entity/GenericTable",
+        "fields": [
+            {
+                "id": table_id * 1000 + i,
+                "table_id": table_id,
+                "name": f"field_{i}",
+                "display_name": f"Field {i}",
+                "base_type": "type/Text",
+                "description": None,
+            }
+            for i in range(fields)
+        ],
+    }
+
+
+@functools.lru_cache(maxsize=8)
+def dataset_body(rows: int, database_id: int = 5) -> bytes:
+    """Serialized dataset response, built once per size so the stub stays cheap under load"""
+    return json.dumps(dataset_response(rows, database_id)).encode()
+
+
+def card_summary(card_id: int) -> dict:
+    """Build a /card list entry"""
+    return {
+        "id": card_id,
+        "name": f"Card {card_id} spend and revenue by platform",
+        "description": "Daily ad spend and attributed revenue",
+        "collection_id": 47,
+        "collection": {"id": 47, "name": "ROAS"},
+        "database_id": 5,
+        "display": "table",
+        "archived": False,
+        "updated_at": "2025-09-01T00:00:00Z",
+        "dataset_query": {
+            "type": "native",
+            "database": 5,
+            "native": {"query": f"SELECT * FROM ad_spend_daily WHERE campaign_id = {card_id}"},
+        },
+    }
+
+
+def dashboard(dashboard_id: int) -> dict:
+    """Build a /dashboard/{id} response with date_range and platform filters"""
+    return {
+        "id": dashboard_id,
+        "name": f"Dashboard {dashboard_id}",
+        "parameters": [
+            {"id": "date_range", "slug": "date_range", "type": "date/all-options"},
+            {"id": "platform", "slug": "platform", "type": "string/="},
+        ],
+        "dashcards": [
+            {
+                "id": 1000 + i,
+                "card_id": 262 + i,
+                "card": {"id": 262 + i, "name": f"Card {262 + i}", "display": "table"},
+                "parameter_mappings": [
+                    {
+                        "parameter_id": slug,
+                        "card_id": 262 + i,
+                        "target": ["variable", ["template-tag", slug]],
+                    }
+                    for slug in ("date_range", "platform")
+                ],
+            }
+            for i in range(DASHCARDS)
+        ],
+    }
+
+
+async def _delay() -> None:
+    if LATENCY_SECONDS:
+        await asyncio.sleep(LATENCY_SECONDS)
+
+
+async def session(request: Request) -> JSONResponse:
+    await _delay()
+    return JSONResponse({"id": "fake-session-token"})
+
+
+async def dataset(request: Request) -> Response:
+    await _delay()
+    body = await request.json()
+    return Response(
+        dataset_body(ROWS, body.get("database", 5)),
+        status_code=202,
+        media_type="application/json",
+    )
+
+
+async def card_query(request: Request) -> Response:
+    await _delay()
+    return Response(dataset_body(ROWS), status_code=202, media_type="application/json")
+
+
+async def databases(request: Request) -> JSONResponse:
+    await _delay()
+    return JSONResponse({"data": [{"id": 5, "name": "Database 5", "engine": "postgres"}]})
+
+
+async def cards(request: Request) -> JSONResponse:
+    await _delay()
+    return JSONResponse([card_summary(card_id) for card_id in range(1, CARDS + 1)])
+
+
+async def tables(request: Request) -> JSONResponse:
+    await _delay()
+    return JSONResponse(
+        [
+            {"id": table_id, "db_id": 5, "updated_at": "2025-09-01T00:00:00Z"}
+            for table_id in range(1, TABLES + 1)
+        ]
+    )
+
+
+async def dashboard_detail(request: Request) -> JSONResponse:
+    await _delay()
+    return JSONResponse(dashboard(int(request.path_params["dashboard_id"])))
+
+
+async def database_metadata(request: Request) -> JSONResponse:
+    await _delay()
+    database_id = int(request.path_params["database_id"])
+    metadata = [table_metadata(table_id, database_id) for table_id in range(1, TABLES + 1)]
+    return JSONResponse({"id": database_id, "name": f"Database {database_id}", "tables": metadata})
+
+
+async def table_query_metadata(request: Request) -> JSONResponse:
+    await _delay()
+    return JSONResponse(table_metadata(int(request.path_params["table_id"])))
+
+
+app = Starlette(
+    routes=[
+        Route("/api/session", session, methods=["POST"]),
+        Route("/api/dataset", dataset, methods=["POST"]),
+        Route("/api/card/{card_id:int}/query", card_query, methods=["POST"]),
+        Route(
+            "/api/dashboard/{dashboard_id:int}/dashcard/{dashcard_id:int}/card/{card_id:int}/query",
+            card_query,
+            methods=["POST"],
+        ),
+        Route("/api/dashboard/{dashboard_id:int}", dashboard_detail),
+        Route("/api/database", databases),
+        Route("/api/database/{database_id:int}/metadata", database_metadata),
+        Route("/api/card", cards),
+        Route("/api/table", tables),
+        Route("/api/table/{table_id:int}/query_metadata", table_query_metadata),
+    ]
+)
+
+
+def main():
+    global LATENCY_SECONDS, ROWS
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3999)
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_SECONDS * 1000)
+    parser.add_argument("--rows", type=int, default=ROWS)
+    args = parser.parse_args()
+
+    LATENCY_SECONDS = args.latency_ms / 1000
+    ROWS = args.rows
+    # Keep idle connections open like a production proxy would (uvicorn's default is 5s)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", timeout_keep_alive=75)
+
+
+if __name__ == "__main__":
+    main()
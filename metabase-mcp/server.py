@@ -6,180 +6,4510 @@ A FastMCP server that provides tools to interact with Metabase databases,
 execute queries, manage cards, and work with collections.
 """
 
+import array
 import asyncio
+import base64
+import contextlib
+import csv
+import datetime
+import decimal
+import functools
+import glob
+import hashlib
+import importlib.util
+import inspect
+import itertools
+import json
 import logging
+import math
+import operator
 import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable, Sequence
 from enum import Enum
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 import httpx
 from dotenv import load_dotenv
 from fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
 
-# Load environment variables
+if TYPE_CHECKING:
+    import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# Retry attempts per HTTP method unless METABASE_RETRY_<METHOD>_ATTEMPTS overrides them
+DEFAULT_RETRY_ATTEMPTS = {"GET": 3}
+# Statuses worth retrying; the 5xx ones also count as Metabase being unavailable
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+OUTAGE_STATUSES = {502, 503, 504}
+
+
+DEFAULT_INSTANCE = "default"
+_INSTANCE_NAME_RE = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+def _parse_bool(value: str | None, default: bool) -> bool:
+    """Interpret an environment flag value"""
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Optional JSON libraries, fastest first; the stdlib json module is the fallback
+JSON_BACKENDS = ("orjson", "msgspec", "json")
+
+
+def select_json_backend(preferred: str = "auto") -> tuple[str, Callable, Callable]:
+    """Return (name, loads, dumps) for the preferred or fastest installed JSON library
+
+    ``loads`` accepts bytes or str; ``dumps`` returns compact UTF-8 bytes, encodes dict
+    keys that are not strings (e.g. database ids) as strings and other unknown values
+    with str().
+    """
+    if preferred not in ("auto", *JSON_BACKENDS):
+        raise ValueError(f"METABASE_JSON_BACKEND must be auto, {', '.join(JSON_BACKENDS)}")
+    for name in JSON_BACKENDS if preferred == "auto" else (preferred,):
+        if name == "orjson":
+            try:
+                import orjson
+            except ImportError:
+                continue
+            option = orjson.OPT_NON_STR_KEYS
+            return name, orjson.loads, lambda v: orjson.dumps(v, default=str, option=option)
+        if name == "msgspec":
+            try:
+                import msgspec
+            except ImportError:
+                continue
+            encoder = msgspec.json.Encoder(enc_hook=str)
+            return name, msgspec.json.Decoder().decode, encoder.encode
+        if name == "json":
+            return (
+                name,
+                json.loads,
+                lambda v: json.dumps(
+                    v, separators=(",", ":"), ensure_ascii=False, default=str
+                ).encode(),
+            )
+    raise ValueError(
+        f"METABASE_JSON_BACKEND={preferred} requires {preferred} (the fast-json extra)"
+    )
+
+
+class Settings:
+    """Server configuration, read from METABASE_* environment variables
+
+    Reading the settings never fails: the connection settings are checked by validate()
+    when the Metabase client is first needed, so importing this module has no
+    requirements on the environment.
+
+    Settings for a named instance (see METABASE_INSTANCES) are read from
+    METABASE_<INSTANCE>_* variables. The URL and credentials must be given per instance;
+    the other connection, retry, cache, catalog and batch settings fall back to their
+    unprefixed METABASE_* value, and the process-wide settings are never per instance.
+    """
+
+    def __init__(self, instance: str | None = None):
+        self.instance = instance or DEFAULT_INSTANCE
+        self._prefix = f"METABASE_{instance.upper()}_" if instance else None
+
+        self.url = self._getenv("URL", inherit=False)
+        self.user_email = self._getenv("USER_EMAIL", inherit=False)
+        self.password = self._getenv("PASSWORD", inherit=False)
+        self.api_key = self._getenv("API_KEY", inherit=False)
+
+        # Named Metabase instances served by this process, e.g. "production,staging"
+        # (default: a single instance configured by the unprefixed variables)
+        self.instances = [
+            name.strip() for name in os.getenv("METABASE_INSTANCES", "").split(",") if name.strip()
+        ]
+        self.default_instance = os.getenv(
+            "METABASE_DEFAULT_INSTANCE", self.instances[0] if self.instances else DEFAULT_INSTANCE
+        )
+
+        # HTTP connection pool configuration
+        self.max_connections = int(self._getenv("MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = int(self._getenv("MAX_KEEPALIVE_CONNECTIONS", "20"))
+        self.keepalive_expiry = float(self._getenv("KEEPALIVE_EXPIRY", "30"))
+        # HTTP/2 defaults to on when the optional h2 package is installed
+        self.http2 = _parse_bool(self._getenv("HTTP2"), importlib.util.find_spec("h2") is not None)
+        self.connect_timeout = float(self._getenv("CONNECT_TIMEOUT", "5"))
+        self.read_timeout = float(self._getenv("READ_TIMEOUT", "60"))
+        self.write_timeout = float(self._getenv("WRITE_TIMEOUT", "30"))
+        self.pool_timeout = float(self._getenv("POOL_TIMEOUT", "10"))
+
+        # Session tokens older than this are refreshed before use (Metabase's default
+        # session lifetime is 14 days, so a daily refresh never lets a token expire under us)
+        self.session_refresh_seconds = float(self._getenv("SESSION_REFRESH_SECONDS", "86400"))
+
+        # Retry policy: attempts per HTTP method (METABASE_RETRY_<METHOD>_ATTEMPTS, default
+        # 3 for GET and 1 otherwise) with exponential backoff and full jitter between attempts
+        self.retry_attempts = {**DEFAULT_RETRY_ATTEMPTS}
+        for prefix in ("METABASE_", self._prefix):
+            if prefix is None:
+                continue
+            pattern = re.compile(rf"^{prefix}RETRY_([A-Z]+)_ATTEMPTS$")
+            for name, value in os.environ.items():
+                if match := pattern.match(name):
+                    self.retry_attempts[match.group(1)] = int(value)
+        self.retry_base_delay = float(self._getenv("RETRY_BASE_DELAY", "0.25"))
+        self.retry_max_delay = float(self._getenv("RETRY_MAX_DELAY", "4"))
+
+        # Circuit breaker: open after this many consecutive failures, probe again after
+        # the timeout
+        self.circuit_failure_threshold = int(self._getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+        self.circuit_reset_timeout = float(self._getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+        # Result cache configuration (a TTL of 0 disables caching)
+        self.cache_ttl = float(self._getenv("CACHE_TTL", "300"))
+        self.cache_max_bytes = int(self._getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+        # Where the result cache, session token and metadata catalog live: "memory" (this
+        # process, with the catalog on disk) or "redis" to share them between replicas
+        self.state_backend = (self._getenv("STATE_BACKEND") or "memory").lower()
+        self.redis_url = self._getenv("REDIS_URL", "redis://localhost:6379/0")
+        self.redis_prefix = self._getenv("REDIS_PREFIX", "metabase-mcp")
+
+        # Batch execution: how many cards/queries of one execute_batch call run at once
+        self.batch_concurrency = int(self._getenv("BATCH_CONCURRENCY", "8"))
+
+        # Schema metadata catalog: on-disk cache location ("none" keeps it in memory only)
+        # and the age after which a database's metadata is refreshed in the background
+        self.catalog_path = self._getenv("CATALOG_PATH", inherit=False)
+        shared_catalog_path = os.getenv("METABASE_CATALOG_PATH")
+        if self.catalog_path is None and shared_catalog_path is not None:
+            # A shared file path gets one file per instance, named after it
+            root, extension = os.path.splitext(shared_catalog_path)
+            named = instance and root.strip().lower() not in ("", "none")
+            self.catalog_path = f"{root}-{instance}{extension}" if named else shared_catalog_path
+        self.catalog_refresh_seconds = float(self._getenv("CATALOG_REFRESH_SECONDS", "3600"))
+
+        # The settings below configure objects shared by every instance (JSON encoding,
+        # metrics, tracing, streams, local tables, named queries, jobs and the response
+        # budget), so they are only read from the unprefixed METABASE_* variables
+
+        # JSON library for Metabase responses, cached results and tool output: "auto"
+        # picks the fastest installed of orjson, msgspec and the stdlib json module
+        self.json_backend = os.getenv("METABASE_JSON_BACKEND", "auto").strip().lower()
+
+        # Tool and HTTP request metrics served at /metrics and by server_stats
+        self.metrics = _parse_bool(os.getenv("METABASE_METRICS"), True)
+        # Tool response sizes are measured by re-encoding the result, so only one call in
+        # this many per tool is measured (1 measures every call, 0 none)
+        self.metrics_size_sample = int(os.getenv("METABASE_METRICS_SIZE_SAMPLE", "10"))
+        # Optional OpenTelemetry tracing: "otlp" (configured by the standard
+        # OTEL_EXPORTER_OTLP_* variables) or "file" (JSON spans appended to
+        # METABASE_TRACE_FILE); unset disables it
+        self.tracing = os.getenv("METABASE_TRACING", "").lower()
+        self.trace_file = os.getenv("METABASE_TRACE_FILE", "metabase-mcp-traces.jsonl")
+
+        # Streaming query cursors: how many may be open at once and how long an idle one
+        # is kept
+        self.stream_max_open = int(os.getenv("METABASE_STREAM_MAX_OPEN", "8"))
+        self.stream_idle_timeout = float(os.getenv("METABASE_STREAM_IDLE_TIMEOUT", "300"))
+
+        # Local DuckDB tables (query_local): memory limit, e.g. "2GB" (default: DuckDB's own)
+        self.local_memory_limit = os.getenv("METABASE_LOCAL_MEMORY_LIMIT")
+
+        # Report SQL files served as named queries by execute_named_query ("none" disables)
+        self.reports_dir = os.getenv("METABASE_REPORTS_DIR", REPORTS_DIR)
+
+        # Background query jobs: per-job timeout, how many may run at once, and how many
+        # finished jobs are kept and for how long
+        self.job_timeout = float(os.getenv("METABASE_JOB_TIMEOUT", "1800"))
+        self.job_max_running = int(os.getenv("METABASE_JOB_MAX_RUNNING", "8"))
+        self.job_max_finished = int(os.getenv("METABASE_JOB_MAX_FINISHED", "32"))
+        self.job_result_ttl = float(os.getenv("METABASE_JOB_RESULT_TTL", "3600"))
+
+        # Response budget: larger tool results are cut down to this many bytes of JSON
+        # (0 disables it). METABASE_RESPONSE_MAX_TOKENS sets it in tokens instead.
+        self.response_max_bytes = int(os.getenv("METABASE_RESPONSE_MAX_BYTES", "100000"))
+        if max_tokens := os.getenv("METABASE_RESPONSE_MAX_TOKENS"):
+            self.response_max_bytes = int(max_tokens) * BYTES_PER_TOKEN
+
+    def _getenv(self, name: str, default: str | None = None, inherit: bool = True) -> str | None:
+        """METABASE_<INSTANCE>_<name> for a named instance, else (or if inherited) METABASE_<name>"""
+        if self._prefix is not None:
+            value = os.getenv(self._prefix + name)
+            if value is not None or not inherit:
+                return default if value is None else value
+        return os.getenv(f"METABASE_{name}", default)
+
+    def for_instance(self, name: str) -> "Settings":
+        """Settings of one configured Metabase instance"""
+        if not self.instances:
+            if name != DEFAULT_INSTANCE:
+                raise ValueError(
+                    f"Unknown Metabase instance '{name}'; only '{DEFAULT_INSTANCE}' is "
+                    "configured (see METABASE_INSTANCES)"
+                )
+            return self
+        if name not in self.instances:
+            raise ValueError(
+                f"Unknown Metabase instance '{name}'; configured: {', '.join(self.instances)}"
+            )
+        if not _INSTANCE_NAME_RE.match(name):
+            raise ValueError(
+                f"Invalid Metabase instance name '{name}': use letters, digits and underscores"
+            )
+        return Settings(name)
+
+    def validate(self) -> None:
+        """Raise ValueError unless a Metabase URL and credentials are configured"""
+        if not self.url or (not self.api_key and (not self.user_email or not self.password)):
+            prefix = self._prefix or "METABASE_"
+            raise ValueError(
+                f"{prefix}URL is required, and either {prefix}API_KEY or both "
+                f"{prefix}USER_EMAIL and {prefix}PASSWORD must be provided"
+            )
+
+
+# Histogram buckets for latencies (seconds) and response sizes (bytes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+SIZE_BUCKETS = tuple(1024 * 4**i for i in range(9))  # 1 KiB to 64 MiB
+
+# Largest page a result stream or finished job may return at once
+MAX_STREAM_PAGE_SIZE = 10000
+MAX_JOB_PAGE_SIZE = 10000
+
+# Metadata requests in flight at once while a catalog refresh fetches changed tables
+CATALOG_FETCH_CONCURRENCY = 8
+# Card fields kept in the catalog; /card returns full query results metadata per card
+CARD_SUMMARY_KEYS = (
+    "id",
+    "name",
+    "description",
+    "collection_id",
+    "database_id",
+    "display",
+    "archived",
+    "updated_at",
+)
+
+# Keys of a catalog card summary: the /card fields above plus derived ones
+CARD_SUMMARY_FIELDS = (*CARD_SUMMARY_KEYS, "collection_name", "query_type", "native_query")
+
+# Row filter operators accepted by the post-processing parameters of the query tools
+FILTER_OPERATORS = (
+    "=",
+    "!=",
+    ">",
+    ">=",
+    "<",
+    "<=",
+    "in",
+    "not in",
+    "contains",
+    "is null",
+    "not null",
+)
+
+# Metabase base types summed by group_by and compared numerically by filters
+NUMERIC_BASE_TYPES = {
+    "type/BigInteger",
+    "type/Decimal",
+    "type/Float",
+    "type/Integer",
+    "type/Number",
+}
+
+# Output formats accepted by execute_query/execute_card
+OUTPUT_FORMATS = ("rows", "columnar", "arrow", "parquet")
+# Column metadata kept by compact formats; Metabase sends a dozen more keys per column
+COLUMN_METADATA_KEYS = ("name", "display_name", "base_type", "semantic_type")
+
+# Rough size of a token in JSON tool output, used to turn METABASE_RESPONSE_MAX_TOKENS
+# into a byte budget
+BYTES_PER_TOKEN = 4
+# Result keys kept when a query result is cut down to the response budget
+BUDGET_RESULT_KEYS = ("status", "database_id", "started_at", "running_time", "transform")
+QUERY_PAGING_HINT = (
+    "Narrow the result with columns, filters, group_by, sort_by and limit, or read every "
+    "row with submit_query and get_job_result (or stream_query)"
+)
+JOB_PAGING_HINT = "Request the remaining rows with next_offset as offset"
+LIST_PAGING_HINT = "Pass next_cursor as cursor for the next page, or request fewer fields"
+LOCAL_PAGING_HINT = "Aggregate in the SQL, or select fewer columns or rows with LIMIT/OFFSET"
+
+# Listings (list_cards, list_collections): keys returned per item unless `fields` is
+# given, and the largest page
+CARD_LIST_FIELDS = ("id", "name", "collection_id", "collection_name", "database_id", "updated_at")
+COLLECTION_LIST_FIELDS = ("id", "name", "description", "location")
+MAX_LIST_PAGE_SIZE = 1000
+
+# Report SQL files served by execute_named_query (reports/ at the repository root), and
+# the suffix of a report's parameterized copy, served instead of the report itself
+REPORTS_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "reports")
+)
+METABASE_REPORT_SUFFIX = ".metabase.sql"
+
+# Load environment variables (without overriding ones already set)
 load_dotenv()
+settings = Settings()
+try:
+    json_backend, json_loads, json_dumps = select_json_backend(settings.json_backend)
+except ValueError as e:
+    logger.warning(f"{e}; using the fastest installed JSON library")
+    json_backend, json_loads, json_dumps = select_json_backend()
+
+
+# Authentication method enum
+class AuthMethod(Enum):
+    SESSION = "session"
+    API_KEY = "api_key"
+
+
+def serialize_tool_result(value: Any) -> str:
+    """Compact JSON for tool results (FastMCP's default serializer indents them)"""
+    return json_dumps(value).decode()
+
+
+# Initialize FastMCP server
+mcp = FastMCP(name="metabase-mcp", tool_serializer=serialize_tool_result)
+
+# Matches string literals (kept verbatim), comments and whitespace runs (collapsed)
+_SQL_NORMALIZE_RE = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(?:--[^\n]*|/\*.*?\*/|\s+)+", re.DOTALL
+)
+
+# POST endpoints that run queries, safe to coalesce like GETs (/dataset only for
+# read-only SQL)
+_QUERY_PATH_RE = re.compile(
+    r"^/(?:dataset|card/\d+/query|dashboard/\d+/dashcard/\d+/card/\d+/query)$"
+)
+
+_READ_ONLY_KEYWORDS = {"select", "with", "show", "explain", "describe", "values", "table"}
+
+
+def normalize_sql(query: str) -> str:
+    """Normalize SQL text for use in cache keys
+
+    Comments are dropped and whitespace runs outside string literals are collapsed,
+    so reformatting a query does not produce a distinct cache entry.
+    """
+    normalized = _SQL_NORMALIZE_RE.sub(
+        lambda m: m.group(0) if m.group(0)[0] in "'\"" else " ", query
+    )
+    return normalized.strip().rstrip(";").strip()
+
+
+def is_read_only_sql(query: str) -> bool:
+    """Best-effort check that a native query only reads data"""
+    normalized = normalize_sql(query).lstrip("(")
+    keyword = normalized.split(" ", 1)[0].lower() if normalized else ""
+    return keyword in _READ_ONLY_KEYWORDS
+
+
+class Model:
+    """Base of the slotted metadata models
+
+    Keys the server reads are typed attributes; anything else Metabase sends is kept in
+    `extra`, so to_dict() returns the payload the model was built from, less its null
+    attributes. get() reads either, like dict.get.
+    """
+
+    __slots__ = ("extra",)
+    KEYS: tuple[str, ...] = ()
+
+    def __init__(self, **values: Any):
+        for key in self.KEYS:
+            setattr(self, key, values.pop(key, None))
+        self.extra = values or None
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Model":
+        return cls(**data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self.KEYS:
+            return getattr(self, key)
+        return self.extra.get(key, default) if self.extra else default
+
+    def to_dict(self) -> dict[str, Any]:
+        values = {key: getattr(self, key) for key in self.KEYS}
+        values = {key: value for key, value in values.items() if value is not None}
+        return {**values, **(self.extra or {})}
+
+
+class Field(Model):
+    """A table field, or a column of a query result"""
+
+    KEYS = ("id", "table_id", "name", "display_name", "base_type", "semantic_type", "description")
+    __slots__ = KEYS
+
+    def slim(self) -> dict[str, Any]:
+        """The column metadata kept by compact formats"""
+        return {key: self.get(key) for key in COLUMN_METADATA_KEYS if self.get(key) is not None}
+
+
+class Table(Model):
+    """A table's metadata as kept in the catalog, with its fields"""
+
+    KEYS = (
+        "id",
+        "db_id",
+        "schema",
+        "name",
+        "display_name",
+        "description",
+        "entity_type",
+        "updated_at",
+        "fields",
+    )
+    __slots__ = KEYS
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Table":
+        table = cls(**data)
+        table.fields = [Field.from_dict(field) for field in table.fields or []]
+        return table
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**super().to_dict(), "fields": [field.to_dict() for field in self.fields]}
+
+
+class Card(Model):
+    """Summary of a saved card as kept in the catalog"""
+
+    KEYS = CARD_SUMMARY_FIELDS
+    __slots__ = KEYS
+
+    @classmethod
+    def from_api(cls, card: dict[str, Any]) -> "Card":
+        """Reduce a /card entry to the summary fields, native SQL included"""
+        dataset_query = card.get("dataset_query") or {}
+        return cls(
+            **{key: card.get(key) for key in CARD_SUMMARY_KEYS},
+            collection_name=(card.get("collection") or {}).get("name"),
+            query_type=dataset_query.get("type"),
+            native_query=(dataset_query.get("native") or {}).get("query"),
+        )
+
+
+class QueryResult:
+    """A Metabase query result stored column by column
+
+    Columns of ints or floats without nulls are packed into arrays and other columns
+    are lists, so a cached result takes a fraction of the memory of Metabase's
+    row-of-lists JSON and post-processing needs no transpose. The rest of the response
+    (status, database_id, running_time, error, ...) is kept as-is in `envelope`, and
+    to_dict() rebuilds the Metabase response for the "rows" output format. Results are
+    shared through the cache and must be treated as read-only.
+    """
+
+    __slots__ = ("columns", "values", "envelope", "data_extra")
+
+    def __init__(
+        self,
+        columns: list[Field],
+        values: list[Sequence[Any]],
+        envelope: dict[str, Any],
+        data_extra: dict[str, Any] | None = None,
+    ):
+        self.columns = columns
+        self.values = values
+        self.envelope = envelope
+        # Keys of the response's "data" besides cols and rows; None when it had no data
+        self.data_extra = data_extra
+
+    @classmethod
+    def from_response(cls, response: dict[str, Any]) -> "QueryResult":
+        envelope = {key: value for key, value in response.items() if key != "data"}
+        data = response.get("data")
+        if not isinstance(data, dict):
+            return cls([], [], envelope)
+        cols = data.get("cols", [])
+        rows = data.get("rows", [])
+        values = [_pack_column(list(column)) for column in zip(*rows)]
+        return cls(
+            [Field.from_dict(col) for col in cols],
+            values if rows else [[] for _ in cols],
+            envelope,
+            {key: value for key, value in data.items() if key not in ("cols", "rows")},
+        )
+
+    @property
+    def status(self) -> str:
+        return self.envelope.get("status", "completed")
+
+    @property
+    def error(self) -> Any:
+        return self.envelope.get("error")
+
+    @property
+    def has_data(self) -> bool:
+        return self.data_extra is not None
+
+    @property
+    def names(self) -> list[str]:
+        return [column.name for column in self.columns]
+
+    @property
+    def row_count(self) -> int:
+        return len(self.values[0]) if self.values else 0
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the values, for the cache's byte budget"""
+        size = 0
+        for column in self.values:
+            if isinstance(column, array.array):
+                size += column.itemsize * len(column)
+            else:
+                size += 8 * len(column) + sum(
+                    49 + len(value) if isinstance(value, str) else 24
+                    for value in column
+                    if value is not None
+                )
+        return size + len(json_dumps(self.envelope))
+
+    def rows(self, start: int = 0, stop: int | None = None) -> list[list[Any]]:
+        return [list(row) for row in zip(*(column[start:stop] for column in self.values))]
+
+    def slice(self, start: int, stop: int | None = None) -> "QueryResult":
+        """The result with only rows start to stop"""
+        values = [column[start:stop] for column in self.values]
+        return QueryResult(self.columns, values, self.envelope, self.data_extra)
+
+    def to_dict(self) -> dict[str, Any]:
+        response = dict(self.envelope)
+        if self.has_data:
+            response["data"] = {
+                **self.data_extra,
+                "cols": [column.to_dict() for column in self.columns],
+                "rows": self.rows(),
+            }
+        return response
+
+
+def _pack_column(values: list[Any]) -> Sequence[Any]:
+    """Store a column of only ints or only floats as an array, anything else as a list"""
+    if values and type(values[0]) in (int, float):
+        kind = type(values[0])
+        if all(type(value) is kind for value in values):
+            with contextlib.suppress(OverflowError):
+                return array.array("q" if kind is int else "d", values)
+    return values
+
+
+class ResultCache:
+    """Byte-bounded LRU cache with a TTL for Metabase query results
+
+    Entries are tagged with the database they were read from so that they can be
+    invalidated after a warehouse refresh (e.g. scripts/refresh_ad_data.sql).
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # key -> (expires_at, size_bytes, database_id, value)
+        self._entries: OrderedDict[tuple, tuple[float, int, int | None, Any]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    async def get(self, key: tuple) -> Any | None:
+        """Return a cached value, or None on a miss or expired entry"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, size, _, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    async def set(self, key: tuple, value: Any, database_id: int | None = None) -> None:
+        """Store a value, evicting least recently used entries to stay under max_bytes"""
+        if not self.enabled:
+            return
+
+        size = value.nbytes if isinstance(value, QueryResult) else len(json_dumps(value))
+        if size > self.max_bytes:
+            logger.debug(f"Result of {size} bytes exceeds cache capacity, not caching")
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        while self._entries and self._bytes + size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+        self._entries[key] = (time.monotonic() + self.ttl, size, database_id, value)
+        self._bytes += size
+
+    async def invalidate(self, database_id: int | None = None, card_id: int | None = None) -> int:
+        """Drop matching entries (all entries when no filter is given) and return the count"""
+        if database_id is None and card_id is None:
+            keys = list(self._entries)
+        else:
+            keys = [
+                key
+                for key, (_, _, entry_database_id, _) in self._entries.items()
+                if (database_id is not None and entry_database_id == database_id)
+                or (card_id is not None and key[0] == "card" and key[1] == card_id)
+            ]
+
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def stats(self) -> dict[str, Any]:
+        """Return cache occupancy and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": "memory",
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _remove(self, key: tuple) -> None:
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+class RedisState:
+    """Connection to a Redis (or Redis-compatible) server holding state shared by replicas
+
+    Keys are namespaced by the Metabase URL, so every replica serving the same instance
+    shares its cached results, session token and metadata catalog. Needs the optional
+    ``redis`` package (the ``redis`` extra).
+    """
+
+    def __init__(self, url: str, namespace: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise ValueError(
+                "METABASE_STATE_BACKEND=redis needs the redis package (the redis extra)"
+            ) from e
+        self.url = url
+        self.namespace = namespace
+        self.redis = redis.Redis.from_url(url)
+        # Failures of the shared state degrade to local behaviour instead of failing calls
+        self.errors: tuple[type[Exception], ...] = (redis.RedisError, OSError)
+        self.error_count = 0
+
+    def key(self, *parts: Any) -> str:
+        return ":".join([self.namespace, *(str(part) for part in parts)])
+
+    def failed(self, action: str, error: Exception) -> None:
+        self.error_count += 1
+        logger.warning(f"Shared state unavailable while {action}: {error}")
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+def create_state(config: Settings, base_url: str) -> RedisState | None:
+    """Connect to the configured shared-state backend, or None for process-local state"""
+    if config.state_backend == "memory":
+        return None
+    if config.state_backend != "redis":
+        raise ValueError("METABASE_STATE_BACKEND must be 'memory' or 'redis'")
+    digest = hashlib.sha1(base_url.encode()).hexdigest()[:12]
+    return RedisState(config.redis_url, f"{config.redis_prefix}:{digest}")
+
+
+class RedisResultCache:
+    """ResultCache counterpart that keeps results in Redis, shared by every replica
+
+    Entries expire after the TTL and Redis' own eviction policy bounds the total size;
+    max_bytes only caps a single result. Keys are indexed by database and card so an
+    invalidation on one replica drops the entries written by all of them. Counters are
+    per replica; cached values are decoded per lookup and are the caller's own.
+    """
+
+    def __init__(self, state: RedisState, ttl: float, max_bytes: int):
+        self.state = state
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    async def get(self, key: tuple) -> Any | None:
+        """Return a cached value, or None on a miss"""
+        try:
+            payload = await self.state.redis.get(self._entry_key(key))
+        except self.state.errors as e:
+            self.state.failed("reading the result cache", e)
+            payload = None
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return QueryResult.from_response(json_loads(payload))
+
+    async def set(self, key: tuple, value: Any, database_id: int | None = None) -> None:
+        """Store a value with the cache TTL, indexed for invalidation"""
+        if not self.enabled:
+            return
+
+        payload = json_dumps(value.to_dict())
+        if len(payload) > self.max_bytes:
+            logger.debug(f"Result of {len(payload)} bytes exceeds cache capacity, not caching")
+            return
+
+        entry_key = self._entry_key(key)
+        ttl_ms = max(1, int(self.ttl * 1000))
+        try:
+            async with self.state.redis.pipeline(transaction=False) as pipe:
+                pipe.set(entry_key, payload, px=ttl_ms)
+                for index in self._index_keys(key, database_id):
+                    pipe.sadd(index, entry_key)
+                    pipe.pexpire(index, ttl_ms)
+                await pipe.execute()
+        except self.state.errors as e:
+            self.state.failed("writing the result cache", e)
+
+    async def invalidate(self, database_id: int | None = None, card_id: int | None = None) -> int:
+        """Drop matching entries (all entries when no filter is given) and return the count
+
+        Invalidation follows writes that already succeeded, so a Redis failure is logged
+        and counted rather than raised; the stale entries then expire with their TTL.
+        """
+        if database_id is None and card_id is None:
+            indexes = [self.state.key("cache", "all")]
+        else:
+            indexes = []
+            if database_id is not None:
+                indexes.append(self.state.key("cache", "database", database_id))
+            if card_id is not None:
+                indexes.append(self.state.key("cache", "card", card_id))
+
+        try:
+            entry_keys = set()
+            for index in indexes:
+                entry_keys |= await self.state.redis.smembers(index)
+            if not entry_keys:
+                return 0
+            dropped = await self.state.redis.delete(*entry_keys)
+            await self.state.redis.delete(*indexes)
+            return dropped
+        except self.state.errors as e:
+            self.state.failed("invalidating the result cache", e)
+            return 0
+
+    def stats(self) -> dict[str, Any]:
+        """Return this replica's hit/miss counters (occupancy is tracked by Redis)"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": "redis",
+            "entries": None,
+            "bytes": None,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "errors": self.state.error_count,
+        }
+
+    def _entry_key(self, key: tuple) -> str:
+        digest = hashlib.sha1(json.dumps(key, default=str).encode()).hexdigest()
+        return self.state.key("cache", "entry", digest)
+
+    def _index_keys(self, key: tuple, database_id: int | None) -> list[str]:
+        indexes = [self.state.key("cache", "all")]
+        if database_id is not None:
+            indexes.append(self.state.key("cache", "database", database_id))
+        if key[0] == "card":
+            indexes.append(self.state.key("cache", "card", key[1]))
+        return indexes
+
+
+_ENDPOINT_ID_RE = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_template(path: str) -> str:
+    """Collapse ids in an API path so metrics have one series per endpoint"""
+    return _ENDPOINT_ID_RE.sub("/{id}", path)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-quantile (the largest bucket if beyond)"""
+        if not self.count:
+            return None
+        for bound, cumulative in zip(self.buckets, self.counts):
+            if cumulative >= q * self.count:
+                return bound
+        return self.buckets[-1]
+
+
+class Metrics:
+    """In-process counters, gauges and histograms with Prometheus text exposition
+
+    Series are keyed by metric name and a sorted tuple of label pairs.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.counters: dict[str, dict[tuple, float]] = {}
+        self.gauges: dict[str, dict[tuple, float]] = {}
+        self.histograms: dict[str, dict[tuple, Histogram]] = {}
+
+    def inc(self, name: str, labels: dict[str, Any], value: float = 1) -> None:
+        if not self.enabled:
+            return
+        series = self.counters.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def add(self, name: str, labels: dict[str, Any], value: float) -> None:
+        """Move a gauge up or down"""
+        if not self.enabled:
+            return
+        series = self.gauges.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(
+        self, name: str, labels: dict[str, Any], value: float, buckets=LATENCY_BUCKETS
+    ) -> None:
+        if not self.enabled:
+            return
+        series = self.histograms.setdefault(name, {})
+        key = self._key(labels)
+        if key not in series:
+            series[key] = Histogram(buckets)
+        series[key].observe(value)
+
+    def render(
+        self,
+        counters: dict[str, dict[tuple, float]] | None = None,
+        gauges: dict[str, dict[tuple, float]] | None = None,
+    ) -> str:
+        """Prometheus text format, plus series of totals and gauges sampled by the caller"""
+        lines = []
+        for name, series in {**(counters or {}), **self.counters}.items():
+            lines.append(f"# TYPE {name} counter")
+            lines += [f"{name}{self._labels(key)} {value:g}" for key, value in series.items()]
+        for name, series in {**self.gauges, **(gauges or {})}.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines += [f"{name}{self._labels(key)} {value:g}" for key, value in series.items()]
+        for name, series in self.histograms.items():
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in series.items():
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    labels = self._labels(key + (("le", f"{bound:g}"),))
+                    lines.append(f"{name}_bucket{labels} {count}")
+                inf_labels = self._labels(key + (("le", "+Inf"),))
+                lines.append(f"{name}_bucket{inf_labels} {histogram.count}")
+                lines.append(f"{name}_sum{self._labels(key)} {histogram.sum:g}")
+                lines.append(f"{name}_count{self._labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, histogram_name: str, label: str) -> dict[str, dict[str, Any]]:
+        """Count, mean and approximate p50/p99 per value of one label of a latency histogram"""
+        summary = {}
+        for key, histogram in self.histograms.get(histogram_name, {}).items():
+            p50, p99 = histogram.quantile(0.5), histogram.quantile(0.99)
+            summary[dict(key).get(label, "")] = {
+                "count": histogram.count,
+                "mean_ms": round(histogram.sum / histogram.count * 1000, 1),
+                "p50_ms_upper_bound": p50 * 1000 if p50 is not None else None,
+                "p99_ms_upper_bound": p99 * 1000 if p99 is not None else None,
+            }
+        return summary
+
+    @staticmethod
+    def _key(labels: dict[str, Any]) -> tuple:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    @staticmethod
+    def _labels(key: tuple) -> str:
+        if not key:
+            return ""
+        escaped = (
+            (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for name, value in key
+        )
+        return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+metrics = Metrics(enabled=settings.metrics)
+
+
+def setup_tracing(exporter: str):
+    """Return a (provider, tracer) pair for the configured exporter, or (None, None)"""
+    if not exporter:
+        return None, None
+    if exporter not in ("otlp", "file"):
+        raise ValueError("METABASE_TRACING must be 'otlp' or 'file'")
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+        if exporter == "otlp":
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        logger.warning(
+            f"METABASE_TRACING={exporter} needs opentelemetry-sdk"
+            + (" and opentelemetry-exporter-otlp-proto-http" if exporter == "otlp" else "")
+            + "; tracing is disabled"
+        )
+        return None, None
+
+    class FileSpanExporter(ConsoleSpanExporter):
+        """JSON lines of spans in the trace file, closed when the provider shuts down"""
+
+        def shutdown(self) -> None:
+            super().shutdown()
+            self.out.close()
+
+    if exporter == "otlp":
+        span_exporter = OTLPSpanExporter()
+    else:
+        span_exporter = FileSpanExporter(
+            out=open(settings.trace_file, "a"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    provider = TracerProvider(resource=Resource.create({"service.name": "metabase-mcp"}))
+    provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    logger.info(f"Exporting traces with the {exporter} exporter")
+    return provider, provider.get_tracer("metabase-mcp")
+
+
+tracer_provider, tracer = setup_tracing(settings.tracing)
+
+
+@contextlib.contextmanager
+def trace_span(name: str, **attributes: Any):
+    """Start a child span of the current span; yields None when tracing is off"""
+    if tracer is None:
+        yield None
+        return
+    attributes = {key: value for key, value in attributes.items() if value is not None}
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        yield span
+
+
+def annotate_span(attributes: dict[str, Any]) -> None:
+    """Add attributes to the current span"""
+    if tracer is not None:
+        from opentelemetry import trace
+
+        trace.get_current_span().set_attributes(attributes)
+
+
+def traced(name: str, *arguments: str):
+    """Run an async function in a span carrying the named arguments and its result's row count"""
+
+    def decorate(fn):
+        if tracer is None:
+            return fn
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs).arguments
+            attributes = {f"metabase.{arg}": bound.get(arg) for arg in arguments}
+            with trace_span(name, **attributes) as span:
+                result = await fn(*args, **kwargs)
+                _trace_result(span, result)
+                return result
+
+        return wrapper
+
+    return decorate
+
+
+def _trace_result(span, result: Any) -> None:
+    """Record the row count of a query result on a span"""
+    if span is not None and isinstance(result, QueryResult):
+        span.set_attribute("metabase.row_count", result.row_count)
+    elif span is not None and isinstance(result, dict):
+        rows = result.get("data", {}).get("rows") if isinstance(result.get("data"), dict) else None
+        if rows is not None:
+            span.set_attribute("metabase.row_count", len(rows))
+        elif isinstance(result.get("row_count"), int):
+            span.set_attribute("metabase.row_count", result["row_count"])
+
+
+# Tool arguments recorded on tool spans
+TRACED_ARGUMENTS = ("card_id", "database_id", "dashboard_id", "table_id", "job_id", "cursor")
+
+
+def instrumented(fn):
+    """Record metrics and a root trace span for each call of a tool
+
+    Metrics are call counts, errors, latency, in-flight calls and the response size of
+    a sample of the calls.
+    """
+    if not metrics.enabled and tracer is None:
+        return fn
+    tool = fn.__name__
+    completed = itertools.count()
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        labels = {"tool": tool}
+        metrics.add("metabase_mcp_tool_in_flight", labels, 1)
+        started = time.perf_counter()
+        outcome = "error"
+        attributes = {f"metabase.{key}": kwargs.get(key) for key in TRACED_ARGUMENTS}
+        try:
+            with trace_span(f"tool {tool}", **{"mcp.tool": tool}, **attributes) as span:
+                result = await fn(*args, **kwargs)
+                _trace_result(span, result)
+            outcome = "ok"
+            sample = settings.metrics_size_sample
+            if metrics.enabled and sample > 0 and next(completed) % sample == 0:
+                size = _json_size(result)
+                metrics.observe("metabase_mcp_tool_response_bytes", labels, size, SIZE_BUCKETS)
+            return result
+        finally:
+            metrics.add("metabase_mcp_tool_in_flight", labels, -1)
+            metrics.observe(
+                "metabase_mcp_tool_duration_seconds", labels, time.perf_counter() - started
+            )
+            metrics.inc("metabase_mcp_tool_calls_total", {**labels, "outcome": outcome})
+
+    return wrapper
+
+
+def create_http_client(config: Settings | None = None) -> httpx.AsyncClient:
+    """Create the pooled HTTP client used for Metabase API calls
+
+    Connections are kept alive up to the pool size so bursts of concurrent tool calls
+    reuse sockets instead of reconnecting. HTTP/2 requires the optional ``h2`` package
+    (``pip install "httpx[http2]"``).
+    """
+    config = config or settings
+    http2 = config.http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("METABASE_HTTP2 is enabled but the h2 package is missing, using HTTP/1.1")
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            connect=config.connect_timeout,
+            read=config.read_timeout,
+            write=config.write_timeout,
+            pool=config.pool_timeout,
+        ),
+    )
+
+
+class CircuitOpenError(Exception):
+    """Raised without contacting Metabase while the circuit breaker is open"""
+
+
+class RetryPolicy:
+    """Number of attempts and jittered exponential backoff for one HTTP method"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def for_method(cls, method: str, config: Settings) -> "RetryPolicy":
+        attempts = config.retry_attempts.get(method.upper(), 1)
+        return cls(attempts, config.retry_base_delay, config.retry_max_delay)
+
+    def delay(self, attempt: int, retry_after: str | None = None) -> float:
+        """Seconds to wait before the next attempt, honouring a numeric Retry-After"""
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def _is_query_request(method: str, path: str) -> bool:
+    """Whether a request runs a query, which may legitimately take longer than a timeout"""
+    return method.upper() == "POST" and (path == "/dataset/csv" or bool(_QUERY_PATH_RE.match(path)))
+
+
+class CircuitBreaker:
+    """Fail fast while Metabase is unavailable
+
+    Opens after `failure_threshold` consecutive failures. Once `reset_timeout` has
+    passed a single probe request is let through (half-open): success closes the
+    circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probing = False
+        self._probe_started = 0.0
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a request may be sent now"""
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        # A probe that never reported back (e.g. cancelled) must not block the circuit
+        now = time.monotonic()
+        if self.state == self.HALF_OPEN and (
+            not self._probing or now - self._probe_started >= self.reset_timeout
+        ):
+            self._probing = True
+            self._probe_started = now
+            return
+
+        self.rejected += 1
+        retry_in = max(0.0, self.reset_timeout - (now - self.opened_at))
+        raise CircuitOpenError(
+            f"Metabase appears to be unavailable, not sending requests for another {retry_in:.0f}s"
+        )
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("Metabase reachable again, closing circuit breaker")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_error(self, error: httpx.TransportError, method: str, path: str) -> None:
+        """Count a transport error as a failure only if it points to an outage
+
+        Connection, network and timeout errors do. A read timeout on a query only means
+        that query is slow, and a pool timeout that this process is busy: those neither
+        count nor reset the count, and free a half-open probe.
+        """
+        slow_query = isinstance(error, httpx.ReadTimeout) and _is_query_request(method, path)
+        if (
+            isinstance(error, (httpx.NetworkError, httpx.TimeoutException))
+            and not isinstance(error, httpx.PoolTimeout)
+            and not slow_query
+        ):
+            self.record_failure()
+        else:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or (
+            self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+        ):
+            logger.warning(
+                f"Opening circuit breaker after {self.consecutive_failures} consecutive failures"
+            )
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected_requests": self.rejected,
+        }
+
+
+class SessionManager:
+    """Metabase session token for email/password authentication
+
+    Logins are serialized by a lock so concurrent first calls share a single
+    /api/session request, and tokens are refreshed once they are older than
+    `refresh_seconds` (METABASE_SESSION_REFRESH_SECONDS). With shared state the token
+    is published for the other replicas, which adopt it instead of logging in again.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        base_url: str,
+        email: str,
+        password: str,
+        refresh_seconds: float,
+        state: RedisState | None = None,
+    ):
+        self.client = client
+        self.base_url = base_url
+        self.email = email
+        self.password = password
+        self.refresh_seconds = refresh_seconds
+        self.state = state
+        self.token: str | None = None
+        self.obtained_at = 0.0
+        self.logins = 0
+        self._lock = asyncio.Lock()
+        # The last token Metabase rejected, so a stale shared copy is not adopted again
+        self._rejected: str | None = None
+
+    def _is_fresh(self) -> bool:
+        return self.token is not None and time.monotonic() - self.obtained_at < self.refresh_seconds
+
+    async def get_token(self) -> str:
+        """Return a valid session token, logging in if there is none or it is due a refresh"""
+        if self._is_fresh():
+            return self.token
+
+        async with self._lock:
+            # Another caller may have logged in while we waited for the lock
+            if self._is_fresh():
+                return self.token
+            if self.state is not None and await self._adopt_shared_token():
+                return self.token
+            return await self._login()
+
+    def invalidate(self, token: str) -> None:
+        """Discard a token the server rejected, unless it was already replaced"""
+        self._rejected = token
+        if self.token == token:
+            self.token = None
+
+    def _state_key(self) -> str:
+        return self.state.key("session", hashlib.sha1(self.email.encode()).hexdigest()[:12])
+
+    async def _adopt_shared_token(self) -> bool:
+        """Use a fresh token another replica logged in with, if there is one"""
+        try:
+            payload = await self.state.redis.get(self._state_key())
+        except self.state.errors as e:
+            self.state.failed("reading the shared session token", e)
+            return False
+        if payload is None:
+            return False
+        shared = json.loads(payload)
+        age = time.time() - shared["obtained_at"]
+        if shared["token"] == self._rejected or age >= self.refresh_seconds:
+            return False
+        self.token = shared["token"]
+        self.obtained_at = time.monotonic() - age
+        logger.info("Using the session token shared by another replica")
+        return True
+
+    async def _share_token(self) -> None:
+        payload = json.dumps({"token": self.token, "obtained_at": time.time()})
+        try:
+            await self.state.redis.set(
+                self._state_key(), payload, px=max(1, int(self.refresh_seconds * 1000))
+            )
+        except self.state.errors as e:
+            self.state.failed("sharing the session token", e)
+
+    async def _login(self) -> str:
+        login_data = {"username": self.email, "password": self.password}
+        with trace_span("metabase.login"):
+            response = await self.client.post(f"{self.base_url}/api/session", json=login_data)
+
+        if response.status_code != 200:
+            error_data = response.json() if response.content else {}
+            raise Exception(f"Authentication failed: {response.status_code} - {error_data}")
+
+        self.token = response.json().get("id")
+        self.obtained_at = time.monotonic()
+        self.logins += 1
+        logger.info("Successfully obtained session token")
+        if self.state is not None:
+            await self._share_token()
+        return self.token
+
+
+class MetabaseClient:
+    """HTTP client for Metabase API operations"""
+
+    def __init__(self, config: Settings | None = None):
+        self.settings = config = config or settings
+        config.validate()
+        self.instance = config.instance
+        self.base_url = config.url.rstrip("/")
+        self.api_key: str | None = config.api_key
+        self.auth_method = AuthMethod.API_KEY if config.api_key else AuthMethod.SESSION
+        self.client = create_http_client(config)
+        self.state = create_state(config, self.base_url)
+        self.session: SessionManager | None = None
+        if self.auth_method == AuthMethod.SESSION:
+            self.session = SessionManager(
+                self.client,
+                self.base_url,
+                config.user_email,
+                config.password,
+                config.session_refresh_seconds,
+                state=self.state,
+            )
+        self.cache: ResultCache | RedisResultCache
+        if self.state is not None:
+            self.cache = RedisResultCache(self.state, config.cache_ttl, config.cache_max_bytes)
+        else:
+            self.cache = ResultCache(ttl=config.cache_ttl, max_bytes=config.cache_max_bytes)
+        # Identical in-flight requests share one task (single-flight)
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        self._inflight_waiters: dict[tuple, int] = {}
+        self.coalesced_requests = 0
+        self.breaker = CircuitBreaker(
+            failure_threshold=config.circuit_failure_threshold,
+            reset_timeout=config.circuit_reset_timeout,
+        )
+        self.retries = 0
+        catalog_store: SqliteCatalogStore | RedisCatalogStore | None = None
+        if self.state is not None:
+            catalog_store = RedisCatalogStore(self.state)
+        elif path := _catalog_path(self.base_url, config.catalog_path):
+            catalog_store = SqliteCatalogStore(path)
+        self.catalog = MetadataCatalog(self, catalog_store, config.catalog_refresh_seconds)
+
+        logger.info(
+            f"Using {self.auth_method.value} authentication method for Metabase instance "
+            f"'{self.instance}' at {self.base_url}"
+        )
+
+    async def _get_headers(self) -> dict[str, str]:
+        """Get appropriate authentication headers"""
+        headers = {"Content-Type": "application/json"}
+
+        if self.auth_method == AuthMethod.API_KEY and self.api_key:
+            headers["X-API-KEY"] = self.api_key
+        elif self.session is not None:
+            with trace_span("metabase.auth"):
+                headers["X-Metabase-Session"] = await self.session.get_token()
+
+        return headers
+
+    def _reauthenticate(self, response: httpx.Response, headers: dict[str, str]) -> bool:
+        """On a 401 with session auth, drop the rejected token and report that a retry may work"""
+        if response.status_code != 401 or self.session is None:
+            return False
+        logger.info("Session token rejected, logging in again")
+        self.session.invalidate(headers.get("X-Metabase-Session", ""))
+        return True
+
+    async def request(self, method: str, path: str, **kwargs) -> dict[str, Any]:
+        """Make authenticated request to Metabase API
+
+        Concurrent identical GETs and query POSTs are coalesced into a single HTTP call
+        whose result is fanned out to every caller, so results must be treated as
+        read-only.
+        """
+        metrics.add("metabase_mcp_requests_in_flight", {}, 1)
+        try:
+            return await self._request(method, path, **kwargs)
+        finally:
+            metrics.add("metabase_mcp_requests_in_flight", {}, -1)
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict[str, Any]:
+        key = self._coalesce_key(method, path, kwargs)
+        if key is None:
+            return await self._send(method, path, **kwargs)
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._send(method, path, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish_inflight(key, done))
+        else:
+            self.coalesced_requests += 1
+            logger.debug(f"Coalesced {method} request to {path} with an in-flight request")
+
+        # Shield so one caller being cancelled does not cancel the request for the others;
+        # the request itself is cancelled once every caller has given up on it
+        self._inflight_waiters[key] = self._inflight_waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._inflight_waiters[key] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            self._inflight_waiters[key] -= 1
+            if not self._inflight_waiters[key]:
+                del self._inflight_waiters[key]
+
+    def _coalesce_key(self, method: str, path: str, kwargs: dict[str, Any]) -> tuple | None:
+        """Return the single-flight key for a request, or None if it must not be shared"""
+        method = method.upper()
+        if method != "GET" and not (method == "POST" and _QUERY_PATH_RE.match(path)):
+            return None
+        # Identical writes are separate statements; sharing one response would drop all
+        # but the first
+        native = (kwargs.get("json") or {}).get("native") if path == "/dataset" else None
+        if native is not None and not is_read_only_sql(native.get("query") or ""):
+            return None
+        return (method, path, json.dumps(kwargs, sort_keys=True, default=str))
+
+    def _finish_inflight(self, key: tuple, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every waiter was cancelled
+            task.exception()
+
+    async def _send(self, method: str, path: str, **kwargs) -> dict[str, Any]:
+        """Send an authenticated request, retrying transient failures per the method's policy"""
+        policy = RetryPolicy.for_method(method, self.settings)
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.check()
+            retry_after = None
+            try:
+                response = await self._send_once(method, path, **kwargs)
+            except httpx.TransportError as e:
+                self.breaker.record_error(e, method, path)
+                if attempt >= policy.max_attempts or self.breaker.state != CircuitBreaker.CLOSED:
+                    raise
+                failure = repr(e)
+            else:
+                if response.status_code in OUTAGE_STATUSES:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if (
+                    response.status_code not in RETRYABLE_STATUSES
+                    or attempt >= policy.max_attempts
+                    or self.breaker.state != CircuitBreaker.CLOSED
+                ):
+                    break
+                failure = f"status {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+
+            delay = policy.delay(attempt, retry_after)
+            self.retries += 1
+            logger.warning(
+                f"{method} {path} failed with {failure}, retrying in {delay:.2f}s "
+                f"(attempt {attempt}/{policy.max_attempts})"
+            )
+            await asyncio.sleep(delay)
+
+        if not response.is_success:
+            error_message = (
+                f"API request failed with status {response.status_code}: {response.text}"
+            )
+            logger.warning(error_message)
+            raise Exception(error_message)
+
+        logger.debug(f"Successful response from {path}")
+        with trace_span(
+            "metabase.decode", **{"http.response.body.size": len(response.content)}
+        ) as span:
+            result = json_loads(response.content)
+            _trace_result(span, result)
+        return result
+
+    async def _send_once(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send one authenticated request, renewing the session token once on a 401"""
+        url = f"{self.base_url}/api{path}"
+        headers = await self._get_headers()
+
+        logger.debug(f"Making {method} request to {path}")
+
+        response = await self._timed_request(method, path, url, headers, **kwargs)
+        if self._reauthenticate(response, headers):
+            # Retry once with a fresh session token
+            headers = await self._get_headers()
+            response = await self._timed_request(method, path, url, headers, **kwargs)
+        return response
+
+    async def _timed_request(
+        self, method: str, path: str, url: str, headers: dict[str, str], **kwargs
+    ) -> httpx.Response:
+        """Send one HTTP request, recording its latency, status and response size"""
+        labels = {"instance": self.instance, "method": method, "endpoint": endpoint_template(path)}
+        started = time.perf_counter()
+        try:
+            with trace_span(
+                f"{method} {labels['endpoint']}",
+                **{
+                    "http.request.method": method,
+                    "url.path": path,
+                    "metabase.instance": self.instance,
+                },
+            ) as span:
+                response = await self.client.request(
+                    method=method, url=url, headers=headers, **kwargs
+                )
+                if span is not None:
+                    span.set_attribute("http.response.status_code", response.status_code)
+        except httpx.TransportError:
+            metrics.inc("metabase_mcp_http_requests_total", {**labels, "status": "transport_error"})
+            raise
+        finally:
+            metrics.observe(
+                "metabase_mcp_http_request_duration_seconds", labels, time.perf_counter() - started
+            )
+        metrics.inc("metabase_mcp_http_requests_total", {**labels, "status": response.status_code})
+        metrics.inc("metabase_mcp_http_response_bytes_total", labels, len(response.content))
+        return response
+
+    async def open_query_stream(
+        self,
+        database_id: int,
+        query: str,
+        native_parameters: list[dict[str, Any]] | None = None,
+    ) -> "ResultStream":
+        """Start a CSV export of a native query and return a stream over its rows
+
+        The response body is read lazily, so only the rows of the current page are held
+        in memory. Values are returned as strings, unformatted.
+        """
+        dataset_query = {"database": database_id, "type": "native", "native": {"query": query}}
+        if native_parameters:
+            dataset_query["native"]["parameters"] = native_parameters
+
+        form = {
+            "query": json.dumps(dataset_query),
+            "visualization_settings": "{}",
+            "format_rows": "false",
+        }
+
+        logger.debug(f"Opening CSV export stream for database {database_id}")
+        self.breaker.check()
+        for attempt in range(2):
+            headers = await self._get_headers()
+            # Export endpoints take form fields rather than a JSON body
+            headers.pop("Content-Type", None)
+            request = self.client.build_request(
+                "POST", f"{self.base_url}/api/dataset/csv", headers=headers, data=form
+            )
+            try:
+                response = await self.client.send(request, stream=True)
+            except httpx.TransportError as e:
+                self.breaker.record_error(e, "POST", "/dataset/csv")
+                raise
+            # Retry once with a fresh session token
+            if attempt or not self._reauthenticate(response, headers):
+                break
+            await response.aclose()
+
+        metrics.inc(
+            "metabase_mcp_http_requests_total",
+            {
+                "instance": self.instance,
+                "method": "POST",
+                "endpoint": "/dataset/csv",
+                "status": response.status_code,
+            },
+        )
+        if response.status_code in OUTAGE_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        if not response.is_success:
+            await response.aread()
+            await response.aclose()
+            error_message = (
+                f"API request failed with status {response.status_code}: {response.text}"
+            )
+            logger.warning(error_message)
+            raise Exception(error_message)
+
+        stream = ResultStream(response)
+        await stream.read_header()
+        return stream
+
+    @traced("metabase.execute_card", "card_id")
+    async def execute_card(
+        self, card_id: int, parameters: Any | None = None, use_cache: bool = True
+    ) -> QueryResult:
+        """Execute a saved card, serving repeated calls from the result cache"""
+        key = ("card", card_id, _cache_params(parameters))
+        if use_cache and (cached := await self.cache.get(key)) is not None:
+            logger.debug(f"Cache hit for card {card_id}")
+            annotate_span({"metabase.cache_hit": True})
+            return cached
+
+        payload = {}
+        if parameters:
+            payload["parameters"] = parameters
+
+        response = await self.request("POST", f"/card/{card_id}/query", json=payload)
+        result = QueryResult.from_response(response)
+        if use_cache and _is_completed(result):
+            await self.cache.set(key, result, database_id=result.envelope.get("database_id"))
+        return result
+
+    @traced("metabase.execute_dashcard", "dashboard_id", "dashcard_id", "card_id")
+    async def execute_dashcard(
+        self,
+        dashboard_id: int,
+        dashcard_id: int,
+        card_id: int,
+        parameters: list[dict[str, Any]] | None = None,
+        use_cache: bool = True,
+    ) -> QueryResult:
+        """Execute a card in the context of a dashboard, with dashboard filter parameters
+
+        Cached alongside the card's own results, so invalidating the card drops these too.
+        """
+        key = ("card", card_id, _cache_params(parameters), dashboard_id, dashcard_id)
+        if use_cache and (cached := await self.cache.get(key)) is not None:
+            logger.debug(f"Cache hit for dashcard {dashcard_id} of dashboard {dashboard_id}")
+            annotate_span({"metabase.cache_hit": True})
+            return cached
+
+        response = await self.request(
+            "POST",
+            f"/dashboard/{dashboard_id}/dashcard/{dashcard_id}/card/{card_id}/query",
+            json={"parameters": parameters or []},
+        )
+        result = QueryResult.from_response(response)
+        if use_cache and _is_completed(result):
+            await self.cache.set(key, result, database_id=result.envelope.get("database_id"))
+        return result
+
+    async def execute_dashboard(
+        self,
+        dashboard_id: int,
+        parameters: dict[str, Any] | None = None,
+        concurrency: int | None = None,
+        use_cache: bool = True,
+    ) -> tuple[dict[str, Any], list[dict[str, Any]], list[dict[str, Any]]]:
+        """Execute every card of a dashboard concurrently with its filters applied
+
+        `parameters` maps dashboard filter slugs (or ids) to values; filters not given
+        use their dashboard default. Each value is sent to every dashcard through the
+        dashcard's parameter mappings. Returns the dashboard, its executed dashcards and
+        their outcomes from execute_many, in the same order.
+        """
+        dashboard = await self.request("GET", f"/dashboard/{dashboard_id}")
+        parameters = parameters or {}
+        values = {}
+        for parameter in dashboard.get("parameters") or []:
+            value = parameters.get(parameter.get("slug"), parameters.get(parameter["id"]))
+            if value is None:
+                value = parameter.get("default")
+            if value is not None:
+                values[parameter["id"]] = (parameter, value)
+
+        # Older Metabase versions call dashcards "ordered_cards"; text cards have no card_id
+        dashcards = [
+            dashcard
+            for dashcard in dashboard.get("dashcards") or dashboard.get("ordered_cards") or []
+            if dashcard.get("card_id") is not None
+        ]
+        items = []
+        for dashcard in dashcards:
+            card_parameters = [
+                {
+                    "id": parameter["id"],
+                    "type": parameter.get("type"),
+                    "value": value,
+                    "target": mapping["target"],
+                }
+                for mapping in dashcard.get("parameter_mappings") or []
+                if mapping.get("parameter_id") in values
+                and mapping.get("card_id", dashcard["card_id"]) == dashcard["card_id"]
+                for parameter, value in [values[mapping["parameter_id"]]]
+            ]
+            items.append(
+                {
+                    "dashboard_id": dashboard_id,
+                    "dashcard_id": dashcard["id"],
+                    "card_id": dashcard["card_id"],
+                    "parameters": card_parameters,
+                }
+            )
+
+        # Like the Metabase UI, load every dashcard in one wave unless told otherwise
+        outcomes = await self.execute_many(
+            items, concurrency=concurrency or len(items), use_cache=use_cache
+        )
+        return dashboard, dashcards, outcomes
+
+    @traced("metabase.execute_query", "database_id")
+    async def execute_query(
+        self,
+        database_id: int,
+        query: str,
+        native_parameters: list[dict[str, Any]] | None = None,
+        use_cache: bool = True,
+        timeout: float | None = None,
+        template_tags: dict[str, Any] | None = None,
+    ) -> QueryResult:
+        """Execute a native query, serving repeated read-only queries from the result cache
+
+        Statements that are not read-only bypass the cache and invalidate every cached
+        result for the database, so running a refresh through this method is enough
+        to avoid serving stale rows. `timeout` overrides the read timeout for slow queries.
+        With `template_tags`, `native_parameters` are the Metabase parameters that fill
+        the query's ``{{tags}}``.
+        """
+        read_only = is_read_only_sql(query)
+        key = ("query", database_id, normalize_sql(query), _cache_params(native_parameters))
+        if use_cache and read_only and (cached := await self.cache.get(key)) is not None:
+            logger.debug(f"Cache hit for query on database {database_id}")
+            annotate_span({"metabase.cache_hit": True})
+            return cached
+
+        payload = {"database": database_id, "type": "native", "native": {"query": query}}
+        if template_tags:
+            payload["native"]["template-tags"] = template_tags
+            payload["parameters"] = native_parameters or []
+        elif native_parameters:
+            payload["native"]["parameters"] = native_parameters
+
+        options = {}
+        if timeout is not None:
+            options["timeout"] = httpx.Timeout(
+                self.settings.write_timeout,
+                connect=self.settings.connect_timeout,
+                read=timeout,
+                pool=self.settings.pool_timeout,
+            )
+        response = await self.request("POST", "/dataset", json=payload, **options)
+        result = QueryResult.from_response(response)
+        if not read_only:
+            dropped = await self.cache.invalidate(database_id=database_id)
+            logger.info(f"Invalidated {dropped} cached results for database {database_id}")
+        elif use_cache and _is_completed(result):
+            await self.cache.set(key, result, database_id=database_id)
+        return result
+
+    async def execute_many(
+        self,
+        items: list[dict[str, Any]],
+        concurrency: int | None = None,
+        use_cache: bool = True,
+    ) -> list[dict[str, Any]]:
+        """Execute several cards and/or native queries concurrently
+
+        Each item is either ``{"card_id": ..., "parameters": ...}``,
+        ``{"database_id": ..., "query": ..., "native_parameters": ...}`` or a dashcard
+        ``{"dashboard_id": ..., "dashcard_id": ..., "card_id": ..., "parameters": ...}``. At most
+        `concurrency` items run at once (default: METABASE_BATCH_CONCURRENCY). Failures
+        are reported per item instead of failing the batch; results keep input order.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency or self.settings.batch_concurrency))
+
+        async def run(index: int, item: dict[str, Any]) -> dict[str, Any]:
+            async with semaphore:
+                started = time.perf_counter()
+                outcome: dict[str, Any] = {"index": index}
+                try:
+                    if "dashcard_id" in item:
+                        outcome["dashcard_id"] = item["dashcard_id"]
+                        outcome["card_id"] = item["card_id"]
+                        result = await self.execute_dashcard(
+                            item["dashboard_id"],
+                            item["dashcard_id"],
+                            item["card_id"],
+                            item.get("parameters"),
+                            use_cache=use_cache,
+                        )
+                    elif "card_id" in item:
+                        outcome["card_id"] = item["card_id"]
+                        result = await self.execute_card(
+                            item["card_id"], item.get("parameters"), use_cache=use_cache
+                        )
+                    elif "query" in item and "database_id" in item:
+                        outcome["database_id"] = item["database_id"]
+                        result = await self.execute_query(
+                            item["database_id"],
+                            item["query"],
+                            item.get("native_parameters"),
+                            use_cache=use_cache,
+                        )
+                    else:
+                        raise ValueError("Batch items need either card_id or database_id and query")
+                    if _is_completed(result):
+                        outcome.update(status="completed", result=result)
+                    else:
+                        outcome.update(status="failed", error=result.error)
+                except Exception as e:
+                    outcome.update(status="error", error=str(e))
+                outcome["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                return outcome
+
+        return await asyncio.gather(*(run(i, item) for i, item in enumerate(items)))
+
+    def stats(self) -> dict[str, Any]:
+        """Return resilience counters for health and metrics reporting"""
+        return {
+            "retries": self.retries,
+            "coalesced_requests": self.coalesced_requests,
+            "circuit_breaker": self.breaker.stats(),
+        }
+
+    async def close(self):
+        """Close the HTTP client and the shared state connection"""
+        await self.catalog.close()
+        await self.client.aclose()
+        if self.state is not None:
+            await self.state.close()
+
+
+def _cache_params(parameters: Any | None) -> str:
+    """Serialize query parameters into a stable cache key component"""
+    return json.dumps(parameters or None, sort_keys=True, default=str)
+
+
+def _is_completed(result: Any) -> bool:
+    """Whether a query response is a successful result worth caching
+
+    Metabase reports query errors with a 202 and ``status: failed`` in the body.
+    """
+    if isinstance(result, QueryResult):
+        return result.status == "completed"
+    return isinstance(result, dict) and result.get("status", "completed") == "completed"
+
+
+def encode_result(
+    result: QueryResult | dict[str, Any],
+    output_format: str = "rows",
+    dictionary_encode: bool = True,
+) -> dict[str, Any]:
+    """Re-encode a query result in the requested output format
+
+    - ``rows``: the Metabase response, less null column attributes
+    - ``columnar``: one value array per column with slim column metadata; repeated
+      strings are dictionary encoded as ``{"dictionary": [...], "indices": [...]}``
+    - ``arrow`` / ``parquet``: base64 Arrow IPC stream or Parquet bytes (needs pyarrow)
+
+    This is where a QueryResult becomes plain JSON-ready data for the MCP response.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {', '.join(OUTPUT_FORMATS)}")
+    if isinstance(result, dict):
+        if output_format == "rows":
+            return result
+        result = QueryResult.from_response(result)
+    if output_format == "rows" or not _is_completed(result) or not result.has_data:
+        return result.to_dict()
+
+    if output_format in ("arrow", "parquet"):
+        values = [list(column) for column in result.values]
+        encoded_result = {
+            "format": output_format,
+            "encoding": "base64",
+            "row_count": result.row_count,
+            "data": base64.b64encode(_to_arrow_bytes(result.names, values, output_format)).decode(),
+        }
+        for key in ("truncated", "omitted"):
+            if key in result.envelope:
+                encoded_result[key] = result.envelope[key]
+        return encoded_result
+
+    columns = []
+    for field, column_values in zip(result.columns, result.values):
+        column = field.slim()
+        column_values = list(column_values)
+        encoded = _dictionary_encode(column_values) if dictionary_encode else None
+        if encoded is not None:
+            column["dictionary"], column["indices"] = encoded
+        else:
+            column["values"] = column_values
+        columns.append(column)
+
+    encoded_result = {"format": "columnar", "row_count": result.row_count, "columns": columns}
+    for key in ("status", "database_id", "running_time", "truncated", "omitted"):
+        if key in result.envelope:
+            encoded_result[key] = result.envelope[key]
+    return encoded_result
+
+
+def _json_size(value: Any) -> int:
+    return len(json_dumps(value))
+
+
+def budget_result(
+    result: QueryResult, max_bytes: int, hint: str = QUERY_PAGING_HINT
+) -> QueryResult:
+    """Cut a query result down to about max_bytes of JSON by keeping its first rows
+
+    Results that fit are returned unchanged. Otherwise the column metadata is slimmed,
+    trailing rows are dropped, and ``omitted`` reports how many rows were left out, sums
+    and ranges of the numeric columns over every row, and how to get the rest.
+    """
+    if max_bytes <= 0 or not _is_completed(result) or not result.has_data:
+        return result
+    row_count = result.row_count
+    if not row_count:
+        return result
+    # Size of the "rows" JSON: every value plus brackets and commas, without building it
+    size = _json_size(result.envelope) + _json_size(result.data_extra) + 2 * row_count
+    size += sum(_json_size(column.to_dict()) for column in result.columns)
+    size += sum(_json_size(list(column)) for column in result.values)
+    if size <= max_bytes:
+        return result
+
+    envelope = {key: result.envelope[key] for key in BUDGET_RESULT_KEYS if key in result.envelope}
+    envelope.update(
+        row_count=row_count,
+        truncated=True,
+        omitted={
+            "rows": row_count,
+            "max_bytes": max_bytes,
+            "column_summaries": _column_summaries(result.columns, result.values),
+            "hint": hint,
+        },
+    )
+    columns = [Field(**column.slim()) for column in result.columns]
+    budgeted = QueryResult(columns, [[] for _ in columns], envelope, {})
+
+    # Rows are joined by commas; the count of omitted rows may grow by a few digits
+    size = _json_size(budgeted.to_dict()) + 2
+    kept = 0
+    for row in zip(*result.values):
+        size += _json_size(row) + 1
+        if size > max_bytes:
+            break
+        kept += 1
+    budgeted.values = [column[:kept] for column in result.values]
+    envelope["omitted"]["rows"] = row_count - kept
+    return budgeted
+
+
+def _column_summaries(columns: list[Field], values: list[Sequence[Any]]) -> dict[str, Any]:
+    """Count, nulls, min, max, sum and mean of each numeric column"""
+    summaries = {}
+    for field, column in zip(columns, values):
+        if not _is_numeric(field, column):
+            continue
+        present = [
+            value
+            for value in column
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        ]
+        summary: dict[str, Any] = {"count": len(present), "nulls": len(column) - len(present)}
+        if present:
+            total = sum(present)
+            summary.update(min=min(present), max=max(present), sum=total, mean=total / len(present))
+        summaries[field.name] = summary
+    return summaries
+
+
+def page_list(
+    items: list[dict[str, Any]],
+    fields: Sequence[str],
+    limit: int,
+    cursor: str | None,
+    max_bytes: int,
+) -> dict[str, Any]:
+    """Return one page of a listing, ordered by id and projected to `fields`
+
+    The cursor holds the last id returned, so cards created or deleted between calls do
+    not shift the pages. A page over max_bytes of JSON is cut short, keeping at least
+    one item, and ``omitted`` says so.
+    """
+    if not 1 <= limit <= MAX_LIST_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_LIST_PAGE_SIZE}")
+    items = sorted(items, key=lambda item: _id_order(item.get("id")))
+    total = len(items)
+    if cursor is not None:
+        after = _id_order(_decode_cursor(cursor).get("after"))
+        items = [item for item in items if _id_order(item.get("id")) > after]
+
+    page = [{key: item.get(key) for key in fields} for item in items[:limit]]
+    omitted: dict[str, Any] = {}
+    if max_bytes > 0 and (kept := max(1, fitting_items(page, max_bytes))) < len(page):
+        omitted = {"items": len(page) - kept, "max_bytes": max_bytes, "hint": LIST_PAGING_HINT}
+        page = page[:kept]
+
+    result: dict[str, Any] = {"data": page, "total": total, "next_cursor": None}
+    if len(page) < len(items):
+        result["next_cursor"] = _encode_cursor({"after": items[len(page) - 1].get("id")})
+    if omitted:
+        result["omitted"] = omitted
+    return result
+
+
+def fitting_items(items: Sequence[Any], max_bytes: int) -> int:
+    """How many leading items fit in a JSON array of max_bytes (all of them if max_bytes <= 0)"""
+    if max_bytes <= 0:
+        return len(items)
+    size = 2
+    for kept, item in enumerate(items):
+        size += _json_size(item) + 1
+        if size > max_bytes:
+            return kept
+    return len(items)
+
+
+def _id_order(value: Any) -> tuple:
+    """Sort key for ids, which are ints except for ones like the "root" collection"""
+    return (1, value, "") if isinstance(value, int) else (0, 0, str(value))
+
+
+def _encode_cursor(position: dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> dict[str, Any]:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError as e:
+        raise ValueError("Invalid cursor; pass the next_cursor of the previous page") from e
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor; pass the next_cursor of the previous page")
+    return position
+
+
+def _dictionary_encode(values: list[Any]) -> tuple[list[str], list[int]] | None:
+    """Dictionary encode a string column when at most half of its values are distinct"""
+    if not values or not all(isinstance(value, str) for value in values):
+        return None
+
+    index: dict[str, int] = {}
+    indices = [index.setdefault(value, len(index)) for value in values]
+    if len(index) * 2 > len(values):
+        return None
+    return list(index), indices
+
+
+def _to_arrow_bytes(names: list[str], values: list[list[Any]], output_format: str) -> bytes:
+    """Serialize columns as an Arrow IPC stream or a Parquet file"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ValueError(
+            f"output_format={output_format} requires pyarrow (pip install pyarrow)"
+        ) from e
+
+    table = _arrow_table(pa, names, values)
+    sink = pa.BufferOutputStream()
+    if output_format == "parquet":
+        pq.write_table(table, sink)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+_ORDERING_OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+
+def _load_numpy():
+    """Return numpy when installed; post-processing falls back to plain Python otherwise"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def transform_result(
+    result: QueryResult,
+    columns: list[str] | None = None,
+    filters: list[dict[str, Any]] | None = None,
+    group_by: list[str] | None = None,
+    sort_by: str | None = None,
+    descending: bool = True,
+    limit: int | None = None,
+) -> QueryResult:
+    """Filter, aggregate, sort and project an already-fetched query result
+
+    Steps run in this order: ``filters`` (every ``{"column", "op", "value"}`` condition
+    must match), ``group_by`` (one row per group with the sum of each numeric column and
+    a ``count``), ``sort_by`` with ``limit`` (top-k), and finally ``columns``. Vectorized
+    with NumPy when it is installed. Returns a new result; the input is not modified.
+    """
+    if (
+        not (columns or filters or group_by or sort_by or limit is not None)
+        or not _is_completed(result)
+        or not result.has_data
+    ):
+        return result
+
+    np = _load_numpy()
+    cols = [field.to_dict() for field in result.columns]
+    values = list(result.values)
+    names = result.names
+
+    def position(name: str) -> int:
+        if name not in names:
+            raise ValueError(f"Unknown column {name!r}; available: {', '.join(map(str, names))}")
+        return names.index(name)
+
+    if filters:
+        mask = None
+        for condition in filters:
+            op = condition.get("op", "=")
+            if op not in FILTER_OPERATORS:
+                raise ValueError(f"Filter op must be one of {', '.join(FILTER_OPERATORS)}")
+            if op in ("in", "not in") and not isinstance(condition.get("value"), list):
+                raise ValueError(f"Filter op {op!r} needs a list value")
+            i = position(condition["column"])
+            matches = _filter_mask(np, cols[i], values[i], op, condition.get("value"))
+            mask = matches if mask is None else [a and b for a, b in zip(mask, matches)]
+        values = [list(itertools.compress(column, mask)) for column in values]
+
+    if group_by:
+        cols, values = _group_sums(np, cols, values, [position(name) for name in group_by])
+        names = [col.get("name") for col in cols]
+
+    if sort_by is not None or limit is not None:
+        if limit is not None and limit < 0:
+            raise ValueError("limit must not be negative")
+        row_count = len(values[0]) if values else 0
+        if sort_by is not None:
+            i = position(sort_by)
+            indices = _top_indices(np, cols[i], values[i], descending, limit)
+        else:
+            indices = range(min(limit, row_count))
+        values = [[column[i] for i in indices] for column in values]
+
+    if columns:
+        positions = [position(name) for name in columns]
+        cols = [cols[i] for i in positions]
+        values = [values[i] for i in positions]
+
+    output = QueryResult([Field.from_dict(col) for col in cols], values, {}, result.data_extra)
+    output.envelope = {
+        **result.envelope,
+        "row_count": output.row_count,
+        "transform": {"input_rows": result.row_count, "engine": "numpy" if np else "python"},
+    }
+    return output
+
+
+def _is_numeric(col: dict[str, Any] | Field, values: Sequence[Any]) -> bool:
+    """Whether a column holds numbers, from its Metabase base type when known"""
+    if base_type := col.get("base_type"):
+        return base_type in NUMERIC_BASE_TYPES
+    present = [value for value in values if value is not None]
+    return bool(present) and all(
+        isinstance(value, (int, float)) and not isinstance(value, bool) for value in present
+    )
+
+
+def _matches(value: Any, op: str, operand: Any) -> bool:
+    if op == "is null":
+        return value is None
+    if op == "not null":
+        return value is not None
+    if value is None:
+        return op == "!=" and operand is not None
+    if op == "=":
+        return value == operand
+    if op == "!=":
+        return value != operand
+    if op == "in":
+        return value in operand
+    if op == "not in":
+        return value not in operand
+    if op == "contains":
+        return str(operand).lower() in str(value).lower()
+    try:
+        return _ORDERING_OPERATORS[op](value, operand)
+    except TypeError:
+        return False
+
+
+def _filter_mask(np, col: dict[str, Any], column: list[Any], op: str, operand: Any) -> list[bool]:
+    """Evaluate one filter condition over a column"""
+    numeric_operand = isinstance(operand, (int, float)) and not isinstance(operand, bool)
+    if np is not None and numeric_operand and op in ("=", "!=", *_ORDERING_OPERATORS):
+        if _is_numeric(col, column):
+            # NumPy converts None to NaN, which fails every comparison except !=
+            array = np.array(column, dtype=float)
+            comparisons = {"=": operator.eq, "!=": operator.ne, **_ORDERING_OPERATORS}
+            return comparisons[op](array, operand).tolist()
+    return [_matches(value, op, operand) for value in column]
+
+
+def _group_sums(
+    np, cols: list[dict[str, Any]], values: list[list[Any]], keys: list[int]
+) -> tuple[list[dict[str, Any]], list[list[Any]]]:
+    """Group rows by the key columns, summing every other numeric column
+
+    Nulls are skipped; a group whose values are all null sums to null, not 0.
+    """
+    summed = [
+        i for i, column in enumerate(values) if i not in keys and _is_numeric(cols[i], column)
+    ]
+    row_count = len(values[0]) if values else 0
+
+    if np is not None and row_count:
+        codes = []
+        for i in keys:
+            lookup: dict[Any, int] = {}
+            codes.append([lookup.setdefault(value, len(lookup)) for value in values[i]])
+        _, first, inverse = np.unique(
+            np.array(codes).T, axis=0, return_index=True, return_inverse=True
+        )
+        inverse = inverse.reshape(-1)
+        # np.unique orders groups by key codes; restore first-appearance order
+        order = np.argsort(first)
+        groups = len(first)
+        rank = np.empty(groups, dtype=int)
+        rank[order] = np.arange(groups)
+        inverse = rank[inverse]
+        first = first[order]
+        output = [[values[i][j] for j in first.tolist()] for i in keys]
+        for i in summed:
+            column = np.array(values[i], dtype=float)
+            present = ~np.isnan(column)
+            sums = np.bincount(inverse, weights=np.nan_to_num(column), minlength=groups)
+            counts = np.bincount(inverse, weights=present, minlength=groups)
+            sums = [total if count else None for total, count in zip(sums.tolist(), counts)]
+            output.append(_restore_ints(values[i], sums))
+        output.append(np.bincount(inverse, minlength=groups).tolist())
+    else:
+        totals: dict[tuple, list[Any]] = {}
+        for j in range(row_count):
+            group = totals.setdefault(tuple(values[i][j] for i in keys), [None] * len(summed) + [0])
+            for k, i in enumerate(summed):
+                if (value := values[i][j]) is not None:
+                    group[k] = value if group[k] is None else group[k] + value
+            group[-1] += 1
+        output = [[key[k] for key in totals] for k in range(len(keys))]
+        output += [[group[k] for group in totals.values()] for k in range(len(summed) + 1)]
+
+    output_cols = [cols[i] for i in keys]
+    for i in summed:
+        display_name = cols[i].get("display_name") or cols[i].get("name")
+        output_cols.append({**cols[i], "display_name": f"Sum of {display_name}"})
+    output_cols.append({"name": "count", "display_name": "Count", "base_type": "type/Integer"})
+    return output_cols, output
+
+
+def _restore_ints(column: list[Any], sums: list[float | None]) -> list[Any]:
+    if all(isinstance(value, int) for value in column if value is not None):
+        return [None if total is None else int(total) for total in sums]
+    return sums
+
+
+def _top_indices(
+    np, col: dict[str, Any], column: list[Any], descending: bool, limit: int | None
+) -> list[int]:
+    """Row indices ordered by a column, nulls last; only the first `limit` when given
+
+    Ties keep their original order with either engine.
+    """
+    count = len(column) if limit is None else min(limit, len(column))
+    if np is not None and _is_numeric(col, column):
+        array = np.array(column, dtype=float)
+        keys = np.where(np.isnan(array), np.inf, -array if descending else array)
+        return np.argsort(keys, kind="stable")[:count].tolist()
+
+    present = [i for i, value in enumerate(column) if value is not None]
+    nulls = [i for i, value in enumerate(column) if value is None]
+    try:
+        ordered = sorted(present, key=column.__getitem__, reverse=descending)
+    except TypeError:
+        ordered = sorted(present, key=lambda i: str(column[i]), reverse=descending)
+    return (ordered + nulls)[:count]
+
+
+def _arrow_table(pa, names: list[str], values: list[list[Any]]):
+    """Build a pyarrow table from column value lists"""
+    arrays = []
+    for column_values in values:
+        try:
+            arrays.append(pa.array(column_values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed-type columns fall back to strings
+            arrays.append(pa.array([None if v is None else str(v) for v in column_values]))
+    return pa.table(arrays, names=_unique_names(names))
+
+
+def _unique_names(names: list[str]) -> list[str]:
+    """Suffix duplicated column names with their position; Arrow and SQL need unique names"""
+    return [name if names.count(name) == 1 else f"{name}_{i}" for i, name in enumerate(names)]
+
+
+async def _iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[list[str]]:
+    """Parse CSV records from a line iterator, joining lines split inside quoted fields"""
+    pending: list[str] = []
+    quotes = 0
+    async for line in lines:
+        if not pending and not line:
+            continue
+        pending.append(line)
+        quotes += line.count('"')
+        # An odd number of quotes means a quoted field continues on the next line
+        if quotes % 2:
+            continue
+        yield next(csv.reader(["\n".join(pending)]))
+        pending.clear()
+        quotes = 0
+
+
+class ResultStream:
+    """Incrementally parsed CSV export of a query result, consumed page by page"""
+
+    def __init__(self, response: httpx.Response):
+        self.response = response
+        self.records = _iter_csv_records(response.aiter_lines())
+        self.columns: list[str] = []
+        self.rows_read = 0
+        self.done = False
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def read_header(self) -> None:
+        """Read the header record holding the column names"""
+        self.columns = await anext(self.records, [])
+        if not self.columns:
+            await self.close()
+
+    async def next_page(self, page_size: int) -> list[list[str]]:
+        """Read up to page_size rows, closing the response once the export is exhausted"""
+        self.last_used = time.monotonic()
+        rows: list[list[str]] = []
+        if self.done:
+            return rows
+
+        async for record in self.records:
+            rows.append(record)
+            if len(rows) >= page_size:
+                break
+        else:
+            await self.close()
+
+        self.rows_read += len(rows)
+        return rows
+
+    async def close(self) -> None:
+        self.done = True
+        await self.response.aclose()
+
+
+class StreamRegistry:
+    """Open result streams addressed by continuation cursor
+
+    Bounded by METABASE_STREAM_MAX_OPEN; idle streams are closed after
+    METABASE_STREAM_IDLE_TIMEOUT seconds so abandoned cursors do not pin connections.
+    """
+
+    def __init__(self, max_open: int, idle_timeout: float):
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self._streams: dict[str, ResultStream] = {}
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+    async def add(self, stream: ResultStream) -> str:
+        await self._expire()
+        while len(self._streams) >= self.max_open:
+            oldest = min(self._streams, key=lambda cursor: self._streams[cursor].last_used)
+            logger.info(f"Closing least recently used query stream {oldest}")
+            await self.close(oldest)
+
+        cursor = uuid.uuid4().hex
+        self._streams[cursor] = stream
+        return cursor
+
+    async def get(self, cursor: str) -> ResultStream:
+        await self._expire()
+        stream = self._streams.get(cursor)
+        if stream is None:
+            raise ValueError(f"Unknown or expired cursor: {cursor}")
+        return stream
+
+    async def close(self, cursor: str) -> bool:
+        stream = self._streams.pop(cursor, None)
+        if stream is None:
+            return False
+        await stream.close()
+        return True
+
+    async def close_all(self) -> None:
+        for cursor in list(self._streams):
+            await self.close(cursor)
+
+    async def _expire(self) -> None:
+        now = time.monotonic()
+        for cursor, stream in list(self._streams.items()):
+            if stream.done or now - stream.last_used > self.idle_timeout:
+                await self.close(cursor)
+
+
+async def _read_stream_page(cursor: str, stream: ResultStream, page_size: int) -> dict[str, Any]:
+    """Read the next page from a stream and describe it for the client"""
+    page_size = max(1, min(page_size, MAX_STREAM_PAGE_SIZE))
+    async with stream.lock:
+        row_offset = stream.rows_read
+        rows = await stream.next_page(page_size)
+
+    if stream.done:
+        await query_streams.close(cursor)
+
+    return {
+        "columns": stream.columns,
+        "rows": rows,
+        "row_offset": row_offset,
+        "row_count": len(rows),
+        "done": stream.done,
+        "cursor": None if stream.done else cursor,
+    }
+
+
+class QueryJob:
+    """A query running in the background, addressed by job id"""
+
+    def __init__(self, description: str, timeout: float):
+        self.id = uuid.uuid4().hex
+        self.description = description
+        self.timeout = timeout
+        self.status = "running"
+        self.submitted_at = time.time()
+        self.finished_at: float | None = None
+        self.result: QueryResult | None = None
+        self.error: str | None = None
+        self.task: asyncio.Task | None = None
+
+    def info(self) -> dict[str, Any]:
+        """Status summary without the result rows"""
+        info = {
+            "job_id": self.id,
+            "status": self.status,
+            "description": self.description,
+            "elapsed_seconds": round((self.finished_at or time.time()) - self.submitted_at, 2),
+        }
+        if self.result is not None:
+            info["row_count"] = self.result.row_count
+        if self.error is not None:
+            info["error"] = self.error
+        return info
+
+
+class JobManager:
+    """Background query jobs and their results
+
+    Each job runs as an asyncio task with its own timeout, so the MCP call that submits
+    it returns immediately. At most METABASE_JOB_MAX_RUNNING jobs run at once. Finished
+    jobs are kept for METABASE_JOB_RESULT_TTL seconds, and at most
+    METABASE_JOB_MAX_FINISHED of them; the oldest are dropped first.
+    """
+
+    def __init__(self, max_finished: int, result_ttl: float, timeout: float, max_running: int):
+        self.max_finished = max_finished
+        self.result_ttl = result_ttl
+        self.timeout = timeout
+        self.max_running = max_running
+        self._jobs: OrderedDict[str, QueryJob] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    @property
+    def running(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.finished_at is None)
+
+    def submit(self, description: str, run, timeout: float | None = None) -> QueryJob:
+        """Start `run(timeout)`, a coroutine function returning a query result, as a job"""
+        self._prune()
+        if self.running >= self.max_running:
+            raise ValueError(
+                f"{self.max_running} jobs are already running (METABASE_JOB_MAX_RUNNING); "
+                "wait for one to finish or cancel one with cancel_job"
+            )
+        job = QueryJob(description, timeout or self.timeout)
+        job.task = asyncio.create_task(self._run(job, run))
+        # Runs even when the job is cancelled before its task starts, which skips _run
+        job.task.add_done_callback(lambda _: self._finish(job))
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> QueryJob:
+        self._prune()
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Unknown or expired job: {job_id}")
+        return job
+
+    async def cancel(self, job_id: str) -> QueryJob:
+        """Cancel a running job; closing its HTTP request makes Metabase cancel the query"""
+        job = self.get(job_id)
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+            await asyncio.gather(job.task, return_exceptions=True)
+        return job
+
+    async def close_all(self) -> None:
+        for job in list(self._jobs.values()):
+            await self.cancel(job.id)
+
+    async def _run(self, job: QueryJob, run) -> None:
+        try:
+            result = await asyncio.wait_for(run(job.timeout), job.timeout)
+            if _is_completed(result):
+                job.result = result
+                job.status = "completed"
+            else:
+                job.error = result.error if isinstance(result, QueryResult) else str(result)
+                job.status = "failed"
+        except (TimeoutError, httpx.TimeoutException):
+            job.error = f"Query did not finish within {job.timeout:g}s"
+            job.status = "timed_out"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+
+    def _finish(self, job: QueryJob) -> None:
+        if job.status == "running":
+            job.status = "cancelled"
+        job.finished_at = time.time()
+        logger.info(f"Job {job.id} {job.status} after {job.info()['elapsed_seconds']}s")
+
+    def _prune(self) -> None:
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        for index, job in enumerate(finished):
+            if len(finished) - index > self.max_finished or now - job.finished_at > self.result_ttl:
+                del self._jobs[job.id]
+
+
+_LOCAL_TABLE_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# DuckDB settings of the local database: tables only come from registered query results
+LOCAL_DATABASE_CONFIG = {
+    "enable_external_access": False,
+    "autoinstall_known_extensions": False,
+    "autoload_known_extensions": False,
+}
+
+# Column types for local tables when pyarrow is not installed to infer them
+_DUCKDB_COLUMN_TYPES = {
+    "type/BigInteger": "BIGINT",
+    "type/Boolean": "BOOLEAN",
+    "type/Decimal": "DOUBLE",
+    "type/Float": "DOUBLE",
+    "type/Integer": "BIGINT",
+    "type/Number": "DOUBLE",
+}
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _metabase_base_type(duckdb_type: Any) -> str:
+    """Map a DuckDB result column type to the closest Metabase base type"""
+    type_name = str(duckdb_type).upper()
+    if type_name.startswith("DECIMAL"):
+        return "type/Decimal"
+    if type_name in ("DOUBLE", "FLOAT", "REAL"):
+        return "type/Float"
+    if type_name.endswith("INT") or type_name.endswith("INTEGER"):
+        return "type/Integer"
+    if type_name == "BOOLEAN":
+        return "type/Boolean"
+    if type_name == "DATE":
+        return "type/Date"
+    if type_name.startswith("TIMESTAMP"):
+        return "type/DateTime"
+    return "type/Text"
+
+
+def _plain_value(value: Any) -> Any:
+    """Convert DuckDB result values to the JSON types Metabase itself returns"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+class LocalDatabase:
+    """In-process DuckDB database of query results registered as named tables
+
+    Results from different Metabase databases (e.g. Supabase and the MySQL replica) can
+    be joined here in milliseconds instead of by hand. Requires duckdb; pyarrow, when
+    installed, is used to load results column-wise with inferred types.
+    """
+
+    def __init__(self, memory_limit: str | None = None):
+        self.memory_limit = memory_limit
+        self.tables: dict[str, dict[str, Any]] = {}
+        self._connection = None
+        self._lock = threading.Lock()
+
+    async def register(
+        self, name: str, result: QueryResult, source: dict[str, Any]
+    ) -> dict[str, Any]:
+        """Create or replace table `name` from a query result"""
+        if not _LOCAL_TABLE_NAME_RE.match(name):
+            raise ValueError("Table names must be letters, digits and underscores")
+        if not _is_completed(result) or not result.has_data:
+            raise ValueError(f"Cannot register a failed query: {result.error}")
+
+        columns = await asyncio.to_thread(self._load, name, result)
+        self.tables[name] = {
+            "name": name,
+            "source": source,
+            "row_count": result.row_count,
+            "columns": columns,
+            "registered_at": time.time(),
+        }
+        logger.info(f"Registered local table {name} with {self.tables[name]['row_count']} rows")
+        return self.tables[name]
+
+    async def query(self, sql: str, limit: int) -> dict[str, Any]:
+        """Run SQL over the local tables, returning a Metabase-shaped result"""
+        return await asyncio.to_thread(self._query, sql, limit)
+
+    async def drop(self, name: str) -> bool:
+        if self.tables.pop(name, None) is None:
+            return False
+        await asyncio.to_thread(self._execute, f"DROP TABLE IF EXISTS {_quote_identifier(name)}")
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+        self.tables.clear()
+
+    def _connect(self):
+        if self._connection is None:
+            try:
+                import duckdb
+            except ImportError as e:
+                raise ValueError("Local tables require duckdb (pip install duckdb)") from e
+            # Any MCP client can run SQL here, and the SSE/HTTP transports are reachable
+            # over the network: no file, URL or extension access, and no way to undo that
+            self._connection = duckdb.connect(":memory:", config=LOCAL_DATABASE_CONFIG)
+            if self.memory_limit:
+                self._connection.execute("SET memory_limit = ?", [self.memory_limit])
+            self._connection.execute("SET lock_configuration = true")
+        return self._connection
+
+    def _execute(self, sql: str) -> None:
+        with self._lock:
+            self._connect().execute(sql)
+
+    def _load(self, name: str, result: QueryResult) -> list[str]:
+        names = _unique_names(result.names)
+        table = _quote_identifier(name)
+        try:
+            import pyarrow as pa
+        except ImportError:
+            pa = None
+
+        with self._lock:
+            connection = self._connect()
+            if pa is not None:
+                values = [list(column) for column in result.values]
+                connection.register("incoming_result", _arrow_table(pa, names, values))
+                try:
+                    connection.execute(
+                        f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM incoming_result"
+                    )
+                finally:
+                    connection.unregister("incoming_result")
+            else:
+                definitions = ", ".join(
+                    f"{_quote_identifier(column)} "
+                    f"{_DUCKDB_COLUMN_TYPES.get(field.base_type, 'VARCHAR')}"
+                    for column, field in zip(names, result.columns)
+                )
+                connection.execute(f"CREATE OR REPLACE TABLE {table} ({definitions})")
+                if result.row_count:
+                    placeholders = ", ".join("?" for _ in names)
+                    connection.executemany(
+                        f"INSERT INTO {table} VALUES ({placeholders})", result.rows()
+                    )
+        return names
+
+    def _query(self, sql: str, limit: int) -> dict[str, Any]:
+        started = time.perf_counter()
+        with self._lock:
+            cursor = self._connect().execute(sql)
+            description = cursor.description or []
+            rows = cursor.fetchmany(limit + 1) if description else []
+
+        truncated = len(rows) > limit
+        rows = [[_plain_value(value) for value in row] for row in rows[:limit]]
+        return {
+            "status": "completed",
+            "row_count": len(rows),
+            "truncated": truncated,
+            "running_time": round((time.perf_counter() - started) * 1000),
+            "data": {
+                "cols": [
+                    {"name": column[0], "base_type": _metabase_base_type(column[1])}
+                    for column in description
+                ],
+                "rows": rows,
+            },
+        }
+
+
+_TEMPLATE_TAG_RE = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+_OPTIONAL_CLAUSE_RE = re.compile(r"\[\[.*?\]\]", re.DOTALL)
+_REPORT_SECTION_RE = re.compile(
+    r"^--\s*=+[ \t]*\n--\s*(?:\d+\.\s*)?(.+?)[ \t]*\n--\s*=+[ \t]*$", re.MULTILINE
+)
+_REPORT_DATABASE_RE = re.compile(r"^--\s*Database:.*\(ID:\s*(\d+)\)", re.IGNORECASE | re.MULTILINE)
+_REPORT_DEFAULTS_RE = re.compile(r"^--\s*Defaults:\s*(.+)$", re.IGNORECASE | re.MULTILINE)
+_RELATIVE_DATE_RE = re.compile(r"^(\d+)\s+(day|week)s?\s+ago$")
+
+
+class NamedQuery:
+    """A report query with Metabase template tags, e.g. ``{{start_date}}``
+
+    Tags inside an optional clause (``[[AND platform = {{platform}}]]``) may be left
+    out; the others need a value or a default. Tags named ``*_date`` are dates and take
+    ``YYYY-MM-DD``, ``today``, ``yesterday`` or ``N days/weeks ago``; the rest are text.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        title: str,
+        source: str,
+        database_id: int | None,
+        sql: str,
+        defaults: dict[str, str],
+    ):
+        self.name = name
+        self.title = title
+        self.source = source
+        self.database_id = database_id
+        self.sql = sql
+        self.defaults = defaults
+        optional = {
+            tag
+            for clause in _OPTIONAL_CLAUSE_RE.findall(sql)
+            for tag in _TEMPLATE_TAG_RE.findall(clause)
+        }
+        required = set(_TEMPLATE_TAG_RE.findall(_OPTIONAL_CLAUSE_RE.sub("", sql)))
+        self.tags = list(dict.fromkeys(_TEMPLATE_TAG_RE.findall(sql)))
+        self.optional = optional - required
+
+    def info(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "title": self.title,
+            "source": self.source,
+            "database_id": self.database_id,
+            "parameters": [
+                {
+                    "name": tag,
+                    "type": _tag_type(tag),
+                    "default": self.defaults.get(tag),
+                    "required": tag not in self.optional and tag not in self.defaults,
+                }
+                for tag in self.tags
+            ],
+        }
+
+    def bind(
+        self, values: dict[str, Any] | None
+    ) -> tuple[dict[str, Any], dict[str, Any], list[dict[str, Any]]]:
+        """Resolve parameter values and defaults against the template tags
+
+        Returns the resolved values, the native query's template-tags and the Metabase
+        parameters. Relative dates are resolved here, so the same report run on the same
+        day sends the same query and hits every cache on the way.
+        """
+        values = dict(values or {})
+        unknown = [key for key in values if key not in self.tags]
+        if unknown:
+            raise ValueError(
+                f"Unknown parameters for {self.name}: {', '.join(unknown)}; "
+                f"available: {', '.join(self.tags) or 'none'}"
+            )
+        resolved: dict[str, Any] = {}
+        for tag in self.tags:
+            value = values.get(tag, self.defaults.get(tag))
+            if value is None:
+                if tag not in self.optional:
+                    raise ValueError(f"Parameter {tag} is required by {self.name}")
+                continue
+            resolved[tag] = _resolve_date(value) if _tag_type(tag) == "date" else str(value)
+
+        template_tags = {
+            tag: {
+                "id": tag,
+                "name": tag,
+                "display-name": tag.replace("_", " ").title(),
+                "type": _tag_type(tag),
+                "required": tag not in self.optional,
+            }
+            for tag in self.tags
+        }
+        parameters = [
+            {
+                "type": "date/single" if _tag_type(tag) == "date" else "category",
+                "target": ["variable", ["template-tag", tag]],
+                "value": value,
+            }
+            for tag, value in resolved.items()
+        ]
+        return resolved, template_tags, parameters
+
+
+def _tag_type(tag: str) -> str:
+    return "date" if tag == "date" or tag.endswith("_date") else "text"
+
+
+def _resolve_date(value: Any) -> str:
+    """A date parameter as YYYY-MM-DD, from a date or a relative expression"""
+    text = str(value).strip().lower()
+    today = datetime.date.today()
+    if text == "today":
+        return today.isoformat()
+    if text == "yesterday":
+        return (today - datetime.timedelta(days=1)).isoformat()
+    if match := _RELATIVE_DATE_RE.match(text):
+        days = int(match.group(1)) * (7 if match.group(2) == "week" else 1)
+        return (today - datetime.timedelta(days=days)).isoformat()
+    try:
+        return datetime.date.fromisoformat(text).isoformat()
+    except ValueError:
+        raise ValueError(
+            f"Invalid date {value!r}: use YYYY-MM-DD, today, yesterday or 'N days ago'"
+        ) from None
+
+
+def _parse_defaults(text: str) -> dict[str, str]:
+    """``-- Defaults: start_date = 30 days ago, end_date = today`` lines of a report"""
+    defaults = {}
+    for line in _REPORT_DEFAULTS_RE.findall(text):
+        for item in line.split(","):
+            key, _, value = item.partition("=")
+            if key.strip() and value.strip():
+                defaults[key.strip()] = value.strip()
+    return defaults
+
+
+def _strip_sql(text: str) -> str:
+    """The statement of a report section, without its leading comments and semicolon"""
+    lines = text.strip().splitlines()
+    while lines and (not lines[0].strip() or lines[0].lstrip().startswith("--")):
+        lines.pop(0)
+    return "\n".join(lines).rstrip().rstrip(";").rstrip()
+
+
+def _slug(title: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", title.lower()).strip("_")
+
+
+def parse_report(text: str, stem: str, source: str) -> list[NamedQuery]:
+    """Split a report file into its named queries
+
+    A file of several queries separated by ``-- ====`` banners around a numbered title
+    gives one query per section, named ``<file>.<title>``; a file of one query is named
+    after the file. ``-- Database: ... (ID: n)`` and ``-- Defaults:`` lines before the
+    first section apply to every query; a section's own defaults override them.
+    """
+    database = _REPORT_DATABASE_RE.search(text)
+    database_id = int(database.group(1)) if database else None
+    sections = list(_REPORT_SECTION_RE.finditer(text))
+    if not sections:
+        comments = [line for line in text.splitlines() if line.startswith("--")]
+        title = comments[0].lstrip("- ").strip() if comments else stem
+        chunks = [(stem, title, text, {})]
+    else:
+        header_defaults = _parse_defaults(text[: sections[0].start()])
+        chunks = [
+            (
+                f"{stem}.{_slug(section.group(1))}",
+                section.group(1),
+                text[section.end() : following.start() if following else len(text)],
+                header_defaults,
+            )
+            for section, following in zip(sections, [*sections[1:], None])
+        ]
+
+    queries = []
+    for name, title, body, inherited in chunks:
+        sql = _strip_sql(body)
+        # Sections holding only commented-out maintenance statements are skipped
+        if sql:
+            defaults = {**inherited, **_parse_defaults(body)}
+            queries.append(NamedQuery(name, title, source, database_id, sql, defaults))
+    return queries
+
+
+class NamedQueryRegistry:
+    """Named, parameterized queries loaded from the report SQL files in a directory
+
+    Agents run a report by name with a few parameters instead of pasting its SQL, so
+    every run of a report is the same query text and the result cache, request
+    coalescing and Metabase's own cache all see repeats. A report kept runnable outside
+    Metabase (``roas_tracker.sql``) is served from its parameterized copy next to it
+    (``roas_tracker.metabase.sql``). Files are reread when a file is added, removed or
+    replaced, which changes the modification time of its directory.
+    """
+
+    def __init__(self, directory: str | None):
+        self.directory = directory
+        self._queries: dict[str, NamedQuery] = {}
+        self._directories: list[str] = []
+        self._signature: tuple | None = None
+
+    def queries(self) -> dict[str, NamedQuery]:
+        if not self.directory or self.directory.strip().lower() == "none":
+            return {}
+        if self._signature is None or self._directory_times() != self._signature:
+            self._directories = [root for root, _, _ in os.walk(self.directory)]
+            self._signature = self._directory_times()
+            pattern = os.path.join(self.directory, "**", "*.sql")
+            self._queries = self._load(sorted(glob.glob(pattern, recursive=True)))
+        return self._queries
+
+    def _directory_times(self) -> tuple:
+        """Modification times of the directory and its subdirectories as last walked"""
+        try:
+            return tuple(os.stat(directory).st_mtime_ns for directory in self._directories)
+        except OSError:
+            return ()
+
+    def get(self, name: str) -> NamedQuery:
+        queries = self.queries()
+        if name not in queries:
+            raise ValueError(
+                f"Unknown named query {name!r}; available: {', '.join(queries) or 'none'}"
+            )
+        return queries[name]
+
+    def _load(self, paths: list[str]) -> dict[str, NamedQuery]:
+        queries: dict[str, NamedQuery] = {}
+        available = set(paths)
+        for path in paths:
+            if path.removesuffix(".sql") + METABASE_REPORT_SUFFIX in available:
+                continue
+            source = os.path.relpath(path, self.directory)
+            stem = os.path.basename(path).removesuffix(METABASE_REPORT_SUFFIX).removesuffix(".sql")
+            with open(path, encoding="utf-8") as file:
+                text = file.read()
+            for query in parse_report(text, stem, source):
+                if query.name in queries:
+                    logger.warning(f"Skipping named query {query.name} in {source}: duplicate name")
+                    continue
+                queries[query.name] = query
+        logger.info(f"Loaded {len(queries)} named queries from {self.directory}")
+        return queries
+
+
+def _catalog_path(base_url: str, configured: str | None) -> str | None:
+    """Resolve the catalog file, one per Metabase URL unless METABASE_CATALOG_PATH is set"""
+    if configured is not None:
+        if configured.strip().lower() in ("", "none"):
+            return None
+        return os.path.expanduser(configured)
+    digest = hashlib.sha1(base_url.encode()).hexdigest()[:12]
+    return os.path.expanduser(f"~/.cache/metabase-mcp/catalog-{digest}.sqlite3")
+
+
+_CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog_databases (
+    database_id INTEGER PRIMARY KEY,
+    loaded_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS catalog_tables (
+    table_id INTEGER PRIMARY KEY,
+    database_id INTEGER NOT NULL,
+    detailed INTEGER NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS catalog_cards (
+    card_id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    name TEXT PRIMARY KEY,
+    loaded_at REAL NOT NULL
+);
+"""
+
+
+class SqliteCatalogStore:
+    """On-disk SQLite copy of one replica's metadata catalog, so restarts start warm"""
+
+    shared = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    async def load(self) -> dict[str, Any] | None:
+        """Open the file and return everything in it, or None if it is unusable"""
+        import sqlite3
+
+        snapshot: dict[str, Any] = {"databases": {}, "tables": [], "cards": [], "cards_at": None}
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.executescript(_CATALOG_SCHEMA)
+            for database_id, loaded_at in self._db.execute("SELECT * FROM catalog_databases"):
+                snapshot["databases"][database_id] = loaded_at
+            for _, database_id, detailed, payload in self._db.execute(
+                "SELECT * FROM catalog_tables"
+            ):
+                snapshot["tables"].append((database_id, bool(detailed), json.loads(payload)))
+            for _, payload in self._db.execute("SELECT * FROM catalog_cards"):
+                snapshot["cards"].append(json.loads(payload))
+            for (loaded_at,) in self._db.execute(
+                "SELECT loaded_at FROM catalog_meta WHERE name = 'cards'"
+            ):
+                snapshot["cards_at"] = loaded_at
+        except sqlite3.Error as e:
+            logger.warning(f"Metadata catalog cache at {self.path} unavailable: {e}")
+            self._db = None
+            return None
+        return snapshot
+
+    async def save_tables(
+        self,
+        database_id: int | None,
+        tables: list[dict[str, Any]],
+        detailed: bool,
+        removed: set[int] | frozenset[int],
+        loaded_at: float | None,
+    ) -> None:
+        if self._db is not None:
+            await asyncio.to_thread(
+                self._save_tables, database_id, tables, detailed, removed, loaded_at
+            )
+
+    async def save_cards(self, cards: list[dict[str, Any]], loaded_at: float) -> None:
+        if self._db is not None:
+            await asyncio.to_thread(self._save_cards, cards, loaded_at)
+
+    async def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _save_tables(
+        self,
+        database_id: int | None,
+        tables: list[dict[str, Any]],
+        detailed: bool,
+        removed: set[int] | frozenset[int],
+        loaded_at: float | None,
+    ) -> None:
+        rows = [
+            (table["id"], database_id or table.get("db_id"), int(detailed), json.dumps(table))
+            for table in tables
+        ]
+        with self._lock, self._db:
+            self._db.executemany(
+                "DELETE FROM catalog_tables WHERE table_id = ?", [(t,) for t in removed]
+            )
+            self._db.executemany("INSERT OR REPLACE INTO catalog_tables VALUES (?, ?, ?, ?)", rows)
+            if loaded_at is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO catalog_databases VALUES (?, ?)",
+                    (database_id, loaded_at),
+                )
+
+    def _save_cards(self, cards: list[dict[str, Any]], loaded_at: float) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM catalog_cards")
+            self._db.executemany(
+                "INSERT INTO catalog_cards VALUES (?, ?)",
+                [(card["id"], json.dumps(card)) for card in cards],
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO catalog_meta VALUES ('cards', ?)", (loaded_at,)
+            )
+
+
+class RedisCatalogStore:
+    """Metadata catalog kept in Redis and shared by every replica
+
+    Each database's tables live in a hash (table id -> [detailed, payload]) next to a
+    hash of load times, so a replica whose copy is stale can adopt a newer one written
+    by another replica instead of refetching it from Metabase.
+    """
+
+    shared = True
+
+    def __init__(self, state: RedisState):
+        self.state = state
+        self.path = None
+
+    async def load(self) -> dict[str, Any] | None:
+        """Return the whole shared catalog, or None if Redis is unavailable"""
+        snapshot: dict[str, Any] = {"databases": {}, "tables": [], "cards": [], "cards_at": None}
+        try:
+            databases = await self.state.redis.hgetall(self.state.key("catalog", "databases"))
+        except self.state.errors as e:
+            self.state.failed("loading the metadata catalog", e)
+            return None
+        for database_id in databases:
+            database = await self.load_database(int(database_id))
+            if database is not None:
+                snapshot["databases"][int(database_id)] = database[0]
+                snapshot["tables"] += database[1]
+        if (cards := await self.load_cards()) is not None:
+            snapshot["cards"], snapshot["cards_at"] = cards
+        return snapshot
+
+    async def load_database(self, database_id: int) -> tuple[float, list[tuple]] | None:
+        """Return (loaded_at, [(database_id, detailed, payload)]) of a fully loaded database"""
+        try:
+            async with self.state.redis.pipeline(transaction=False) as pipe:
+                pipe.hget(self.state.key("catalog", "databases"), database_id)
+                pipe.hgetall(self.state.key("catalog", "tables", database_id))
+                loaded_at, tables = await pipe.execute()
+        except self.state.errors as e:
+            self.state.failed("loading the metadata catalog", e)
+            return None
+        if loaded_at is None:
+            return None
+        rows = []
+        for payload in tables.values():
+            detailed, table = json.loads(payload)
+            rows.append((database_id, detailed, table))
+        return float(loaded_at), rows
+
+    async def load_cards(self) -> tuple[list[dict[str, Any]], float] | None:
+        """Return (card summaries, loaded_at), or None if no replica has loaded them"""
+        try:
+            async with self.state.redis.pipeline(transaction=False) as pipe:
+                pipe.get(self.state.key("catalog", "cards"))
+                pipe.get(self.state.key("catalog", "cards_at"))
+                cards, loaded_at = await pipe.execute()
+        except self.state.errors as e:
+            self.state.failed("loading the card catalog", e)
+            return None
+        if cards is None or loaded_at is None:
+            return None
+        return json.loads(cards), float(loaded_at)
+
+    async def save_tables(
+        self,
+        database_id: int | None,
+        tables: list[dict[str, Any]],
+        detailed: bool,
+        removed: set[int] | frozenset[int],
+        loaded_at: float | None,
+    ) -> None:
+        by_database: dict[Any, dict[int, str]] = {}
+        for table in tables:
+            owner = database_id or table.get("db_id")
+            by_database.setdefault(owner, {})[table["id"]] = json.dumps([detailed, table])
+        try:
+            async with self.state.redis.pipeline(transaction=False) as pipe:
+                if removed:
+                    pipe.hdel(self.state.key("catalog", "tables", database_id), *removed)
+                for owner, mapping in by_database.items():
+                    pipe.hset(self.state.key("catalog", "tables", owner), mapping=mapping)
+                if loaded_at is not None:
+                    pipe.hset(self.state.key("catalog", "databases"), database_id, loaded_at)
+                await pipe.execute()
+        except self.state.errors as e:
+            self.state.failed("saving the metadata catalog", e)
+
+    async def save_cards(self, cards: list[dict[str, Any]], loaded_at: float) -> None:
+        try:
+            async with self.state.redis.pipeline(transaction=False) as pipe:
+                pipe.set(self.state.key("catalog", "cards"), json.dumps(cards))
+                pipe.set(self.state.key("catalog", "cards_at"), loaded_at)
+                await pipe.execute()
+        except self.state.errors as e:
+            self.state.failed("saving the card catalog", e)
+
+    async def close(self) -> None:
+        # The connection belongs to the client's RedisState
+        pass
+
+
+class MetadataCatalog:
+    """Table and field metadata for one Metabase instance
+
+    Each database's schema is loaded once from /database/{id}/metadata, kept in an
+    in-memory index and persisted to a store (SQLite, or Redis shared by every replica) so
+    restarts start warm. Metadata older than the refresh interval is served as-is while an
+    incremental refresh runs in the background: /table is listed and only new or changed
+    tables are refetched.
+    """
+
+    def __init__(
+        self,
+        client: "MetabaseClient",
+        store: "SqliteCatalogStore | RedisCatalogStore | None",
+        refresh_interval: float,
+    ):
+        self.client = client
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._opened = False
+        self._open_lock = asyncio.Lock()
+        self._tables: dict[int, Table] = {}
+        # Tables whose payload came from /table/{id}/query_metadata
+        self._detailed: set[int] = set()
+        # When tables fetched one by one, outside a loaded database, were last fetched
+        self._fetched_at: dict[int, float] = {}
+        self._table_tasks: dict[int, asyncio.Task] = {}
+        self._by_database: dict[int, set[int]] = {}
+        self._loaded_at: dict[int, float] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._background: dict[int, asyncio.Task] = {}
+        self._cards: dict[int, Card] = {}
+        self._cards_loaded_at: float | None = None
+        self._cards_lock = asyncio.Lock()
+        self._cards_task: asyncio.Task | None = None
+        self._database_ids: list[int] = []
+        self._database_ids_at = 0.0
+        self._search_index: SearchIndex | None = None
+        self._search_index_version = -1
+
+    @property
+    def path(self) -> str | None:
+        return self.store.path if self.store is not None else None
+
+    async def tables(self, database_id: int) -> list[Table]:
+        """Return every table of a database, fields included"""
+        await self._ensure_loaded(database_id)
+        return [self._tables[table_id] for table_id in self._by_database.get(database_id, ())]
+
+    async def table(self, table_id: int) -> Table:
+        """Return the query metadata of a table, fetching it only on first use"""
+        await self._open()
+        if table_id not in self._detailed:
+            await self._fetch_table(table_id)
+        elif (database_id := self._tables[table_id].db_id) in self._loaded_at:
+            self._refresh_if_stale(database_id)
+        else:
+            self._refresh_table_if_stale(table_id)
+        return self._tables[table_id]
+
+    async def all_tables(self) -> list[Table]:
+        """Return the tables of every database, loading databases not yet in the catalog"""
+        if time.time() - self._database_ids_at >= self.refresh_interval:
+            databases = await self.client.request("GET", "/database")
+            if isinstance(databases, dict):
+                databases = databases.get("data", [])
+            self._database_ids = [database["id"] for database in databases]
+            self._database_ids_at = time.time()
+        for database_id in self._database_ids:
+            await self._ensure_loaded(database_id)
+        return list(self._tables.values())
+
+    async def cards(self) -> list[Card]:
+        """Return summaries of every saved card, fetching /card only when stale"""
+        await self._open()
+        if self._cards_loaded_at is None:
+            async with self._cards_lock:
+                if self._cards_loaded_at is None:
+                    await self.refresh_cards()
+        elif time.time() - self._cards_loaded_at >= self.refresh_interval and (
+            self._cards_task is None or self._cards_task.done()
+        ):
+            self._cards_task = asyncio.create_task(self._background_refresh_cards())
+        return list(self._cards.values())
+
+    async def refresh_cards(self) -> dict[str, Any]:
+        """Refetch /card and replace the card summaries"""
+        cards = [Card.from_api(card) for card in await self.client.request("GET", "/card")]
+        self._set_cards(cards, time.time())
+        if self.store is not None:
+            await self.store.save_cards([card.to_dict() for card in cards], self._cards_loaded_at)
+        return {"mode": "cards", "cards": len(cards)}
+
+    async def search(
+        self, query: str, database_id: int | None = None, top_k: int = 10
+    ) -> list[dict[str, Any]]:
+        """Rank tables, fields and cards against a free-text query"""
+        if database_id is None:
+            await self.all_tables()
+        else:
+            await self._ensure_loaded(database_id)
+        await self.cards()
+
+        if self._search_index is None or self._search_index_version != self.version:
+            self._search_index = SearchIndex.build(self._tables.values(), self._cards.values())
+            self._search_index_version = self.version
+        return self._search_index.search(query, top_k=top_k, database_id=database_id)
+
+    async def refresh(self, database_id: int, full: bool = False) -> dict[str, Any]:
+        """Refresh a database's metadata, incrementally unless `full` or never loaded"""
+        await self._open()
+        async with self._lock(database_id):
+            if full or database_id not in self._loaded_at:
+                return await self._full_refresh(database_id)
+            return await self._incremental_refresh(database_id)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": self.path,
+            "shared": self.store is not None and self.store.shared,
+            "databases": {
+                database_id: {
+                    "tables": len(self._by_database.get(database_id, ())),
+                    "age_seconds": round(time.time() - loaded_at, 1),
+                }
+                for database_id, loaded_at in self._loaded_at.items()
+            },
+        }
+
+    async def _ensure_loaded(self, database_id: int) -> None:
+        await self._open()
+        if database_id not in self._loaded_at:
+            async with self._lock(database_id):
+                if database_id not in self._loaded_at and not await self._adopt(database_id):
+                    await self._full_refresh(database_id)
+        else:
+            self._refresh_if_stale(database_id)
+
+    async def _fetch_table(self, table_id: int) -> None:
+        payload = await self.client.request("GET", f"/table/{table_id}/query_metadata")
+        await self._store(payload.get("db_id"), [payload], detailed=True)
+        self._fetched_at[table_id] = time.time()
+
+    def _refresh_table_if_stale(self, table_id: int) -> None:
+        """Refetch a table in the background when it is past the refresh interval
+
+        Covers tables whose database was never fully loaded, which database refreshes
+        skip. Tables restored from the catalog file count as stale.
+        """
+        if time.time() - self._fetched_at.get(table_id, 0.0) < self.refresh_interval:
+            return
+        task = self._table_tasks.get(table_id)
+        if task is None or task.done():
+            self._table_tasks[table_id] = asyncio.create_task(
+                self._background_refresh_table(table_id)
+            )
+
+    def _refresh_if_stale(self, database_id: int | None) -> None:
+        """Start a background refresh when the database's metadata is past its interval"""
+        loaded_at = self._loaded_at.get(database_id)
+        if loaded_at is None or time.time() - loaded_at < self.refresh_interval:
+            return
+        task = self._background.get(database_id)
+        if task is None or task.done():
+            self._background[database_id] = asyncio.create_task(
+                self._background_refresh(database_id)
+            )
+
+    async def _background_refresh_cards(self) -> None:
+        try:
+            if await self._adopt_cards():
+                return
+            await self.refresh_cards()
+        except Exception as e:
+            logger.warning(f"Background card catalog refresh failed: {e}")
+
+    async def _background_refresh_table(self, table_id: int) -> None:
+        try:
+            await self._fetch_table(table_id)
+        except Exception as e:
+            logger.warning(f"Background catalog refresh for table {table_id} failed: {e}")
+
+    async def _background_refresh(self, database_id: int) -> None:
+        try:
+            if await self._adopt(database_id, fresh=True):
+                return
+            result = await self.refresh(database_id)
+            logger.info(f"Refreshed metadata catalog for database {database_id}: {result}")
+        except Exception as e:
+            logger.warning(f"Background catalog refresh for database {database_id} failed: {e}")
+
+    async def _adopt(self, database_id: int, fresh: bool = False) -> bool:
+        """Take a database's metadata from the shared store if another replica loaded it later
+
+        With `fresh`, only a copy still within the refresh interval is taken.
+        """
+        if self.store is None or not self.store.shared:
+            return False
+        database = await self.store.load_database(database_id)
+        if database is None:
+            return False
+        loaded_at, rows = database
+        if loaded_at <= self._loaded_at.get(database_id, 0.0) or (
+            fresh and time.time() - loaded_at >= self.refresh_interval
+        ):
+            return False
+        current = {table["id"] for _, _, table in rows}
+        self._index(database_id, [], False, self._by_database.get(database_id, set()) - current)
+        for _, detailed, table in rows:
+            self._index(database_id, [table], detailed)
+        self._loaded_at[database_id] = loaded_at
+        self.version += 1
+        return True
+
+    async def _adopt_cards(self) -> bool:
+        """Take the card summaries from the shared store if they are newer and still fresh"""
+        if self.store is None or not self.store.shared:
+            return False
+        cards = await self.store.load_cards()
+        if cards is None:
+            return False
+        summaries, loaded_at = cards
+        if loaded_at <= (self._cards_loaded_at or 0.0) or (
+            time.time() - loaded_at >= self.refresh_interval
+        ):
+            return False
+        self._set_cards([Card.from_dict(card) for card in summaries], loaded_at)
+        return True
+
+    async def _full_refresh(self, database_id: int) -> dict[str, Any]:
+        metadata = await self.client.request("GET", f"/database/{database_id}/metadata")
+        tables = metadata.get("tables", [])
+        removed = self._by_database.get(database_id, set()) - {table["id"] for table in tables}
+        await self._store(database_id, tables, detailed=False, removed=removed, complete=True)
+        return {
+            "database_id": database_id,
+            "mode": "full",
+            "tables": len(tables),
+            "updated": len(tables),
+            "removed": len(removed),
+        }
+
+    async def _incremental_refresh(self, database_id: int) -> dict[str, Any]:
+        listing = await self.client.request("GET", "/table")
+        current = {table["id"]: table for table in listing if table.get("db_id") == database_id}
+        changed = [
+            table_id
+            for table_id, table in current.items()
+            if table_id not in self._tables
+            or self._tables[table_id].updated_at != table.get("updated_at")
+        ]
+        removed = self._by_database.get(database_id, set()) - current.keys()
+
+        # Refetching most of the schema table by table is slower than one full fetch
+        if len(changed) * 2 > len(current):
+            return await self._full_refresh(database_id)
+
+        semaphore = asyncio.Semaphore(CATALOG_FETCH_CONCURRENCY)
+
+        async def fetch(table_id: int) -> dict[str, Any]:
+            async with semaphore:
+                return await self.client.request("GET", f"/table/{table_id}/query_metadata")
+
+        payloads = await asyncio.gather(*(fetch(table_id) for table_id in changed))
+        await self._store(database_id, payloads, detailed=True, removed=removed, complete=True)
+        return {
+            "database_id": database_id,
+            "mode": "incremental",
+            "tables": len(current),
+            "updated": len(changed),
+            "removed": len(removed),
+        }
+
+    async def _store(
+        self,
+        database_id: int | None,
+        tables: list[dict[str, Any]],
+        detailed: bool,
+        removed: set[int] | frozenset[int] = frozenset(),
+        complete: bool = False,
+    ) -> None:
+        """Update the in-memory index and persist the change
+
+        `complete` marks the database as fully loaded as of now.
+        """
+        self._index(database_id, tables, detailed, removed)
+        if complete:
+            self._loaded_at[database_id] = time.time()
+        self.version += 1
+
+        if self.store is not None:
+            loaded_at = self._loaded_at[database_id] if complete else None
+            await self.store.save_tables(database_id, tables, detailed, removed, loaded_at)
+
+    def _index(
+        self,
+        database_id: int | None,
+        tables: list[dict[str, Any]],
+        detailed: bool,
+        removed: set[int] | frozenset[int] = frozenset(),
+    ) -> None:
+        for table_id in removed:
+            self._tables.pop(table_id, None)
+            self._detailed.discard(table_id)
+            self._fetched_at.pop(table_id, None)
+            self._by_database.get(database_id, set()).discard(table_id)
+
+        for table in tables:
+            table_id = table["id"]
+            self._tables[table_id] = Table.from_dict(table)
+            if detailed:
+                self._detailed.add(table_id)
+            else:
+                self._detailed.discard(table_id)
+            if database_id is not None:
+                self._by_database.setdefault(database_id, set()).add(table_id)
+
+    def _set_cards(self, cards: list[Card], loaded_at: float) -> None:
+        self._cards = {card.id: card for card in cards}
+        self._cards_loaded_at = loaded_at
+        self.version += 1
+
+    async def _open(self) -> None:
+        """Load the persisted catalog into memory on first use"""
+        if self._opened:
+            return
+        async with self._open_lock:
+            if self._opened:
+                return
+            snapshot = await self.store.load() if self.store is not None else None
+            if snapshot is not None:
+                self._loaded_at.update(snapshot["databases"])
+                for database_id, detailed, table in snapshot["tables"]:
+                    self._index(database_id, [table], detailed)
+                self._cards = {card["id"]: Card.from_dict(card) for card in snapshot["cards"]}
+                self._cards_loaded_at = snapshot["cards_at"]
+                logger.info(
+                    f"Loaded {len(self._tables)} tables from metadata catalog at "
+                    f"{self.path or 'the shared state'}"
+                )
+            self._opened = True
+
+    def _lock(self, database_id: int) -> asyncio.Lock:
+        return self._locks.setdefault(database_id, asyncio.Lock())
+
+    async def close(self) -> None:
+        for task in [*self._background.values(), *self._table_tasks.values(), self._cards_task]:
+            if task is not None:
+                task.cancel()
+        if self.store is not None:
+            await self.store.close()
+
+
+_SEARCH_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _search_tokens(text: str | None) -> list[str]:
+    """Lowercase alphanumeric tokens; snake_case and camelCase names split into words"""
+    if not text:
+        return []
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    return _SEARCH_TOKEN_RE.findall(text.lower())
+
+
+def _trigrams(term: str) -> set[str]:
+    padded = f"  {term} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Inverted index over tables, fields and cards with BM25 ranking
+
+    Query terms missing from the vocabulary are expanded to longer terms they prefix and
+    to similarly spelled terms (typos), found through a trigram index and weighted by
+    similarity.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    MIN_SIMILARITY = 0.8
+
+    def __init__(self):
+        self.docs: list[dict[str, Any]] = []
+        self.doc_lengths: list[float] = []
+        self.postings: dict[str, dict[int, float]] = {}
+        self.trigrams: dict[str, set[str]] = {}
+
+    @classmethod
+    def build(cls, tables: Any, cards: Any) -> "SearchIndex":
+        index = cls()
+        for table in tables:
+            index.add(
+                {
+                    "kind": "table",
+                    "id": table.get("id"),
+                    "name": table.get("name"),
+                    "display_name": table.get("display_name"),
+                    "schema": table.get("schema"),
+                    "database_id": table.get("db_id"),
+                },
+                [
+                    (table.get("name"), 3.0),
+                    (table.get("display_name"), 2.0),
+                    (table.get("schema"), 0.5),
+                    (table.get("description"), 1.0),
+                ],
+            )
+            for field in table.get("fields") or []:
+                index.add(
+                    {
+                        "kind": "field",
+                        "id": field.get("id"),
+                        "name": field.get("name"),
+                        "display_name": field.get("display_name"),
+                        "table_id": table.get("id"),
+                        "table_name": table.get("name"),
+                        "database_id": table.get("db_id"),
+                    },
+                    [
+                        (field.get("name"), 3.0),
+                        (field.get("display_name"), 2.0),
+                        (field.get("description"), 1.0),
+                    ],
+                )
+        for card in cards:
+            if card.get("archived"):
+                continue
+            index.add(
+                {
+                    "kind": "card",
+                    "id": card.get("id"),
+                    "name": card.get("name"),
+                    "collection_id": card.get("collection_id"),
+                    "database_id": card.get("database_id"),
+                },
+                [
+                    (card.get("name"), 3.0),
+                    (card.get("description"), 1.0),
+                    (card.get("native_query"), 0.5),
+                ],
+            )
+        index.finalize()
+        return index
+
+    def add(self, doc: dict[str, Any], fields: list[tuple[str | None, float]]) -> None:
+        """Index a document; each text field's term frequencies are scaled by its weight"""
+        doc_id = len(self.docs)
+        self.docs.append(doc)
+        length = 0.0
+        for text, weight in fields:
+            for token in _search_tokens(text):
+                postings = self.postings.setdefault(token, {})
+                postings[doc_id] = postings.get(doc_id, 0.0) + weight
+                length += weight
+        self.doc_lengths.append(length)
+
+    def finalize(self) -> None:
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.docs else 0.0
+        for term in self.postings:
+            for trigram in _trigrams(term):
+                self.trigrams.setdefault(trigram, set()).add(term)
+
+    def search(
+        self, query: str, top_k: int = 10, database_id: int | None = None
+    ) -> list[dict[str, Any]]:
+        scores: dict[int, float] = {}
+        for token in _search_tokens(query):
+            for term, similarity in self._expand(token):
+                postings = self.postings[term]
+                idf = math.log(1 + (len(self.docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length_ratio = self.doc_lengths[doc_id] / self.avg_length
+                    norm = self.K1 * (1 - self.B + self.B * length_ratio)
+                    bm25 = idf * tf * (self.K1 + 1) / (tf + norm)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + similarity * bm25
+
+        if database_id is not None:
+            scores = {
+                doc_id: score
+                for doc_id, score in scores.items()
+                if self.docs[doc_id].get("database_id") == database_id
+            }
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [{**self.docs[doc_id], "score": round(score, 3)} for doc_id, score in ranked]
+
+    def _expand(self, token: str) -> list[tuple[str, float]]:
+        """Vocabulary terms matching a query token, with a similarity weight"""
+        if token in self.postings:
+            return [(token, 1.0)]
+
+        import difflib
+
+        query_trigrams = _trigrams(token)
+        candidates: set[str] = set()
+        for trigram in query_trigrams:
+            candidates |= self.trigrams.get(trigram, set())
+
+        expanded = []
+        for term in candidates:
+            if len(token) >= 3 and term.startswith(token):
+                similarity = 0.8
+            else:
+                similarity = difflib.SequenceMatcher(None, token, term).ratio()
+            if similarity >= self.MIN_SIMILARITY:
+                expanded.append((term, similarity))
+        return expanded
+
+
+# Global state; the Metabase client is created on first use (see get_client)
+_metabase_clients: dict[str, MetabaseClient] = {}
+local_database = LocalDatabase(memory_limit=settings.local_memory_limit)
+query_jobs = JobManager(
+    max_finished=settings.job_max_finished,
+    result_ttl=settings.job_result_ttl,
+    timeout=settings.job_timeout,
+    max_running=settings.job_max_running,
+)
+query_streams = StreamRegistry(
+    max_open=settings.stream_max_open, idle_timeout=settings.stream_idle_timeout
+)
+named_queries = NamedQueryRegistry(settings.reports_dir)
+
+
+def get_client(instance: str | None = None) -> MetabaseClient:
+    """Return the client of a Metabase instance, creating it on first use
+
+    Building a client validates its connection settings and sets up its HTTP pool, so a
+    server that is only spawned and listed never pays for either. Each instance has its
+    own pool, authentication, result cache and metadata catalog.
+    """
+    name = instance or settings.default_instance
+    client = _metabase_clients.get(name)
+    if client is None:
+        client = _metabase_clients[name] = MetabaseClient(settings.for_instance(name))
+    return client
+
+
+def __getattr__(name: str) -> Any:
+    # Keeps `from server import metabase_client` working for scripts
+    if name == "metabase_client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Tool implementations
+@mcp.tool
+@instrumented
+async def list_instances() -> dict[str, Any]:
+    """List the Metabase instances this server can query
+
+    Pass an instance's name as the `instance` argument of the other tools to use it.
+    """
+    try:
+        return {
+            "default": settings.default_instance,
+            "instances": [
+                {
+                    "name": name,
+                    "url": settings.for_instance(name).url,
+                    "connected": name in _metabase_clients,
+                }
+                for name in settings.instances or [DEFAULT_INSTANCE]
+            ],
+        }
+    except Exception as e:
+        logger.error(f"Error listing Metabase instances: {e}")
+        raise
+
+
+@mcp.tool
+@instrumented
+async def list_databases(instance: str | None = None) -> dict[str, Any]:
+    """List all databases in Metabase
+
+    Args:
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
+    try:
+        result = await get_client(instance).request("GET", "/database")
+        databases = result.get("data") if isinstance(result, dict) else None
+        max_bytes = settings.response_max_bytes
+        if isinstance(databases, list) and max_bytes > 0 and _json_size(result) > max_bytes:
+            result = {
+                **result,
+                "data": [],
+                "truncated": True,
+                "omitted": {"items": len(databases), "max_bytes": max_bytes},
+            }
+            kept = max(1, fitting_items(databases, max_bytes - _json_size(result)))
+            result["data"] = databases[:kept]
+            result["omitted"]["items"] = len(databases) - kept
+        return result
+    except Exception as e:
+        logger.error(f"Error listing databases: {e}")
+        raise
+
+
+@mcp.tool
+@instrumented
+async def list_cards(
+    collection_id: int | None = None,
+    database_id: int | None = None,
+    fields: list[str] | None = None,
+    limit: int = 100,
+    cursor: str | None = None,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """List saved questions/cards in Metabase, a page at a time
+
+    Served from the metadata catalog's card summaries, so listing does not fetch /card
+    on every call; new cards appear after the catalog refresh interval or refresh_catalog.
+    Returns {"data": [...], "total": matching cards, "next_cursor": ...}.
+
+    Args:
+        collection_id: Only cards in this collection
+        database_id: Only cards querying this database
+        fields: Keys to return per card (default: id, name, collection_id,
+            collection_name, database_id, updated_at); also available: description,
+            display, archived, query_type, native_query
+        limit: Maximum cards per page (default: 100, max 1000)
+        cursor: The next_cursor of the previous page
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
+    try:
+        fields = fields or CARD_LIST_FIELDS
+        unknown = [key for key in fields if key not in CARD_SUMMARY_FIELDS]
+        if unknown:
+            raise ValueError(
+                f"Unknown card fields {', '.join(unknown)}; available: "
+                f"{', '.join(CARD_SUMMARY_FIELDS)}"
+            )
+        cards = await get_client(instance).catalog.cards()
+        if collection_id is not None:
+            cards = [card for card in cards if card.get("collection_id") == collection_id]
+        if database_id is not None:
+            cards = [card for card in cards if card.get("database_id") == database_id]
+        return page_list(cards, fields, limit, cursor, settings.response_max_bytes)
+    except Exception as e:
+        logger.error(f"Error listing cards: {e}")
+        raise
+
+
+@mcp.tool
+@instrumented
+async def execute_card(
+    card_id: int,
+    parameters: dict[str, Any] | None = None,
+    use_cache: bool = True,
+    output_format: str = "rows",
+    dictionary_encode: bool = True,
+    columns: list[str] | None = None,
+    filters: list[dict[str, Any]] | None = None,
+    group_by: list[str] | None = None,
+    sort_by: str | None = None,
+    descending: bool = True,
+    limit: int | None = None,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """Execute a Metabase question/card and get results
+
+    Use columns, filters, group_by, sort_by and limit to compute totals or pick top rows
+    on the server instead of receiving the whole result.
+
+    Args:
+        card_id: The ID of the card to execute
+        parameters: Optional card parameters
+        use_cache: Serve a recent identical result from the server cache (default: True)
+        output_format: "rows" (Metabase response), "columnar" (compact per-column arrays),
+            "arrow" or "parquet" (base64 bytes for programmatic callers)
+        dictionary_encode: Dictionary encode repeated strings in columnar output (default: True)
+        columns: Only return these columns
+        filters: Keep rows matching every condition, e.g.
+            [{"column": "platform", "op": "=", "value": "google"}]; ops: =, !=, >, >=,
+            <, <=, in, not in, contains, is null, not null
+        group_by: Return one row per group with the sum of each numeric column and a count
+        sort_by: Sort rows by this column (with limit: top-k rows)
+        descending: Sort in descending order (default: True)
+        limit: Return at most this many rows
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+
+    Results over METABASE_RESPONSE_MAX_BYTES keep their first rows, with "truncated" set
+    and "omitted" giving the number of rows left out and numeric column summaries.
+    """
+    try:
+        result = await get_client(instance).execute_card(card_id, parameters, use_cache=use_cache)
+        result = transform_result(
+            result, columns, filters, group_by, sort_by, descending=descending, limit=limit
+        )
+        result = budget_result(result, settings.response_max_bytes)
+        return encode_result(result, output_format, dictionary_encode)
+    except Exception as e:
+        logger.error(f"Error executing card {card_id}: {e}")
+        raise
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 
-# Get Metabase configuration from environment variables
-METABASE_URL = os.getenv("METABASE_URL")
-METABASE_USER_EMAIL = os.getenv("METABASE_USER_EMAIL")
-METABASE_PASSWORD = os.getenv("METABASE_PASSWORD")
-METABASE_API_KEY = os.getenv("METABASE_API_KEY")
+@mcp.tool
+@instrumented
+async def execute_query(
+    database_id: int,
+    query: str,
+    native_parameters: list[dict[str, Any]] | None = None,
+    use_cache: bool = True,
+    output_format: str = "rows",
+    dictionary_encode: bool = True,
+    columns: list[str] | None = None,
+    filters: list[dict[str, Any]] | None = None,
+    group_by: list[str] | None = None,
+    sort_by: str | None = None,
+    descending: bool = True,
+    limit: int | None = None,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """Execute a SQL query against a Metabase database
 
-if not METABASE_URL or (
-    not METABASE_API_KEY and (not METABASE_USER_EMAIL or not METABASE_PASSWORD)
-):
-    raise ValueError(
-        "METABASE_URL is required, and either METABASE_API_KEY or both METABASE_USER_EMAIL and METABASE_PASSWORD must be provided"
-    )
+    Use columns, filters, group_by, sort_by and limit to post-process the result on the
+    server; for large results, aggregating in SQL is faster still.
 
+    Args:
+        database_id: The ID of the database to query
+        query: The native SQL query
+        native_parameters: Optional native query parameters
+        use_cache: Serve a recent identical result from the server cache (default: True)
+        output_format: "rows" (Metabase response), "columnar" (compact per-column arrays),
+            "arrow" or "parquet" (base64 bytes for programmatic callers)
+        dictionary_encode: Dictionary encode repeated strings in columnar output (default: True)
+        columns: Only return these columns
+        filters: Keep rows matching every condition, e.g.
+            [{"column": "platform", "op": "=", "value": "google"}]; ops: =, !=, >, >=,
+            <, <=, in, not in, contains, is null, not null
+        group_by: Return one row per group with the sum of each numeric column and a count
+        sort_by: Sort rows by this column (with limit: top-k rows)
+        descending: Sort in descending order (default: True)
+        limit: Return at most this many rows
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
 
-# Authentication method enum
-class AuthMethod(Enum):
-    SESSION = "session"
-    API_KEY = "api_key"
+    Results over METABASE_RESPONSE_MAX_BYTES keep their first rows, with "truncated" set
+    and "omitted" giving the number of rows left out and numeric column summaries.
+    """
+    try:
+        result = await get_client(instance).execute_query(
+            database_id, query, native_parameters, use_cache=use_cache
+        )
+        result = transform_result(
+            result, columns, filters, group_by, sort_by, descending=descending, limit=limit
+        )
+        result = budget_result(result, settings.response_max_bytes)
+        return encode_result(result, output_format, dictionary_encode)
+    except Exception as e:
+        logger.error(f"Error executing query: {e}")
+        raise
 
 
-# Initialize FastMCP server
-mcp = FastMCP(name="metabase-mcp")
+@mcp.tool
+@instrumented
+async def list_named_queries() -> list[dict[str, Any]]:
+    """List the report queries that execute_named_query runs, with their parameters
 
+    Each comes from a SQL file under reports/ (e.g. reports/daily/roas_tracker.metabase.sql).
+    Prefer them over pasting report SQL into execute_query.
+    """
+    try:
+        return [query.info() for query in named_queries.queries().values()]
+    except Exception as e:
+        logger.error(f"Error listing named queries: {e}")
+        raise
 
-class MetabaseClient:
-    """HTTP client for Metabase API operations"""
 
-    def __init__(self):
-        self.base_url = METABASE_URL.rstrip("/")
-        self.session_token: str | None = None
-        self.api_key: str | None = METABASE_API_KEY
-        self.auth_method = AuthMethod.API_KEY if METABASE_API_KEY else AuthMethod.SESSION
-        self.client = httpx.AsyncClient(timeout=30.0)
+@mcp.tool
+@instrumented
+async def execute_named_query(
+    name: str,
+    parameters: dict[str, Any] | None = None,
+    database_id: int | None = None,
+    use_cache: bool = True,
+    output_format: str = "rows",
+    dictionary_encode: bool = True,
+    columns: list[str] | None = None,
+    filters: list[dict[str, Any]] | None = None,
+    group_by: list[str] | None = None,
+    sort_by: str | None = None,
+    descending: bool = True,
+    limit: int | None = None,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """Run a report query by name, e.g. "roas_tracker.platform_comparison"
 
-        logger.info(f"Using {self.auth_method.value} authentication method")
+    Parameters fill the report's template tags; dates take YYYY-MM-DD, "today",
+    "yesterday" or "N days ago", and parameters left out use the report's defaults.
+    The resolved values are returned in "parameters".
 
-    async def _get_headers(self) -> dict[str, str]:
-        """Get appropriate authentication headers"""
-        headers = {"Content-Type": "application/json"}
+    Args:
+        name: Named query from list_named_queries
+        parameters: Template tag values, e.g. {"start_date": "7 days ago", "platform": "google"}
+        database_id: Database to run it on (default: the report's database)
+        use_cache: Serve a recent identical result from the server cache (default: True)
+        output_format: "rows", "columnar", "arrow" or "parquet"
+        dictionary_encode: Dictionary encode repeated strings in columnar output (default: True)
+        columns: Only return these columns
+        filters: Keep rows matching every condition, as in execute_query
+        group_by: Return one row per group with the sum of each numeric column and a count
+        sort_by: Sort rows by this column (with limit: top-k rows)
+        descending: Sort in descending order (default: True)
+        limit: Return at most this many rows
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
+    try:
+        query = named_queries.get(name)
+        database_id = database_id if database_id is not None else query.database_id
+        if database_id is None:
+            raise ValueError(f"{name} does not name its database; pass database_id")
+        resolved, template_tags, native_parameters = query.bind(parameters)
+        result = await get_client(instance).execute_query(
+            database_id,
+            query.sql,
+            native_parameters,
+            use_cache=use_cache,
+            template_tags=template_tags,
+        )
+        result = transform_result(
+            result, columns, filters, group_by, sort_by, descending=descending, limit=limit
+        )
+        result = budget_result(result, settings.response_max_bytes)
+        return {
+            **encode_result(result, output_format, dictionary_encode),
+            "named_query": name,
+            "parameters": resolved,
+        }
+    except Exception as e:
+        logger.error(f"Error executing named query {name}: {e}")
+        raise
 
-        if self.auth_method == AuthMethod.API_KEY and self.api_key:
-            headers["X-API-KEY"] = self.api_key
-        elif self.auth_method == AuthMethod.SESSION:
-            if not self.session_token:
-                await self._get_session_token()
-            if self.session_token:
-                headers["X-Metabase-Session"] = self.session_token
 
-        return headers
+@mcp.tool
+@instrumented
+async def execute_batch(
+    items: list[dict[str, Any]],
+    concurrency: int | None = None,
+    use_cache: bool = True,
+    output_format: str = "rows",
+    dictionary_encode: bool = True,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """Execute several cards and/or SQL queries concurrently in one call
 
-    async def _get_session_token(self) -> str:
-        """Get Metabase session token for email/password authentication"""
-        if self.auth_method == AuthMethod.API_KEY and self.api_key:
-            return self.api_key
+    Use this instead of repeated execute_card/execute_query calls, e.g. to load every
+    card of a dashboard: wall time is close to the slowest item. A failing item does
+    not fail the batch; check each item's status ("completed", "failed" for Metabase
+    query errors, "error" otherwise).
 
-        if not METABASE_USER_EMAIL or not METABASE_PASSWORD:
-            raise ValueError("Email and password required for session authentication")
+    Args:
+        items: List of {"card_id": int, "parameters": [...]} or
+            {"database_id": int, "query": str, "native_parameters": [...]} objects
+        concurrency: Maximum items executing at once (default: METABASE_BATCH_CONCURRENCY)
+        use_cache: Serve recent identical results from the server cache (default: True)
+        output_format: "rows", "columnar", "arrow" or "parquet", applied to every result
+        dictionary_encode: Dictionary encode repeated strings in columnar output (default: True)
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
+    try:
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"output_format must be one of {', '.join(OUTPUT_FORMATS)}")
+        started = time.perf_counter()
+        outcomes = await get_client(instance).execute_many(
+            items, concurrency=concurrency, use_cache=use_cache
+        )
+        # Every item gets an equal share of the response budget
+        max_bytes = settings.response_max_bytes // max(1, len(outcomes))
+        for outcome in outcomes:
+            if "result" in outcome:
+                result = budget_result(outcome["result"], max_bytes)
+                outcome["result"] = encode_result(result, output_format, dictionary_encode)
+        completed = sum(outcome["status"] == "completed" for outcome in outcomes)
+        return {
+            "results": outcomes,
+            "completed": completed,
+            "failed": len(outcomes) - completed,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    except Exception as e:
+        logger.error(f"Error executing batch of {len(items)} items: {e}")
+        raise
 
-        login_data = {"username": METABASE_USER_EMAIL, "password": METABASE_PASSWORD}
 
-        response = await self.client.post(f"{self.base_url}/api/session", json=login_data)
+@mcp.tool
+@instrumented
+async def execute_dashboard(
+    dashboard_id: int,
+    parameters: dict[str, Any] | None = None,
+    max_rows_per_card: int = 10,
+    concurrency: int | None = None,
+    use_cache: bool = True,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """Execute every card of a dashboard in parallel and return a compact snapshot
 
-        if response.status_code != 200:
-            error_data = response.json() if response.content else {}
-            raise Exception(f"Authentication failed: {response.status_code} - {error_data}")
+    Dashboard filters are applied to each card through the dashboard's own filter
+    mappings, exactly as in the Metabase UI. Each card reports its row count, column
+    names and its first rows; use execute_card or stream_query for complete results.
 
-        session_data = response.json()
-        self.session_token = session_data.get("id")
-        logger.info("Successfully obtained session token")
-        return self.session_token
+    Args:
+        dashboard_id: The ID of the dashboard to execute
+        parameters: Filter values keyed by filter slug, e.g.
+            {"date_range": "past7days", "platform": "google"}; omitted filters use
+            their dashboard default
+        max_rows_per_card: Rows included per card (default: 10); fewer when the cards'
+            rows are over METABASE_RESPONSE_MAX_BYTES
+        concurrency: Maximum cards executing at once (default: all cards at once)
+        use_cache: Serve recent identical results from the server cache (default: True)
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
+    try:
+        started = time.perf_counter()
+        dashboard, dashcards, outcomes = await get_client(instance).execute_dashboard(
+            dashboard_id, parameters, concurrency=concurrency, use_cache=use_cache
+        )
 
-    async def request(self, method: str, path: str, **kwargs) -> dict[str, Any]:
-        """Make authenticated request to Metabase API"""
-        url = f"{self.base_url}/api{path}"
-        headers = await self._get_headers()
+        # Every card gets an equal share of the response budget for its rows
+        max_bytes = settings.response_max_bytes // max(1, len(outcomes))
+        cards = []
+        for dashcard, outcome in zip(dashcards, outcomes):
+            card = dashcard.get("card") or {}
+            summary = {
+                "dashcard_id": dashcard["id"],
+                "card_id": dashcard["card_id"],
+                "name": card.get("name"),
+                "display": card.get("display"),
+                "status": outcome["status"],
+                "elapsed_ms": outcome["elapsed_ms"],
+            }
+            if "result" in outcome:
+                result = outcome["result"]
+                summary.update(
+                    row_count=result.envelope.get("row_count", result.row_count),
+                    columns=result.names,
+                    rows=result.rows(0, max(0, max_rows_per_card)),
+                    truncated=result.row_count > max_rows_per_card,
+                )
+                if max_bytes > 0 and _json_size(summary) > max_bytes:
+                    room = max_bytes - _json_size({**summary, "rows": []})
+                    summary["rows"] = summary["rows"][: fitting_items(summary["rows"], room)]
+                    summary["truncated"] = True
+            else:
+                summary["error"] = outcome.get("error")
+            cards.append(summary)
 
-        logger.debug(f"Making {method} request to {path}")
+        completed = sum(card["status"] == "completed" for card in cards)
+        return {
+            "dashboard_id": dashboard_id,
+            "name": dashboard.get("name"),
+            "parameters": {
+                parameter.get("slug", parameter["id"]): (parameters or {}).get(
+                    parameter.get("slug"),
+                    (parameters or {}).get(parameter["id"], parameter.get("default")),
+                )
+                for parameter in dashboard.get("parameters") or []
+            },
+            "cards": cards,
+            "completed": completed,
+            "failed": len(cards) - completed,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+    except Exception as e:
+        logger.error(f"Error executing dashboard {dashboard_id}: {e}")
+        raise
 
-        response = await self.client.request(method=method, url=url, headers=headers, **kwargs)
 
-        if not response.is_success:
-            error_data = response.json() if response.content else {}
-            error_message = (
-                f"API request failed with status {response.status_code}: {response.text}"
+@mcp.tool
+@instrumented
+async def stream_query(
+    database_id: int,
+    query: str,
+    native_parameters: list[dict[str, Any]] | None = None,
+    page_size: int = 500,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """Execute a SQL query and return its results page by page
+
+    Use this instead of execute_query for large results. Rows are streamed from
+    Metabase's CSV export and returned as strings. When `done` is false, pass the
+    returned `cursor` to fetch_query_page for the next page.
+
+    Args:
+        database_id: The ID of the database to query
+        query: The native SQL query
+        native_parameters: Optional native query parameters
+        page_size: Rows per page (default: 500, max: 10000)
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
+    try:
+        stream = await get_client(instance).open_query_stream(database_id, query, native_parameters)
+        cursor = await query_streams.add(stream)
+        return await _read_stream_page(cursor, stream, page_size)
+    except Exception as e:
+        logger.error(f"Error streaming query: {e}")
+        raise
+
+
+@mcp.tool
+@instrumented
+async def fetch_query_page(cursor: str, page_size: int = 500) -> dict[str, Any]:
+    """Fetch the next page of a streamed query result
+
+    Args:
+        cursor: The cursor returned by stream_query or a previous fetch_query_page call
+        page_size: Rows per page (default: 500, max: 10000)
+    """
+    try:
+        stream = await query_streams.get(cursor)
+        return await _read_stream_page(cursor, stream, page_size)
+    except Exception as e:
+        logger.error(f"Error fetching query page: {e}")
+        raise
+
+
+@mcp.tool
+@instrumented
+async def close_query_stream(cursor: str) -> dict[str, Any]:
+    """Close a streamed query result before reading all of its pages
+
+    Args:
+        cursor: The cursor returned by stream_query or fetch_query_page
+    """
+    try:
+        closed = await query_streams.close(cursor)
+        return {"cursor": cursor, "closed": closed}
+    except Exception as e:
+        logger.error(f"Error closing query stream: {e}")
+        raise
+
+
+@mcp.tool
+@instrumented
+async def register_local_table(
+    name: str,
+    card_id: int | None = None,
+    parameters: dict[str, Any] | None = None,
+    database_id: int | None = None,
+    query: str | None = None,
+    native_parameters: list[dict[str, Any]] | None = None,
+    use_cache: bool = True,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """Load a card's or SQL query's result into a local table for query_local
+
+    Give either card_id or database_id and query. Registering the same name again
+    replaces the table. Use this to join results from different databases, e.g. a
+    Supabase card with a MySQL replica query.
+
+    Args:
+        name: Table name to use in query_local (letters, digits and underscores)
+        card_id: The ID of a card to execute
+        parameters: Optional card parameters
+        database_id: The ID of the database to query
+        query: SQL query to execute in Metabase
+        native_parameters: Optional parameters for the query
+        use_cache: Serve a recent identical result from the server cache (default: True)
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
+    try:
+        if card_id is not None:
+            result = await get_client(instance).execute_card(
+                card_id, parameters, use_cache=use_cache
             )
-            logger.warning(f"{error_message} - {error_data}")
-            raise Exception(error_message)
+            source = {"card_id": card_id}
+        elif database_id is not None and query:
+            result = await get_client(instance).execute_query(
+                database_id, query, native_parameters, use_cache=use_cache
+            )
+            source = {"database_id": database_id, "query": normalize_sql(query)}
+        else:
+            raise ValueError("Give either card_id or database_id and query")
+        return await local_database.register(name, result, source)
+    except Exception as e:
+        logger.error(f"Error registering local table {name}: {e}")
+        raise
 
-        logger.debug(f"Successful response from {path}")
-        return response.json()
 
-    async def close(self):
-        """Close the HTTP client"""
-        await self.client.aclose()
+@mcp.tool
+@instrumented
+async def query_local(
+    sql: str,
+    limit: int = 1000,
+    output_format: str = "rows",
+    dictionary_encode: bool = True,
+) -> dict[str, Any]:
+    """Run DuckDB SQL over tables loaded with register_local_table
 
+    Runs in-process without calling Metabase, so joins across databases take
+    milliseconds. Date columns are loaded as text; use CAST(col AS DATE) to compare them.
 
-# Global client instance
-metabase_client = MetabaseClient()
+    Args:
+        sql: DuckDB SQL query
+        limit: Maximum rows to return (default: 1000); "truncated" is true if more exist
+        output_format: "rows", "columnar", "arrow" or "parquet"
+        dictionary_encode: Dictionary encode repeated strings in columnar output (default: True)
+    """
+    try:
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        result = QueryResult.from_response(await local_database.query(sql, limit))
+        result = budget_result(result, settings.response_max_bytes, LOCAL_PAGING_HINT)
+        return encode_result(result, output_format, dictionary_encode)
+    except Exception as e:
+        logger.error(f"Error running local query: {e}")
+        raise
 
 
-# Tool implementations
 @mcp.tool
-async def list_databases() -> dict[str, Any]:
-    """List all databases in Metabase"""
+@instrumented
+async def list_local_tables() -> list[dict[str, Any]]:
+    """List the tables available to query_local with their source, row count and columns"""
     try:
-        result = await metabase_client.request("GET", "/database")
-        return result
+        return list(local_database.tables.values())
     except Exception as e:
-        logger.error(f"Error listing databases: {e}")
+        logger.error(f"Error listing local tables: {e}")
         raise
 
 
 @mcp.tool
-async def list_cards() -> dict[str, Any]:
-    """List all questions/cards in Metabase"""
+@instrumented
+async def drop_local_table(name: str) -> dict[str, Any]:
+    """Drop a local table to free its memory
+
+    Args:
+        name: The table name given to register_local_table
+    """
     try:
-        result = await metabase_client.request("GET", "/card")
-        return result
+        return {"name": name, "dropped": await local_database.drop(name)}
     except Exception as e:
-        logger.error(f"Error listing cards: {e}")
+        logger.error(f"Error dropping local table {name}: {e}")
         raise
 
 
 @mcp.tool
-async def execute_card(card_id: int, parameters: dict[str, Any] | None = None) -> dict[str, Any]:
-    """Execute a Metabase question/card and get results"""
+@instrumented
+async def submit_query(
+    database_id: int,
+    query: str,
+    native_parameters: list[dict[str, Any]] | None = None,
+    use_cache: bool = True,
+    timeout_seconds: float | None = None,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """Start a long-running SQL query in the background and return a job id immediately
+
+    Use this for heavy reports that may take minutes. Poll get_job_status, then read the
+    rows page by page with get_job_result; cancel_job stops the query.
+
+    Args:
+        database_id: The ID of the database to query
+        query: SQL query to execute
+        native_parameters: Optional parameters for the query
+        use_cache: Serve a recent identical result from the server cache (default: True)
+        timeout_seconds: Give up after this many seconds (default: METABASE_JOB_TIMEOUT)
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
     try:
-        payload = {}
-        if parameters:
-            payload["parameters"] = parameters
 
-        result = await metabase_client.request("POST", f"/card/{card_id}/query", json=payload)
-        return result
+        async def run(timeout: float) -> QueryResult:
+            return await get_client(instance).execute_query(
+                database_id, query, native_parameters, use_cache=use_cache, timeout=timeout
+            )
+
+        summary = normalize_sql(query)
+        description = f"database {database_id}: {summary[:80]}{'...' if len(summary) > 80 else ''}"
+        job = query_jobs.submit(description, run, timeout=timeout_seconds)
+        return job.info()
     except Exception as e:
-        logger.error(f"Error executing card {card_id}: {e}")
+        logger.error(f"Error submitting query job: {e}")
         raise
 
 
 @mcp.tool
-async def execute_query(
-    database_id: int, query: str, native_parameters: list[dict[str, Any]] | None = None
+@instrumented
+async def get_job_status(job_id: str) -> dict[str, Any]:
+    """Get the status of a query job: running, completed, failed, timed_out or cancelled
+
+    Args:
+        job_id: The job id returned by submit_query
+    """
+    try:
+        return query_jobs.get(job_id).info()
+    except Exception as e:
+        logger.error(f"Error getting status of job {job_id}: {e}")
+        raise
+
+
+@mcp.tool
+@instrumented
+async def get_job_result(
+    job_id: str,
+    offset: int = 0,
+    limit: int = 1000,
+    output_format: str = "rows",
+    dictionary_encode: bool = True,
 ) -> dict[str, Any]:
-    """Execute a SQL query against a Metabase database"""
+    """Get a page of rows from a completed query job
+
+    Args:
+        job_id: The job id returned by submit_query
+        offset: Index of the first row to return (default: 0)
+        limit: Maximum rows to return (default: 1000, max 10000); fewer are returned when
+            the page is over METABASE_RESPONSE_MAX_BYTES
+        output_format: "rows", "columnar", "arrow" or "parquet"
+        dictionary_encode: Dictionary encode repeated strings in columnar output (default: True)
+    """
     try:
-        payload = {"database": database_id, "type": "native", "native": {"query": query}}
+        job = query_jobs.get(job_id)
+        if job.status != "completed":
+            raise ValueError(f"Job {job_id} is {job.status}, not completed")
+        if not 1 <= limit <= MAX_JOB_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_JOB_PAGE_SIZE}")
 
-        if native_parameters:
-            payload["native"]["parameters"] = native_parameters
+        offset = max(0, offset)
+        page = job.result.slice(offset, offset + limit)
+        page = budget_result(page, settings.response_max_bytes, JOB_PAGING_HINT)
+        end = offset + page.row_count
+        next_offset = end if end < job.result.row_count else None
+        return {
+            "job_id": job_id,
+            "offset": offset,
+            "row_count": job.result.row_count,
+            "next_offset": next_offset,
+            "result": encode_result(page, output_format, dictionary_encode),
+        }
+    except Exception as e:
+        logger.error(f"Error getting result of job {job_id}: {e}")
+        raise
 
-        result = await metabase_client.request("POST", "/dataset", json=payload)
-        return result
+
+@mcp.tool
+@instrumented
+async def cancel_job(job_id: str) -> dict[str, Any]:
+    """Cancel a running query job; Metabase stops the query when its request is closed
+
+    Args:
+        job_id: The job id returned by submit_query
+    """
+    try:
+        return (await query_jobs.cancel(job_id)).info()
     except Exception as e:
-        logger.error(f"Error executing query: {e}")
+        logger.error(f"Error cancelling job {job_id}: {e}")
         raise
 
 
 @mcp.tool
+@instrumented
 async def create_card(
     name: str,
     database_id: int,
@@ -187,8 +4517,19 @@ async def create_card(
     description: str | None = None,
     collection_id: int | None = None,
     visualization_settings: dict[str, Any] | None = None,
+    instance: str | None = None,
 ) -> dict[str, Any]:
-    """Create a new question/card in Metabase"""
+    """Create a new question/card in Metabase
+
+    Args:
+        name: Name of the card
+        database_id: The ID of the database the query runs against
+        query: The native SQL query
+        description: Optional card description
+        collection_id: Collection to save the card in (default: the root collection)
+        visualization_settings: Optional Metabase visualization settings
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
     try:
         payload = {
             "name": name,
@@ -207,7 +4548,7 @@ async def create_card(
         if collection_id is not None:
             payload["collection_id"] = collection_id
 
-        result = await metabase_client.request("POST", "/card", json=payload)
+        result = await get_client(instance).request("POST", "/card", json=payload)
         return result
     except Exception as e:
         logger.error(f"Error creating card: {e}")
@@ -215,24 +4556,63 @@ async def create_card(
 
 
 @mcp.tool
-async def list_collections() -> dict[str, Any]:
-    """List all collections in Metabase"""
+@instrumented
+async def list_collections(
+    parent_id: int | None = None,
+    fields: list[str] | None = None,
+    limit: int = 100,
+    cursor: str | None = None,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """List collections in Metabase, a page at a time
+
+    Returns {"data": [...], "total": matching collections, "next_cursor": ...}.
+
+    Args:
+        parent_id: Only direct children of this collection
+        fields: Keys to return per collection (default: id, name, description, location)
+        limit: Maximum collections per page (default: 100, max 1000)
+        cursor: The next_cursor of the previous page
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
     try:
-        result = await metabase_client.request("GET", "/collection")
-        return result
+        collections = await get_client(instance).request("GET", "/collection")
+        if parent_id is not None:
+            collections = [
+                collection
+                for collection in collections
+                if (collection.get("location") or "").endswith(f"/{parent_id}/")
+            ]
+        return page_list(
+            collections,
+            fields or COLLECTION_LIST_FIELDS,
+            limit,
+            cursor,
+            settings.response_max_bytes,
+        )
     except Exception as e:
         logger.error(f"Error listing collections: {e}")
         raise
 
 
 @mcp.tool
+@instrumented
 async def create_collection(
     name: str,
     description: str | None = None,
     color: str | None = None,
     parent_id: int | None = None,
+    instance: str | None = None,
 ) -> dict[str, Any]:
-    """Create a new collection in Metabase"""
+    """Create a new collection in Metabase
+
+    Args:
+        name: Name of the collection
+        description: Optional collection description
+        color: Optional collection color
+        parent_id: Parent collection (default: the root collection)
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
     try:
         payload = {"name": name}
 
@@ -243,7 +4623,7 @@ async def create_collection(
         if parent_id is not None:
             payload["parent_id"] = parent_id
 
-        result = await metabase_client.request("POST", "/collection", json=payload)
+        result = await get_client(instance).request("POST", "/collection", json=payload)
         return result
     except Exception as e:
         logger.error(f"Error creating collection: {e}")
@@ -251,13 +4631,17 @@ async def create_collection(
 
 
 @mcp.tool
-async def list_tables(database_id: int) -> str:
-    """List all tables in a database with formatted markdown output"""
+@instrumented
+async def list_tables(database_id: int, instance: str | None = None) -> str:
+    """List all tables in a database with formatted markdown output
+
+    Args:
+        database_id: The ID of the database
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
     try:
-        result = await metabase_client.request("GET", f"/database/{database_id}/metadata")
-        
-        # Extract tables from the metadata response
-        tables = result.get("tables", [])
+        # Served from the metadata catalog, which fetches the schema once per database
+        tables = await get_client(instance).catalog.tables(database_id)
         
         # Format tables with only the requested fields: table_id, display_name, description, entity_type
         formatted_tables = []
@@ -305,15 +4689,20 @@ async def list_tables(database_id: int) -> str:
 
 
 @mcp.tool
-async def get_table_fields(table_id: int, limit: int = 20) -> dict[str, Any]:
+@instrumented
+async def get_table_fields(
+    table_id: int, limit: int = 20, instance: str | None = None
+) -> dict[str, Any]:
     """Get all fields/columns in a table
     
     Args:
         table_id: The ID of the table
-        limit: Maximum number of fields to return (default: 20)
+        limit: Maximum number of fields to return (default: 20); fewer are returned when
+            they are over METABASE_RESPONSE_MAX_BYTES
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
     """
     try:
-        result = await metabase_client.request("GET", f"/table/{table_id}/query_metadata")
+        result = (await get_client(instance).catalog.table(table_id)).to_dict()
         
         # Apply field limiting if limit > 0 and there are more fields than the limit
         if limit > 0 and "fields" in result and len(result["fields"]) > limit:
@@ -322,21 +4711,248 @@ async def get_table_fields(table_id: int, limit: int = 20) -> dict[str, Any]:
             result["_truncated"] = True
             result["_total_fields"] = total_fields
             result["_limit_applied"] = limit
-        
+
+        # Then cut the fields down to the response budget
+        fields = result.get("fields") or []
+        max_bytes = settings.response_max_bytes
+        if fields and max_bytes > 0 and _json_size(result) > max_bytes:
+            overhead = _json_size({**result, "fields": []})
+            kept = max(1, fitting_items(fields, max_bytes - overhead))
+            if kept < len(fields):
+                result["_total_fields"] = result.get("_total_fields", len(fields))
+                result["fields"] = fields[:kept]
+                result["_truncated"] = True
+                result["_limit_applied"] = kept
+                result["_max_bytes"] = max_bytes
+
         return result
     except Exception as e:
         logger.error(f"Error getting table fields for table {table_id}: {e}")
         raise
 
 
+@mcp.tool
+@instrumented
+async def invalidate_cache(
+    database_id: int | None = None,
+    card_id: int | None = None,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """Invalidate cached query results
+
+    Call this after a warehouse refresh (e.g. scripts/refresh_ad_data.sql) so the next
+    query reads fresh data. With no arguments the whole cache is cleared.
+
+    Args:
+        database_id: Only drop results read from this database
+        card_id: Only drop results of this card
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
+    try:
+        cache = get_client(instance).cache
+        invalidated = await cache.invalidate(database_id=database_id, card_id=card_id)
+        logger.info(f"Invalidated {invalidated} cached results")
+        return {"invalidated": invalidated, "cache": cache.stats()}
+    except Exception as e:
+        logger.error(f"Error invalidating cache: {e}")
+        raise
+
+
+@mcp.custom_route("/health", methods=["GET"])
+async def health(request: Request) -> JSONResponse:
+    """Liveness endpoint for the SSE/HTTP transports, with Metabase client status
+
+    Only clients already created are reported (null before the first tool call), so
+    health checks neither build a client nor fail when Metabase is not configured.
+    """
+    default = _metabase_clients.get(settings.default_instance)
+    status = {"status": "ok", "metabase": default.stats() if default is not None else None}
+    if settings.instances:
+        status["instances"] = {name: client.stats() for name, client in _metabase_clients.items()}
+    return JSONResponse(status)
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """Prometheus metrics for the SSE/HTTP transports"""
+    counters: dict[str, dict[tuple, float]] = {}
+    gauges: dict[str, dict[tuple, float]] = {
+        "metabase_mcp_open_query_streams": {(): len(query_streams)},
+        "metabase_mcp_query_jobs": {(): len(query_jobs)},
+    }
+    # Client counters are sampled per Metabase instance
+    for name, metabase in _metabase_clients.items():
+        key = Metrics._key({"instance": name})
+        cache = metabase.cache.stats()
+        client = metabase.stats()
+        for metric, value in (
+            ("metabase_mcp_cache_hits_total", cache["hits"]),
+            ("metabase_mcp_cache_misses_total", cache["misses"]),
+            ("metabase_mcp_cache_evictions_total", cache["evictions"]),
+            ("metabase_mcp_http_retries_total", client["retries"]),
+            ("metabase_mcp_coalesced_requests_total", client["coalesced_requests"]),
+        ):
+            counters.setdefault(metric, {})[key] = value
+        for metric, value in (
+            ("metabase_mcp_cache_entries", cache["entries"]),
+            ("metabase_mcp_cache_bytes", cache["bytes"]),
+            ("metabase_mcp_cache_hit_ratio", cache["hit_ratio"]),
+            ("metabase_mcp_circuit_open", int(client["circuit_breaker"]["state"] != "closed")),
+        ):
+            # A Redis-backed cache does not track its occupancy
+            if value is not None:
+                gauges.setdefault(metric, {})[key] = value
+    return PlainTextResponse(
+        metrics.render(counters, gauges), media_type="text/plain; version=0.0.4"
+    )
+
+
+@mcp.tool
+@instrumented
+async def server_stats() -> dict[str, Any]:
+    """Get server performance statistics: per-tool and per-endpoint latency, errors and cache use
+
+    The same data is served in Prometheus format at /metrics on the SSE/HTTP transports.
+    Latency percentiles are upper bounds of histogram buckets.
+    """
+
+    def endpoint_name(labels: dict[str, str]) -> str:
+        endpoint = f"{labels['method']} {labels['endpoint']}"
+        return f"{labels['instance']} {endpoint}" if settings.instances else endpoint
+
+    try:
+        tool_calls: dict[str, dict[str, float]] = {}
+        for key, count in metrics.counters.get("metabase_mcp_tool_calls_total", {}).items():
+            labels = dict(key)
+            tool_calls.setdefault(labels["tool"], {})[labels["outcome"]] = count
+        http_statuses: dict[str, dict[str, float]] = {}
+        for key, count in metrics.counters.get("metabase_mcp_http_requests_total", {}).items():
+            labels = dict(key)
+            endpoint = endpoint_name(labels)
+            http_statuses.setdefault(endpoint, {})[labels["status"]] = count
+
+        tools = metrics.summary("metabase_mcp_tool_duration_seconds", "tool")
+        for tool, summary in tools.items():
+            summary["outcomes"] = tool_calls.get(tool, {})
+            sizes = metrics.histograms.get("metabase_mcp_tool_response_bytes", {})
+            histogram = sizes.get(Metrics._key({"tool": tool}))
+            if histogram is not None and histogram.count:
+                summary["mean_response_bytes"] = round(histogram.sum / histogram.count)
+        endpoints = {}
+        for key, histogram in metrics.histograms.get(
+            "metabase_mcp_http_request_duration_seconds", {}
+        ).items():
+            endpoint = endpoint_name(dict(key))
+            endpoints[endpoint] = {
+                "count": histogram.count,
+                "mean_ms": round(histogram.sum / histogram.count * 1000, 1),
+                "p99_ms_upper_bound": histogram.quantile(0.99) * 1000,
+                "statuses": http_statuses.get(endpoint, {}),
+            }
+        metabase = get_client()
+        stats = {
+            "metrics_enabled": metrics.enabled,
+            "tools": tools,
+            "metabase_endpoints": endpoints,
+            "cache": metabase.cache.stats(),
+            "client": metabase.stats(),
+            "open_query_streams": len(query_streams),
+            "query_jobs": len(query_jobs),
+        }
+        if settings.instances:
+            stats["instances"] = {
+                name: {"cache": client.cache.stats(), "client": client.stats()}
+                for name, client in _metabase_clients.items()
+            }
+        return stats
+    except Exception as e:
+        logger.error(f"Error collecting server stats: {e}")
+        raise
+
+
+@mcp.tool
+@instrumented
+async def search_schema(
+    query: str,
+    database_id: int | None = None,
+    top_k: int = 10,
+    instance: str | None = None,
+) -> list[dict[str, Any]]:
+    """Search tables, fields and saved cards by name, description or SQL
+
+    Results are ranked with BM25 and tolerate typos and partial words, so this is the
+    fastest way to find where data lives (e.g. "seller payout") without listing every
+    table. Each match has its kind (table, field or card) and the ids needed by
+    get_table_fields, execute_card or execute_query.
+
+    Args:
+        query: Free-text search terms
+        database_id: Only return tables and fields of this database (default: all databases)
+        top_k: Maximum number of matches (default: 10); fewer are returned when they
+            are over METABASE_RESPONSE_MAX_BYTES
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
+    try:
+        matches = await get_client(instance).catalog.search(
+            query, database_id=database_id, top_k=top_k
+        )
+        # Matches are ranked, so the budget drops the weakest
+        return matches[: max(1, fitting_items(matches, settings.response_max_bytes))]
+    except Exception as e:
+        logger.error(f"Error searching schema for {query!r}: {e}")
+        raise
+
+
+@mcp.tool
+@instrumented
+async def refresh_catalog(
+    database_id: int,
+    full: bool = False,
+    include_cards: bool = False,
+    instance: str | None = None,
+) -> dict[str, Any]:
+    """Refresh the cached schema metadata used by list_tables, get_table_fields and search_schema
+
+    Metadata also refreshes itself in the background once it is older than
+    METABASE_CATALOG_REFRESH_SECONDS; call this after schema changes that should be
+    visible immediately.
+
+    Args:
+        database_id: The ID of the database to refresh
+        full: Refetch the whole schema instead of only new or changed tables (default: False)
+        include_cards: Also refetch the saved card summaries searched by search_schema
+        instance: Metabase instance to use (default: METABASE_DEFAULT_INSTANCE)
+    """
+    try:
+        catalog = get_client(instance).catalog
+        result = await catalog.refresh(database_id, full=full)
+        if include_cards:
+            result["cards"] = (await catalog.refresh_cards())["cards"]
+        return result
+    except Exception as e:
+        logger.error(f"Error refreshing catalog for database {database_id}: {e}")
+        raise
+
+
 # Cleanup handler
 async def cleanup():
     """Clean up resources on shutdown"""
-    await metabase_client.close()
+    try:
+        await query_jobs.close_all()
+        await query_streams.close_all()
+        local_database.close()
+        for client in _metabase_clients.values():
+            await client.close()
+    finally:
+        # Flushes pending spans and closes the trace file
+        if tracer_provider is not None:
+            tracer_provider.shutdown()
 
 
 def main():
     """Main entry point for the server"""
+    # Configured here rather than at import so scripts importing this module keep theirs
+    logging.basicConfig(level=logging.INFO)
     try:
         # Support multiple transport methods
         import sys
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import httpx
+import pytest
+
+os.environ.setdefault("METABASE_URL", "http://metabase.test")
+os.environ.setdefault("METABASE_API_KEY", "test-key")
+os.environ["METABASE_CATALOG_PATH"] = "none"
+os.environ["METABASE_STATE_BACKEND"] = "memory"
+os.environ["METABASE_TRACING"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+BASE_URL = "http://metabase.test"
+
+
+def completed_query(rows: list[list] | None = None) -> dict:
+    """A minimal Metabase /dataset response"""
+    rows = [["google", 10.5], ["meta", 4.25]] if rows is None else rows
+    return {
+        "status": "completed",
+        "database_id": 1,
+        "row_count": len(rows),
+        "data": {
+            "cols": [
+                {"name": "platform", "base_type": "type/Text"},
+                {"name": "spend", "base_type": "type/Float"},
+            ],
+            "rows": rows,
+        },
+    }
+
+
+@pytest.fixture
+async def make_client():
+    """Build MetabaseClients whose HTTP calls go to a MockTransport handler
+
+    Keyword arguments override Settings attributes; passing user_email/password without
+    an api_key selects session authentication.
+    """
+    clients = []
+
+    def factory(handler, **overrides) -> server.MetabaseClient:
+        config = server.Settings()
+        config.url = BASE_URL
+        config.retry_base_delay = 0
+        config.retry_max_delay = 0
+        for name, value in overrides.items():
+            setattr(config, name, value)
+
+        client = server.MetabaseClient(config)
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        if client.session is not None:
+            client.session.client = client.client
+        clients.append(client)
+        return client
+
+    yield factory
+
+    for client in clients:
+        await client.close()
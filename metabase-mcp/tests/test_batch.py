@@ -0,0 +1,103 @@
+"""Batch execution of cards and native queries (MetabaseClient.execute_many)"""
+
+import asyncio
+import json
+
+import httpx
+from conftest import completed_query
+
+
+class CountingMetabase:
+    """Answers card and dataset queries, recording bodies and peak concurrency"""
+
+    def __init__(self):
+        self.bodies: dict[str, dict] = {}
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.running -= 1
+        body = json.loads(request.content or b"{}")
+        path = request.url.path.removeprefix("/api")
+        self.bodies[path if path != "/dataset" else body["native"]["query"]] = body
+        if path == "/card/404/query":
+            return httpx.Response(404, text="Not found")
+        if "missing_table" in json.dumps(body):
+            return httpx.Response(202, json={"status": "failed", "error": "Table not found"})
+        return httpx.Response(202, json=completed_query())
+
+
+async def test_items_run_concurrently_within_the_limit(make_client):
+    metabase = CountingMetabase()
+    client = make_client(metabase)
+    items = [{"card_id": card_id} for card_id in range(1, 7)]
+
+    outcomes = await client.execute_many(items, concurrency=2)
+
+    assert [outcome["index"] for outcome in outcomes] == list(range(6))
+    assert [outcome["card_id"] for outcome in outcomes] == list(range(1, 7))
+    assert all(outcome["status"] == "completed" for outcome in outcomes)
+    assert metabase.peak == 2
+
+
+async def test_parameters_are_sent_with_each_item(make_client):
+    metabase = CountingMetabase()
+    client = make_client(metabase)
+    card_parameters = [{"type": "category", "target": ["variable", ["template-tag", "p"]]}]
+    native_parameters = [{"type": "category", "value": "google"}]
+
+    await client.execute_many(
+        [
+            {"card_id": 7, "parameters": card_parameters},
+            {
+                "database_id": 2,
+                "query": "SELECT * FROM ad_spend",
+                "native_parameters": native_parameters,
+            },
+            {"dashboard_id": 3, "dashcard_id": 4, "card_id": 9},
+        ]
+    )
+
+    assert metabase.bodies["/card/7/query"] == {"parameters": card_parameters}
+    query = metabase.bodies["SELECT * FROM ad_spend"]
+    assert query["database"] == 2
+    assert query["native"]["parameters"] == native_parameters
+    assert metabase.bodies["/dashboard/3/dashcard/4/card/9/query"] == {"parameters": []}
+
+
+async def test_failures_are_reported_per_item(make_client):
+    client = make_client(CountingMetabase())
+
+    outcomes = await client.execute_many(
+        [
+            {"card_id": 1},
+            {"card_id": 404},
+            {"database_id": 1, "query": "SELECT * FROM missing_table"},
+            {"query": "SELECT 1"},
+        ]
+    )
+
+    assert [outcome["status"] for outcome in outcomes] == [
+        "completed",
+        "error",
+        "failed",
+        "error",
+    ]
+    assert "status 404" in outcomes[1]["error"]
+    assert outcomes[2]["error"] == "Table not found"
+    assert "need either card_id or database_id and query" in outcomes[3]["error"]
+    assert all("elapsed_ms" in outcome for outcome in outcomes)
+
+
+async def test_the_default_limit_comes_from_the_settings(make_client):
+    metabase = CountingMetabase()
+    client = make_client(metabase, batch_concurrency=3)
+
+    await client.execute_many([{"card_id": card_id} for card_id in range(10)])
+
+    assert metabase.peak == 3
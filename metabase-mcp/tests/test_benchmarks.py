@@ -0,0 +1,88 @@
+"""Benchmark harness: the stub Metabase and tool calls through the in-process MCP client"""
+
+import json
+import os
+import sys
+
+import httpx
+import pytest
+from fastmcp import Client
+
+import server
+
+sys.path.insert(0, os.path.join(os.path.dirname(server.__file__), "scripts"))
+
+import bench_tools  # noqa: E402
+import fake_metabase  # noqa: E402
+
+
+@pytest.fixture
+def stub(make_client, monkeypatch):
+    """Route the default client's requests to the stub Metabase app, with 5-row results"""
+    monkeypatch.setattr(fake_metabase, "ROWS", 5)
+    client = make_client(lambda request: httpx.Response(500))
+    client.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_metabase.app))
+    monkeypatch.setitem(server._metabase_clients, server.settings.default_instance, client)
+    return client
+
+
+def decoded(content: list) -> dict:
+    return json.loads(content[0].text)
+
+
+def test_stub_results_have_the_requested_size():
+    response = fake_metabase.dataset_response(3, database_id=2)
+
+    assert response["row_count"] == 3
+    assert response["database_id"] == 2
+    assert [col["name"] for col in response["data"]["cols"]] == [
+        "date",
+        "platform",
+        "campaign_key",
+        "total_spend",
+        "total_revenue",
+    ]
+    assert len(response["data"]["rows"]) == 3
+    assert fake_metabase.dataset_body(3, 2) is fake_metabase.dataset_body(3, 2)
+
+
+async def test_stub_serves_the_endpoints_the_server_uses():
+    transport = httpx.ASGITransport(app=fake_metabase.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://stub") as http:
+        session = await http.post("/api/session", json={})
+        card = await http.post("/api/card/7/query")
+        metadata = await http.get("/api/database/5/metadata")
+        dashboard = await http.get("/api/dashboard/25")
+
+    assert session.json() == {"id": "fake-session-token"}
+    assert card.status_code == 202
+    assert card.json()["row_count"] == fake_metabase.ROWS
+    assert len(metadata.json()["tables"]) == fake_metabase.TABLES
+    assert len(dashboard.json()["dashcards"]) == fake_metabase.DASHCARDS
+
+
+async def test_tools_are_driven_through_the_mcp_client(stub):
+    async with Client(server.mcp) as client:
+        query = await client.call_tool("execute_query", bench_tools.TOOLS["execute_query"][1](0))
+        card = await client.call_tool("execute_card", bench_tools.TOOLS["execute_card"][1](0))
+        tables = await client.call_tool("list_tables", {"database_id": 5})
+
+    assert decoded(query)["row_count"] == 5
+    assert len(decoded(query)["data"]["rows"]) == 5
+    assert decoded(card)["status"] == "completed"
+    assert "**Total Tables:** 50" in tables[0].text
+
+
+async def test_worker_reports_throughput_latency_and_memory(stub):
+    measured = await bench_tools.run_worker("execute_card", calls=6, concurrency=3)
+
+    assert set(measured) == {
+        "calls_per_second",
+        "p50_ms",
+        "p99_ms",
+        "peak_rss_mib",
+        "rss_growth_mib",
+    }
+    assert measured["calls_per_second"] > 0
+    assert 0 < measured["p50_ms"] <= measured["p99_ms"]
+    assert measured["peak_rss_mib"] > 0
@@ -0,0 +1,86 @@
+"""Response budget: query results and listings cut down to a size in bytes of JSON"""
+
+import pytest
+from conftest import completed_query
+
+import server
+
+
+def result(rows: int) -> server.QueryResult:
+    values = [[f"campaign-{index}", float(index) if index % 10 else None] for index in range(rows)]
+    return server.QueryResult.from_response(completed_query(values))
+
+
+def test_results_within_the_budget_are_unchanged():
+    small = result(5)
+
+    assert server.budget_result(small, 10_000) is small
+    assert server.budget_result(result(500), 0).row_count == 500
+
+
+def test_failed_results_are_unchanged():
+    failed = server.QueryResult.from_response({"status": "failed", "error": "Bad SQL"})
+
+    assert server.budget_result(failed, 10) is failed
+
+
+def test_large_results_keep_their_first_rows_within_the_budget():
+    large = result(500)
+
+    budgeted = server.budget_result(large, 2000)
+    encoded = budgeted.to_dict()
+
+    kept = len(encoded["data"]["rows"])
+    assert 0 < kept < 500
+    assert encoded["data"]["rows"] == large.rows()[:kept]
+    assert len(server.json_dumps(encoded)) <= 2000
+    assert encoded["truncated"] is True
+    assert encoded["row_count"] == 500
+    assert encoded["omitted"]["rows"] == 500 - kept
+    assert encoded["omitted"]["hint"] == server.QUERY_PAGING_HINT
+
+
+def test_omitted_rows_are_summarized_over_every_row():
+    budgeted = server.budget_result(result(500), 2000)
+
+    summary = budgeted.envelope["omitted"]["column_summaries"]
+    spend = [float(index) for index in range(500) if index % 10]
+    assert list(summary) == ["spend"]
+    assert summary["spend"] == {
+        "count": 450,
+        "nulls": 50,
+        "min": 1.0,
+        "max": 499.0,
+        "sum": sum(spend),
+        "mean": sum(spend) / 450,
+    }
+
+
+def test_fitting_items_counts_the_leading_items_that_fit():
+    items = [{"id": index} for index in range(10)]
+    one = len(server.json_dumps(items[0])) + 1
+
+    assert server.fitting_items(items, 2 + 3 * one) == 3
+    assert server.fitting_items(items, 2 + 3 * one - 1) == 2
+    assert server.fitting_items(items, 1) == 0
+    assert server.fitting_items(items, 0) == 10
+
+
+async def test_query_local_applies_the_response_budget(monkeypatch):
+    pytest.importorskip("duckdb")
+    database = server.LocalDatabase(memory_limit="256MB")
+    rows = [[f"campaign-{index}", float(index)] for index in range(500)]
+    result = server.QueryResult.from_response(completed_query(rows))
+    await database.register("campaigns", result, {"database_id": 1})
+    monkeypatch.setattr(server, "local_database", database)
+    monkeypatch.setattr(server.settings, "response_max_bytes", 2000)
+
+    try:
+        response = await server.query_local.fn("SELECT * FROM campaigns", limit=1000)
+    finally:
+        database.close()
+
+    assert response["truncated"] is True
+    assert response["omitted"]["hint"] == server.LOCAL_PAGING_HINT
+    assert 0 < len(response["data"]["rows"]) < 500
+    assert len(server.json_dumps(response)) <= 2000
@@ -0,0 +1,173 @@
+"""Result cache size bounds, expiry and invalidation"""
+
+import httpx
+from conftest import completed_query
+
+import server
+
+
+def entry_size(value) -> int:
+    return len(server.json_dumps(value))
+
+
+async def test_evicts_least_recently_used_entries_to_stay_under_max_bytes():
+    value = {"rows": "x" * 100}
+    cache = server.ResultCache(ttl=300, max_bytes=3 * entry_size(value))
+    for key in ("a", "b", "c"):
+        await cache.set((key,), value)
+
+    await cache.get(("a",))
+    await cache.set(("d",), value)
+
+    assert await cache.get(("b",)) is None
+    assert await cache.get(("a",)) == value
+    assert await cache.get(("c",)) == value
+    assert await cache.get(("d",)) == value
+    assert cache.evictions == 1
+    assert cache._bytes == 3 * entry_size(value)
+
+
+async def test_values_larger_than_the_cache_are_not_stored():
+    cache = server.ResultCache(ttl=300, max_bytes=50)
+    await cache.set(("small",), {"rows": 1})
+
+    await cache.set(("large",), {"rows": "x" * 100})
+
+    assert await cache.get(("large",)) is None
+    assert await cache.get(("small",)) == {"rows": 1}
+    assert cache.evictions == 0
+
+
+async def test_query_results_are_sized_by_their_columns():
+    result = server.QueryResult.from_response(completed_query())
+    cache = server.ResultCache(ttl=300, max_bytes=1024 * 1024)
+
+    await cache.set(("query",), result)
+
+    assert cache._bytes == result.nbytes
+
+
+async def test_replacing_an_entry_keeps_the_byte_count():
+    cache = server.ResultCache(ttl=300, max_bytes=1024)
+
+    await cache.set(("a",), {"rows": "x" * 10})
+    await cache.set(("a",), {"rows": "x" * 20})
+
+    assert cache._bytes == entry_size({"rows": "x" * 20})
+    assert len(cache._entries) == 1
+
+
+async def test_expired_entries_are_misses(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    cache = server.ResultCache(ttl=60, max_bytes=1024)
+    await cache.set(("a",), {"rows": 1})
+
+    now[0] += 59
+    assert await cache.get(("a",)) == {"rows": 1}
+    now[0] += 1
+    assert await cache.get(("a",)) is None
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache._bytes == 0
+
+
+async def test_a_zero_ttl_disables_the_cache():
+    cache = server.ResultCache(ttl=0, max_bytes=1024)
+
+    await cache.set(("a",), {"rows": 1})
+
+    assert await cache.get(("a",)) is None
+    assert cache._entries == {}
+
+
+async def test_invalidate_by_database_and_card():
+    cache = server.ResultCache(ttl=300, max_bytes=1024 * 1024)
+    await cache.set(("query", 1, "select 1"), {"rows": 1}, database_id=1)
+    await cache.set(("query", 2, "select 1"), {"rows": 1}, database_id=2)
+    await cache.set(("card", 7, None), {"rows": 1}, database_id=2)
+    await cache.set(("card", 8, None), {"rows": 1}, database_id=3)
+
+    assert await cache.invalidate(card_id=7) == 1
+    assert await cache.invalidate(database_id=2) == 1
+    assert await cache.get(("query", 1, "select 1")) is not None
+    assert await cache.get(("card", 8, None)) is not None
+
+    assert await cache.invalidate() == 2
+    assert cache._entries == {}
+    assert cache._bytes == 0
+
+
+async def test_repeated_queries_are_served_from_the_cache(make_client):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(202, json=completed_query())
+
+    client = make_client(handler)
+
+    first = await client.execute_query(1, "SELECT platform, spend FROM ad_spend")
+    second = await client.execute_query(1, "SELECT platform,\n       spend\nFROM ad_spend;")
+
+    assert second is first
+    assert len(calls) == 1
+
+
+async def test_writes_invalidate_the_database_results(make_client):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(202, json=completed_query())
+
+    client = make_client(handler)
+    await client.execute_query(1, "SELECT platform, spend FROM ad_spend")
+    await client.execute_query(2, "SELECT platform, spend FROM ad_spend")
+
+    await client.execute_query(1, "DELETE FROM ad_spend WHERE date < '2024-01-01'")
+    await client.execute_query(1, "SELECT platform, spend FROM ad_spend")
+    await client.execute_query(2, "SELECT platform, spend FROM ad_spend")
+
+    assert len(calls) == 4
+
+
+async def test_card_results_are_cached_per_parameters(make_client):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(202, json=completed_query())
+
+    client = make_client(handler)
+    march = [
+        {
+            "type": "date/single",
+            "target": ["variable", ["template-tag", "day"]],
+            "value": "2024-03-01",
+        }
+    ]
+
+    await client.execute_card(7)
+    await client.execute_card(7)
+    await client.execute_card(7, parameters=march)
+    await client.execute_card(7, use_cache=False)
+
+    assert len(calls) == 3
+    assert await client.cache.invalidate(card_id=7) == 2
+
+
+async def test_failed_queries_are_not_cached(make_client):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(202, json={"status": "failed", "error": "Table not found"})
+
+    client = make_client(handler)
+
+    for _ in range(2):
+        result = await client.execute_query(1, "SELECT * FROM missing_table")
+        assert result.error == "Table not found"
+
+    assert len(calls) == 2
@@ -0,0 +1,177 @@
+"""Metadata catalog loading, persistence and refreshes"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import server
+
+
+class MetabaseWithTables:
+    """Serves /table/{id}/query_metadata, whose display name changes on every fetch"""
+
+    def __init__(self):
+        self.fetches = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.fetches += 1
+        return httpx.Response(
+            200,
+            json={
+                "id": 5,
+                "db_id": 1,
+                "schema": "public",
+                "name": "ad_spend",
+                "display_name": f"Ad Spend v{self.fetches}",
+                "fields": [{"id": 51, "table_id": 5, "name": "spend", "base_type": "type/Float"}],
+            },
+        )
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(server.time, "time", lambda: now[0])
+    return now
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_tables_are_fetched_on_first_use_only(make_client, clock):
+    metabase = MetabaseWithTables()
+    client = make_client(metabase, catalog_refresh_seconds=60)
+
+    table = await client.catalog.table(5)
+    clock[0] += 59
+    await client.catalog.table(5)
+    await settle()
+
+    assert table.display_name == "Ad Spend v1"
+    assert metabase.fetches == 1
+
+
+async def test_stale_tables_outside_a_loaded_database_are_refreshed(make_client, clock):
+    metabase = MetabaseWithTables()
+    client = make_client(metabase, catalog_refresh_seconds=60)
+    await client.catalog.table(5)
+
+    clock[0] += 60
+    stale = await client.catalog.table(5)
+    await settle()
+
+    assert stale.display_name == "Ad Spend v1"
+    assert metabase.fetches == 2
+    assert (await client.catalog.table(5)).display_name == "Ad Spend v2"
+
+
+async def test_tables_restored_from_the_catalog_file_are_refreshed(make_client, tmp_path):
+    path = str(tmp_path / "catalog.sqlite3")
+    metabase = MetabaseWithTables()
+    client = make_client(metabase, catalog_path=path)
+    await client.catalog.table(5)
+    await client.close()
+
+    restarted = make_client(metabase, catalog_path=path)
+    table = await restarted.catalog.table(5)
+    await settle()
+
+    assert table.display_name == "Ad Spend v1"
+    assert metabase.fetches == 2
+    assert (await restarted.catalog.table(5)).display_name == "Ad Spend v2"
+
+
+def table(table_id: int, name: str, updated_at: str = "2024-01-01") -> dict:
+    return {
+        "id": table_id,
+        "db_id": 1,
+        "schema": "public",
+        "name": name,
+        "updated_at": updated_at,
+        "fields": [{"id": table_id * 10, "table_id": table_id, "name": "id"}],
+    }
+
+
+class MetabaseWithDatabase:
+    """Serves database 1's metadata, the /table listing and per-table metadata"""
+
+    def __init__(self, tables: list[dict]):
+        self.tables = {entry["id"]: entry for entry in tables}
+        self.paths: list[str] = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix("/api")
+        self.paths.append(path)
+        await asyncio.sleep(0)
+        if path == "/database/1/metadata":
+            return httpx.Response(200, json={"id": 1, "tables": list(self.tables.values())})
+        if path == "/table":
+            listing = [
+                {k: v for k, v in entry.items() if k != "fields"} for entry in self.tables.values()
+            ]
+            return httpx.Response(200, json=listing)
+        table_id = int(path.split("/")[2])
+        return httpx.Response(200, json=self.tables[table_id])
+
+
+async def test_a_database_is_loaded_once_for_concurrent_callers(make_client):
+    metabase = MetabaseWithDatabase([table(1, "ad_spend"), table(2, "orders")])
+    client = make_client(metabase)
+
+    first, second = await asyncio.gather(client.catalog.tables(1), client.catalog.tables(1))
+
+    assert [entry.name for entry in first] == ["ad_spend", "orders"]
+    assert [entry.name for entry in second] == ["ad_spend", "orders"]
+    assert metabase.paths == ["/database/1/metadata"]
+
+
+async def test_a_restarted_catalog_is_served_from_disk(make_client, tmp_path):
+    path = str(tmp_path / "catalog.sqlite3")
+    metabase = MetabaseWithDatabase([table(1, "ad_spend"), table(2, "orders")])
+    client = make_client(metabase, catalog_path=path)
+    await client.catalog.tables(1)
+    await client.close()
+
+    restarted = make_client(metabase, catalog_path=path)
+    tables = await restarted.catalog.tables(1)
+
+    assert [entry.name for entry in tables] == ["ad_spend", "orders"]
+    assert metabase.paths == ["/database/1/metadata"]
+
+
+async def test_incremental_refresh_refetches_only_changed_tables(make_client):
+    tables = [table(table_id, f"table_{table_id}") for table_id in range(1, 6)]
+    metabase = MetabaseWithDatabase(tables)
+    client = make_client(metabase)
+    await client.catalog.tables(1)
+
+    metabase.tables[2] = table(2, "table_2_renamed", updated_at="2024-02-01")
+    del metabase.tables[5]
+    metabase.paths.clear()
+    result = await client.catalog.refresh(1)
+
+    assert result == {
+        "database_id": 1,
+        "mode": "incremental",
+        "tables": 4,
+        "updated": 1,
+        "removed": 1,
+    }
+    assert metabase.paths == ["/table", "/table/2/query_metadata"]
+    names = [entry.name for entry in await client.catalog.tables(1)]
+    assert sorted(names) == ["table_1", "table_2_renamed", "table_3", "table_4"]
+
+
+async def test_stale_databases_are_refreshed_in_the_background(make_client, clock):
+    metabase = MetabaseWithDatabase([table(1, "ad_spend")])
+    client = make_client(metabase, catalog_refresh_seconds=60)
+    await client.catalog.tables(1)
+
+    clock[0] += 60
+    await client.catalog.tables(1)
+    await settle()
+
+    assert metabase.paths == ["/database/1/metadata", "/table"]
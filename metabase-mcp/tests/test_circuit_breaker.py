@@ -0,0 +1,198 @@
+"""Circuit breaker states and which failures count towards opening it"""
+
+import httpx
+import pytest
+from conftest import completed_query
+
+import server
+
+
+def open_breaker(breaker: server.CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.check()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures():
+    breaker = server.CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == breaker.CLOSED
+    breaker.record_failure()
+
+    assert breaker.state == breaker.OPEN
+    with pytest.raises(server.CircuitOpenError):
+        breaker.check()
+    assert breaker.rejected == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = server.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == breaker.CLOSED
+
+
+def test_half_open_lets_a_single_probe_through(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    breaker = server.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    open_breaker(breaker)
+
+    now[0] += 29
+    with pytest.raises(server.CircuitOpenError):
+        breaker.check()
+
+    now[0] += 1
+    breaker.check()
+    assert breaker.state == breaker.HALF_OPEN
+    with pytest.raises(server.CircuitOpenError):
+        breaker.check()
+
+
+def test_successful_probe_closes_the_circuit(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    breaker = server.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    open_breaker(breaker)
+
+    now[0] += 30
+    breaker.check()
+    breaker.record_success()
+
+    assert breaker.state == breaker.CLOSED
+    breaker.check()
+    breaker.check()
+
+
+def test_failed_probe_opens_the_circuit_again(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    breaker = server.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    open_breaker(breaker)
+
+    now[0] += 30
+    breaker.check()
+    breaker.record_failure()
+
+    assert breaker.state == breaker.OPEN
+    assert breaker.times_opened == 2
+    with pytest.raises(server.CircuitOpenError):
+        breaker.check()
+
+
+def test_unreported_probe_does_not_block_the_circuit(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    breaker = server.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    open_breaker(breaker)
+
+    now[0] += 30
+    breaker.check()
+    now[0] += 30
+    breaker.check()
+
+
+def test_probe_ending_in_a_slow_query_frees_the_probe(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    breaker = server.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    open_breaker(breaker)
+
+    now[0] += 30
+    breaker.check()
+    breaker.record_error(httpx.ReadTimeout("slow"), "POST", "/dataset")
+
+    assert breaker.state == breaker.HALF_OPEN
+    breaker.check()
+
+
+@pytest.mark.parametrize(
+    ("error", "method", "path", "counted"),
+    [
+        (httpx.ConnectError("refused"), "GET", "/database", True),
+        (httpx.ConnectTimeout("timeout"), "POST", "/dataset", True),
+        (httpx.ReadError("connection reset"), "GET", "/card", True),
+        (httpx.ReadTimeout("slow"), "GET", "/database/1/metadata", True),
+        (httpx.ReadTimeout("slow"), "POST", "/dataset", False),
+        (httpx.ReadTimeout("slow"), "POST", "/card/7/query", False),
+        (httpx.PoolTimeout("busy"), "GET", "/database", False),
+    ],
+)
+def test_only_outage_errors_are_counted(error, method, path, counted):
+    breaker = server.CircuitBreaker(failure_threshold=5, reset_timeout=30)
+
+    breaker.record_error(error, method, path)
+
+    assert breaker.consecutive_failures == (1 if counted else 0)
+
+
+async def test_slow_queries_do_not_open_the_circuit(make_client):
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ReadTimeout("query still running", request=request)
+
+    client = make_client(handler, circuit_failure_threshold=2)
+    payload = {"database": 1, "type": "native", "native": {"query": "SELECT 1"}}
+
+    for _ in range(3):
+        with pytest.raises(httpx.ReadTimeout):
+            await client.request("POST", "/dataset", json=payload)
+
+    assert client.breaker.state == client.breaker.CLOSED
+
+
+async def test_unreachable_metabase_opens_the_circuit(make_client):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        raise httpx.ConnectError("connection refused", request=request)
+
+    client = make_client(handler, circuit_failure_threshold=2)
+
+    with pytest.raises(httpx.ConnectError):
+        await client.request("GET", "/database")
+    with pytest.raises(server.CircuitOpenError):
+        await client.request("GET", "/database")
+
+    assert len(calls) == 2
+    assert client.breaker.state == client.breaker.OPEN
+
+
+async def test_outage_statuses_open_the_circuit_and_others_do_not(make_client):
+    statuses = iter([404, 404, 404, 503, 503])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(statuses), json={})
+
+    client = make_client(handler, circuit_failure_threshold=2, retry_attempts={"GET": 1})
+
+    for _ in range(3):
+        with pytest.raises(Exception, match="status 404"):
+            await client.request("GET", "/card/1")
+    assert client.breaker.state == client.breaker.CLOSED
+
+    for _ in range(2):
+        with pytest.raises(Exception, match="status 503"):
+            await client.request("GET", "/card/1")
+    assert client.breaker.state == client.breaker.OPEN
+
+
+async def test_retries_transient_statuses_for_gets(make_client):
+    statuses = iter([502, 200])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        status = next(statuses)
+        return httpx.Response(status, json=completed_query() if status == 200 else {})
+
+    client = make_client(handler)
+
+    result = await client.request("GET", "/card/1")
+
+    assert result["status"] == "completed"
+    assert client.retries == 1
+    assert client.breaker.state == client.breaker.CLOSED
@@ -0,0 +1,156 @@
+"""Single-flight coalescing of identical in-flight requests (MetabaseClient._request)"""
+
+import asyncio
+
+import httpx
+import pytest
+from conftest import completed_query
+
+
+class SlowHandler:
+    """Answers every request once `release` is set, counting calls and cancellations"""
+
+    def __init__(self):
+        self.calls = []
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls.append(request)
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if request.url.path == "/api/dataset":
+            return httpx.Response(202, json=completed_query())
+        return httpx.Response(200, json={"id": 1, "name": "Production"})
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_identical_gets_share_one_request(make_client):
+    handler = SlowHandler()
+    client = make_client(handler)
+
+    tasks = [asyncio.create_task(client.request("GET", "/database/1")) for _ in range(5)]
+    await settle()
+    assert client._inflight_waiters == {next(iter(client._inflight)): 5}
+    handler.release.set()
+    results = await asyncio.gather(*tasks)
+
+    assert len(handler.calls) == 1
+    assert client.coalesced_requests == 4
+    assert all(result == {"id": 1, "name": "Production"} for result in results)
+    assert client._inflight == {}
+    assert client._inflight_waiters == {}
+
+
+async def test_different_requests_are_not_coalesced(make_client):
+    handler = SlowHandler()
+    handler.release.set()
+    client = make_client(handler)
+
+    await asyncio.gather(client.request("GET", "/database/1"), client.request("GET", "/database/2"))
+
+    assert len(handler.calls) == 2
+    assert client.coalesced_requests == 0
+
+
+async def test_cancelling_one_waiter_keeps_the_request_for_the_others(make_client):
+    handler = SlowHandler()
+    client = make_client(handler)
+
+    first = asyncio.create_task(client.request("GET", "/database/1"))
+    second = asyncio.create_task(client.request("GET", "/database/1"))
+    await settle()
+    first.cancel()
+    await settle()
+    handler.release.set()
+
+    assert await second == {"id": 1, "name": "Production"}
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert handler.cancelled == 0
+    assert client._inflight_waiters == {}
+
+
+async def test_cancelling_every_waiter_cancels_the_request(make_client):
+    handler = SlowHandler()
+    client = make_client(handler)
+
+    tasks = [asyncio.create_task(client.request("GET", "/database/1")) for _ in range(3)]
+    await settle()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await settle()
+
+    assert handler.cancelled == 1
+    assert client._inflight == {}
+    assert client._inflight_waiters == {}
+
+
+async def test_a_new_request_after_completion_is_sent_again(make_client):
+    handler = SlowHandler()
+    handler.release.set()
+    client = make_client(handler)
+
+    await client.request("GET", "/database/1")
+    await client.request("GET", "/database/1")
+
+    assert len(handler.calls) == 2
+
+
+async def test_identical_read_only_queries_are_coalesced(make_client):
+    handler = SlowHandler()
+    client = make_client(handler)
+    payload = {"database": 1, "type": "native", "native": {"query": "SELECT 1"}}
+
+    tasks = [
+        asyncio.create_task(client.request("POST", "/dataset", json=payload)) for _ in range(3)
+    ]
+    await settle()
+    handler.release.set()
+    await asyncio.gather(*tasks)
+
+    assert len(handler.calls) == 1
+    assert client.coalesced_requests == 2
+
+
+async def test_identical_writes_are_each_sent(make_client):
+    handler = SlowHandler()
+    client = make_client(handler)
+    payload = {
+        "database": 1,
+        "type": "native",
+        "native": {"query": "INSERT INTO refresh_log VALUES (now())"},
+    }
+
+    tasks = [
+        asyncio.create_task(client.request("POST", "/dataset", json=payload)) for _ in range(3)
+    ]
+    await settle()
+    handler.release.set()
+    await asyncio.gather(*tasks)
+
+    assert len(handler.calls) == 3
+    assert client.coalesced_requests == 0
+
+
+async def test_posts_outside_query_paths_are_not_coalesced(make_client):
+    handler = SlowHandler()
+    client = make_client(handler)
+
+    tasks = [
+        asyncio.create_task(client.request("POST", "/card", json={"name": "ROAS"}))
+        for _ in range(2)
+    ]
+    await settle()
+    handler.release.set()
+    await asyncio.gather(*tasks)
+
+    assert len(handler.calls) == 2
@@ -0,0 +1,114 @@
+"""Dashboard execution: filter values mapped onto every dashcard"""
+
+import asyncio
+import json
+
+import httpx
+from conftest import completed_query
+
+PLATFORM = {"id": "p1", "slug": "platform", "type": "string/=", "default": None}
+PERIOD = {"id": "p2", "slug": "period", "type": "date/all-options", "default": "past30days"}
+
+
+def dashcard(dashcard_id: int, card_id: int | None, *mappings: tuple[str, int]) -> dict:
+    return {
+        "id": dashcard_id,
+        "card_id": card_id,
+        "parameter_mappings": [
+            {
+                "parameter_id": parameter_id,
+                "card_id": mapped_card_id,
+                "target": ["dimension", ["field", parameter_id, None]],
+            }
+            for parameter_id, mapped_card_id in mappings
+        ],
+    }
+
+
+DASHBOARD = {
+    "id": 3,
+    "name": "ROAS",
+    "parameters": [PLATFORM, PERIOD],
+    "dashcards": [
+        dashcard(31, 7, ("p1", 7), ("p2", 7)),
+        # A mapping for another card of the same dashcard (a series) is not sent
+        dashcard(32, 8, ("p1", 8), ("p2", 99)),
+        # Text cards have no card
+        dashcard(33, None),
+    ],
+}
+
+
+class MetabaseWithDashboard:
+    def __init__(self, dashboard: dict):
+        self.dashboard = dashboard
+        self.parameters: dict[int, list] = {}
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix("/api")
+        if path == "/dashboard/3":
+            return httpx.Response(200, json=self.dashboard)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        dashcard_id = int(path.split("/")[4])
+        self.parameters[dashcard_id] = json.loads(request.content)["parameters"]
+        return httpx.Response(202, json=completed_query())
+
+
+def sent(parameters: list) -> dict[str, object]:
+    return {parameter["id"]: parameter["value"] for parameter in parameters}
+
+
+async def test_filters_are_mapped_by_slug_onto_each_dashcard(make_client):
+    metabase = MetabaseWithDashboard(DASHBOARD)
+    client = make_client(metabase)
+
+    dashboard, dashcards, outcomes = await client.execute_dashboard(3, {"platform": "google"})
+
+    assert dashboard["name"] == "ROAS"
+    assert [card["id"] for card in dashcards] == [31, 32]
+    assert [outcome["status"] for outcome in outcomes] == ["completed", "completed"]
+    assert sent(metabase.parameters[31]) == {"p1": "google", "p2": "past30days"}
+    assert sent(metabase.parameters[32]) == {"p1": "google"}
+    assert metabase.parameters[31][0] == {
+        "id": "p1",
+        "type": "string/=",
+        "value": "google",
+        "target": ["dimension", ["field", "p1", None]],
+    }
+
+
+async def test_filters_can_be_given_by_id_and_override_defaults(make_client):
+    metabase = MetabaseWithDashboard(DASHBOARD)
+    client = make_client(metabase)
+
+    await client.execute_dashboard(3, {"p2": "2024-03-01~2024-03-31"})
+
+    assert sent(metabase.parameters[31]) == {"p2": "2024-03-01~2024-03-31"}
+    assert sent(metabase.parameters[32]) == {}
+
+
+async def test_every_dashcard_runs_in_one_wave(make_client):
+    many = {**DASHBOARD, "dashcards": [dashcard(40 + i, i + 1) for i in range(6)]}
+    metabase = MetabaseWithDashboard(many)
+    client = make_client(metabase, batch_concurrency=2)
+
+    await client.execute_dashboard(3)
+
+    assert metabase.peak == 6
+
+
+async def test_older_metabase_ordered_cards_are_supported(make_client):
+    older = {"id": 3, "parameters": [], "ordered_cards": [dashcard(31, 7)]}
+    metabase = MetabaseWithDashboard(older)
+    client = make_client(metabase)
+
+    _, dashcards, outcomes = await client.execute_dashboard(3)
+
+    assert [card["id"] for card in dashcards] == [31]
+    assert outcomes[0]["dashcard_id"] == 31
+    assert metabase.parameters[31] == []
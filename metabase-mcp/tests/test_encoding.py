@@ -0,0 +1,117 @@
+"""Output formats of query results: rows, columnar, dictionary encoding, Arrow and Parquet"""
+
+import base64
+import sys
+
+import pytest
+
+import server
+
+RESPONSE = {
+    "status": "completed",
+    "database_id": 1,
+    "running_time": 12,
+    "row_count": 4,
+    "data": {
+        "cols": [
+            {"name": "platform", "display_name": "Platform", "base_type": "type/Text"},
+            {"name": "campaign", "base_type": "type/Text"},
+            {"name": "spend", "base_type": "type/Float"},
+        ],
+        "rows": [
+            ["google", "Spring Sale", 10.5],
+            ["google", "Launch", 4.25],
+            ["meta", "Retargeting", None],
+            ["google", "Brand", 1.0],
+        ],
+    },
+}
+
+
+def result() -> server.QueryResult:
+    return server.QueryResult.from_response(RESPONSE)
+
+
+def test_rows_returns_the_metabase_response():
+    assert server.encode_result(result(), "rows") == RESPONSE
+    assert server.encode_result(RESPONSE, "rows") is RESPONSE
+
+
+def test_columnar_dictionary_encodes_repeated_strings():
+    encoded = server.encode_result(result(), "columnar")
+
+    assert encoded["format"] == "columnar"
+    assert encoded["row_count"] == 4
+    assert (encoded["status"], encoded["database_id"], encoded["running_time"]) == (
+        "completed",
+        1,
+        12,
+    )
+    platform, campaign, spend = encoded["columns"]
+    assert platform["name"] == "platform"
+    assert platform["dictionary"] == ["google", "meta"]
+    assert platform["indices"] == [0, 0, 1, 0]
+    # Every campaign is distinct, so a dictionary would not be smaller
+    assert campaign["values"] == ["Spring Sale", "Launch", "Retargeting", "Brand"]
+    assert spend["values"] == [10.5, 4.25, None, 1.0]
+
+
+def test_columnar_without_dictionary_encoding():
+    encoded = server.encode_result(result(), "columnar", dictionary_encode=False)
+
+    assert encoded["columns"][0]["values"] == ["google", "google", "meta", "google"]
+    assert "dictionary" not in encoded["columns"][0]
+
+
+def test_dictionary_encoding_only_applies_to_string_columns():
+    assert server._dictionary_encode(["a", "a", "b", "a"]) == (["a", "b"], [0, 0, 1, 0])
+    assert server._dictionary_encode(["a", None, "a", "a"]) is None
+    assert server._dictionary_encode([1, 1, 1, 1]) is None
+    assert server._dictionary_encode([]) is None
+
+
+def test_failed_results_are_returned_as_they_are():
+    failed = {"status": "failed", "error": "Syntax error"}
+
+    assert server.encode_result(failed, "columnar") == failed
+
+
+def test_unknown_formats_are_rejected():
+    with pytest.raises(ValueError, match="output_format must be one of"):
+        server.encode_result(result(), "csv")
+
+
+@pytest.mark.parametrize("output_format", ["arrow", "parquet"])
+def test_arrow_and_parquet_round_trip(output_format):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    encoded = server.encode_result(result(), output_format)
+    data = base64.b64decode(encoded["data"])
+    if output_format == "arrow":
+        table = pa.ipc.open_stream(data).read_all()
+    else:
+        table = pq.read_table(pa.BufferReader(data))
+
+    assert encoded["format"] == output_format
+    assert encoded["row_count"] == 4
+    assert table.column_names == ["platform", "campaign", "spend"]
+    assert table.column("spend").to_pylist() == [10.5, 4.25, None, 1.0]
+    assert table.column("platform").to_pylist() == ["google", "google", "meta", "google"]
+
+
+def test_arrow_keeps_the_budget_markers():
+    pytest.importorskip("pyarrow")
+    budgeted = server.budget_result(result(), 300)
+
+    encoded = server.encode_result(budgeted, "arrow")
+
+    assert encoded["truncated"] is True
+    assert encoded["omitted"]["rows"] > 0
+
+
+def test_arrow_without_pyarrow_explains_the_requirement(monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+
+    with pytest.raises(ValueError, match="requires pyarrow"):
+        server.encode_result(result(), "arrow")
@@ -0,0 +1,58 @@
+"""Connection pool, HTTP/2 and timeout settings of the Metabase HTTP client"""
+
+import importlib.util
+
+import pytest
+
+import server
+
+
+def pool(client):
+    return client._transport._pool
+
+
+async def test_pool_and_timeouts_follow_the_settings():
+    config = server.Settings()
+    config.http2 = False
+    config.max_connections = 12
+    config.max_keepalive_connections = 4
+    config.keepalive_expiry = 15
+    config.connect_timeout = 2
+    config.read_timeout = 90
+
+    async with server.create_http_client(config) as client:
+        assert pool(client)._max_connections == 12
+        assert pool(client)._max_keepalive_connections == 4
+        assert pool(client)._keepalive_expiry == 15
+        assert client.timeout.connect == 2
+        assert client.timeout.read == 90
+
+
+async def test_http2_is_used_when_h2_is_installed():
+    pytest.importorskip("h2")
+    config = server.Settings()
+    config.http2 = True
+
+    async with server.create_http_client(config) as client:
+        assert pool(client)._http2 is True
+
+
+async def test_http2_falls_back_to_http1_without_h2(monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(
+        server.importlib.util,
+        "find_spec",
+        lambda name, *args: None if name == "h2" else find_spec(name, *args),
+    )
+    config = server.Settings()
+    config.http2 = True
+
+    async with server.create_http_client(config) as client:
+        assert pool(client)._http2 is False
+
+
+@pytest.mark.parametrize(("value", "expected"), [("1", True), ("false", False), ("off", False)])
+def test_http2_setting(monkeypatch, value, expected):
+    monkeypatch.setenv("METABASE_HTTP2", value)
+
+    assert server.Settings().http2 is expected
@@ -0,0 +1,102 @@
+"""Multiple Metabase instances: per-instance settings, clients and health reporting"""
+
+import json
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def instances(monkeypatch):
+    monkeypatch.setenv("METABASE_INSTANCES", "production, staging")
+    monkeypatch.setenv("METABASE_PRODUCTION_URL", "https://metabase.example.com")
+    monkeypatch.setenv("METABASE_PRODUCTION_API_KEY", "production-key")
+    monkeypatch.setenv("METABASE_STAGING_URL", "https://metabase-staging.example.com")
+    monkeypatch.setenv("METABASE_STAGING_API_KEY", "staging-key")
+    return server.Settings()
+
+
+def test_instances_are_listed_and_the_first_is_the_default(instances):
+    assert instances.instances == ["production", "staging"]
+    assert instances.default_instance == "production"
+
+
+def test_connection_settings_are_read_per_instance(instances, monkeypatch):
+    monkeypatch.setenv("METABASE_CACHE_TTL", "60")
+    monkeypatch.setenv("METABASE_STAGING_CACHE_TTL", "0")
+
+    production = instances.for_instance("production")
+    staging = instances.for_instance("staging")
+
+    assert (production.url, production.api_key) == (
+        "https://metabase.example.com",
+        "production-key",
+    )
+    assert staging.url == "https://metabase-staging.example.com"
+    assert production.cache_ttl == 60
+    assert staging.cache_ttl == 0
+
+
+def test_credentials_are_not_inherited(instances, monkeypatch):
+    monkeypatch.setenv("METABASE_API_KEY", "shared-key")
+    monkeypatch.delenv("METABASE_STAGING_API_KEY")
+
+    staging = instances.for_instance("staging")
+
+    assert staging.api_key is None
+    with pytest.raises(ValueError, match="METABASE_STAGING_URL is required"):
+        staging.validate()
+
+
+def test_a_shared_catalog_file_gets_one_copy_per_instance(instances, monkeypatch):
+    monkeypatch.setenv("METABASE_CATALOG_PATH", "/var/cache/catalog.sqlite3")
+    monkeypatch.setenv("METABASE_PRODUCTION_CATALOG_PATH", "/data/production.sqlite3")
+
+    assert instances.for_instance("production").catalog_path == "/data/production.sqlite3"
+    assert instances.for_instance("staging").catalog_path == "/var/cache/catalog-staging.sqlite3"
+
+
+def test_process_wide_settings_ignore_instance_prefixes(instances, monkeypatch):
+    monkeypatch.setenv("METABASE_JOB_TIMEOUT", "600")
+    monkeypatch.setenv("METABASE_STAGING_JOB_TIMEOUT", "5")
+
+    assert instances.for_instance("staging").job_timeout == 600
+
+
+def test_unknown_and_invalid_instances_are_rejected(instances, monkeypatch):
+    with pytest.raises(ValueError, match="Unknown Metabase instance 'qa'; configured: production"):
+        instances.for_instance("qa")
+    monkeypatch.setenv("METABASE_INSTANCES", "eu-west")
+    with pytest.raises(ValueError, match="Invalid Metabase instance name 'eu-west'"):
+        server.Settings().for_instance("eu-west")
+
+
+def test_a_single_instance_is_named_default():
+    single = server.Settings()
+
+    assert single.for_instance("default") is single
+    with pytest.raises(ValueError, match="only 'default' is configured"):
+        single.for_instance("staging")
+
+
+async def test_health_and_metrics_do_not_build_clients(monkeypatch):
+    monkeypatch.setattr(server, "_metabase_clients", {})
+    monkeypatch.setattr(server.settings, "url", None)
+
+    health = await server.health(None)
+    metrics = await server.metrics_endpoint(None)
+
+    assert health.status_code == 200
+    assert json.loads(health.body) == {"status": "ok", "metabase": None}
+    assert metrics.status_code == 200
+    assert server._metabase_clients == {}
+
+
+async def test_health_reports_created_clients(make_client, monkeypatch):
+    client = make_client(lambda request: None)
+    monkeypatch.setattr(server, "_metabase_clients", {server.settings.default_instance: client})
+
+    health = json.loads((await server.health(None)).body)
+
+    assert health["metabase"] == json.loads(json.dumps(client.stats()))
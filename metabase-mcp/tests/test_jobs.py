@@ -0,0 +1,155 @@
+"""Background query jobs: lifecycle, cancellation, limits and pruning"""
+
+import asyncio
+
+import httpx
+import pytest
+from conftest import completed_query
+
+import server
+
+
+def jobs(**overrides) -> server.JobManager:
+    options = {"max_finished": 32, "result_ttl": 3600, "timeout": 60, "max_running": 8}
+    return server.JobManager(**{**options, **overrides})
+
+
+def returning(response: dict, delay: float = 0):
+    async def run(timeout: float) -> server.QueryResult:
+        await asyncio.sleep(delay)
+        return server.QueryResult.from_response(response)
+
+    return run
+
+
+async def blocked(timeout: float) -> server.QueryResult:
+    await asyncio.Event().wait()
+
+
+async def test_completed_jobs_keep_their_result():
+    manager = jobs()
+
+    job = manager.submit("database 1: SELECT 1", returning(completed_query()))
+    assert job.info()["status"] == "running"
+    await job.task
+
+    info = manager.get(job.id).info()
+    assert info["status"] == "completed"
+    assert info["row_count"] == 2
+    assert job.result.rows() == [["google", 10.5], ["meta", 4.25]]
+    assert job.finished_at is not None
+
+
+async def test_failed_queries_and_errors_are_reported():
+    manager = jobs()
+
+    async def raising(timeout: float):
+        raise RuntimeError("connection lost")
+
+    failed = manager.submit("failed", returning({"status": "failed", "error": "Bad SQL"}))
+    errored = manager.submit("errored", raising)
+    await asyncio.gather(failed.task, errored.task)
+
+    assert (failed.status, failed.error) == ("failed", "Bad SQL")
+    assert (errored.status, errored.error) == ("failed", "connection lost")
+
+
+async def test_jobs_time_out():
+    manager = jobs()
+
+    job = manager.submit("slow", blocked, timeout=0.01)
+    await job.task
+
+    assert job.status == "timed_out"
+    assert job.error == "Query did not finish within 0.01s"
+
+
+async def test_http_read_timeouts_count_as_timeouts():
+    manager = jobs()
+
+    async def read_timeout(timeout: float):
+        raise httpx.ReadTimeout("slow")
+
+    job = manager.submit("slow", read_timeout)
+    await job.task
+
+    assert job.status == "timed_out"
+
+
+async def test_running_jobs_can_be_cancelled():
+    manager = jobs()
+    job = manager.submit("blocked", blocked)
+    await asyncio.sleep(0)
+
+    await manager.cancel(job.id)
+
+    assert job.status == "cancelled"
+    assert job.finished_at is not None
+
+
+async def test_jobs_cancelled_before_they_start_are_finished():
+    manager = jobs(max_finished=0)
+    job = manager.submit("blocked", blocked)
+
+    await manager.cancel(job.id)
+
+    assert job.status == "cancelled"
+    assert job.finished_at is not None
+    assert manager.running == 0
+    manager.submit("next", returning(completed_query()))
+    assert job.id not in manager._jobs
+
+
+async def test_cancelling_a_finished_job_keeps_its_status():
+    manager = jobs()
+    job = manager.submit("done", returning(completed_query()))
+    await job.task
+
+    await manager.cancel(job.id)
+
+    assert job.status == "completed"
+
+
+async def test_running_jobs_are_capped():
+    manager = jobs(max_running=2)
+    first = manager.submit("first", blocked)
+    manager.submit("second", blocked)
+
+    with pytest.raises(ValueError, match="2 jobs are already running"):
+        manager.submit("third", blocked)
+
+    await manager.cancel(first.id)
+    manager.submit("third", blocked)
+    assert manager.running == 2
+    await manager.close_all()
+    assert manager.running == 0
+
+
+async def test_oldest_finished_jobs_are_pruned():
+    manager = jobs(max_finished=2)
+    finished = []
+    for index in range(3):
+        job = manager.submit(f"job {index}", returning(completed_query()))
+        await job.task
+        finished.append(job)
+
+    running = manager.submit("running", blocked)
+
+    with pytest.raises(ValueError, match="Unknown or expired job"):
+        manager.get(finished[0].id)
+    assert manager.get(finished[2].id) is finished[2]
+    assert manager.get(running.id) is running
+    await manager.close_all()
+
+
+async def test_expired_results_are_pruned(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(server.time, "time", lambda: now[0])
+    manager = jobs(result_ttl=60)
+    job = manager.submit("done", returning(completed_query()))
+    await job.task
+
+    now[0] += 61
+
+    with pytest.raises(ValueError, match="Unknown or expired job"):
+        manager.get(job.id)
@@ -0,0 +1,86 @@
+"""JSON backends: selection of orjson, msgspec or the stdlib and their common behaviour"""
+
+import datetime
+import decimal
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import server
+
+INSTALLED = [
+    name
+    for name in server.JSON_BACKENDS
+    if name == "json" or importlib.util.find_spec(name) is not None
+]
+
+
+@pytest.fixture(params=INSTALLED)
+def backend(request):
+    return server.select_json_backend(request.param)
+
+
+def test_auto_picks_the_fastest_installed_library(monkeypatch):
+    pytest.importorskip("orjson")
+    pytest.importorskip("msgspec")
+
+    assert server.select_json_backend()[0] == "orjson"
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    assert server.select_json_backend()[0] == "msgspec"
+    monkeypatch.setitem(sys.modules, "msgspec", None)
+    assert server.select_json_backend()[0] == "json"
+
+
+def test_a_missing_library_names_the_extra(monkeypatch):
+    monkeypatch.setitem(sys.modules, "orjson", None)
+
+    with pytest.raises(ValueError, match="requires orjson \\(the fast-json extra\\)"):
+        server.select_json_backend("orjson")
+    with pytest.raises(ValueError, match="must be auto, orjson, msgspec, json"):
+        server.select_json_backend("ujson")
+
+
+def test_dumps_is_compact_utf8(backend):
+    _, _, dumps = backend
+
+    assert dumps({"platform": "méta", "rows": [[1, 2.5, None, True]]}) == (
+        '{"platform":"méta","rows":[[1,2.5,null,true]]}'.encode()
+    )
+
+
+def test_dumps_handles_int_keys_and_unknown_values(backend):
+    _, loads, dumps = backend
+    value = {1: datetime.date(2025, 9, 1), "spend": decimal.Decimal("10.50")}
+
+    assert loads(dumps(value)) == {"1": "2025-09-01", "spend": "10.50"}
+
+
+def test_loads_accepts_bytes_and_str(backend):
+    _, loads, _ = backend
+    document = '{"status": "completed", "data": {"rows": [["google", 10.5]]}}'
+
+    assert loads(document) == json.loads(document)
+    assert loads(document.encode()) == json.loads(document)
+
+
+def test_an_unavailable_configured_backend_falls_back_at_import():
+    env = {**os.environ, "METABASE_JSON_BACKEND": "orjson"}
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; sys.modules['orjson'] = None\nimport server; print(server.json_backend)",
+        ],
+        cwd=os.path.dirname(server.__file__),
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+    assert output.stdout.strip() in ("msgspec", "json")
+    assert "using the fastest installed JSON library" in output.stderr
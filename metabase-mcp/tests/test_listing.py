@@ -0,0 +1,93 @@
+"""Paged listings (list_cards, list_collections): cursors, projection and the budget"""
+
+import pytest
+
+import server
+
+CARDS = [
+    {"id": card_id, "name": f"Card {card_id}", "description": "ROAS by platform " * 5}
+    for card_id in (12, 3, 7, 40, 25, 1)
+]
+
+
+def pages(items: list[dict], limit: int, max_bytes: int = 0) -> list[dict]:
+    """Follow next_cursor from the first page to the last"""
+    result = server.page_list(items, ("id",), limit, None, max_bytes)
+    collected = [result]
+    while result["next_cursor"] is not None:
+        result = server.page_list(items, ("id",), limit, result["next_cursor"], max_bytes)
+        collected.append(result)
+    return collected
+
+
+def ids(page: dict) -> list:
+    return [item["id"] for item in page["data"]]
+
+
+def test_cursors_walk_every_item_once_in_id_order():
+    collected = pages(CARDS, limit=4)
+
+    assert [ids(page) for page in collected] == [[1, 3, 7, 12], [25, 40]]
+    assert all(page["total"] == 6 for page in collected)
+    assert "omitted" not in collected[0]
+
+
+def test_items_are_projected_to_the_requested_fields():
+    page = server.page_list(CARDS, ("id", "name", "collection_id"), 1, None, 0)
+
+    assert page["data"] == [{"id": 1, "name": "Card 1", "collection_id": None}]
+
+
+def test_pages_do_not_shift_when_items_change_between_calls():
+    first = server.page_list(CARDS, ("id",), 3, None, 0)
+    changed = [card for card in CARDS if card["id"] != 3] + [{"id": 2}, {"id": 8}]
+
+    second = server.page_list(changed, ("id",), 3, first["next_cursor"], 0)
+
+    assert ids(first) == [1, 3, 7]
+    assert ids(second) == [8, 12, 25]
+
+
+def test_string_ids_sort_before_numbers():
+    collections = [{"id": 5}, {"id": "root"}, {"id": 2}]
+
+    assert [ids(page) for page in pages(collections, limit=2)] == [["root", 2], [5]]
+
+
+def test_pages_over_the_budget_are_cut_short_and_resume_after_the_cut():
+    fields = ("id", "description")
+    item = len(server.json_dumps({key: CARDS[0][key] for key in fields})) + 1
+
+    first = server.page_list(CARDS, fields, 4, None, 2 + 2 * item)
+    second = server.page_list(CARDS, fields, 4, first["next_cursor"], 2 + 2 * item)
+
+    assert ids(first) == [1, 3]
+    assert first["omitted"] == {
+        "items": 2,
+        "max_bytes": 2 + 2 * item,
+        "hint": server.LIST_PAGING_HINT,
+    }
+    assert ids(second) == [7, 12]
+
+
+def test_a_page_keeps_one_item_however_small_the_budget():
+    assert [ids(page) for page in pages(CARDS, limit=2, max_bytes=1)] == [
+        [1],
+        [3],
+        [7],
+        [12],
+        [25],
+        [40],
+    ]
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "WzEsMl0="])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        server.page_list(CARDS, ("id",), 10, cursor, 0)
+
+
+@pytest.mark.parametrize("limit", [0, server.MAX_LIST_PAGE_SIZE + 1])
+def test_limit_is_bounded(limit):
+    with pytest.raises(ValueError, match="limit must be between 1 and"):
+        server.page_list(CARDS, ("id",), limit, None, 0)
@@ -0,0 +1,54 @@
+"""Local DuckDB tables: loading and lockdown"""
+
+import sys
+
+import pytest
+from conftest import completed_query
+
+import server
+
+pytest.importorskip("duckdb")
+
+
+@pytest.fixture
+def local_database():
+    database = server.LocalDatabase(memory_limit="256MB")
+    yield database
+    database.close()
+
+
+@pytest.fixture(params=["arrow", "executemany"])
+async def ad_spend(request, local_database, monkeypatch):
+    """The local database with an ad_spend table, loaded with and without pyarrow"""
+    if request.param == "arrow":
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setitem(sys.modules, "pyarrow", None)
+    result = server.QueryResult.from_response(completed_query())
+    await local_database.register("ad_spend", result, {"database_id": 1})
+    return local_database
+
+
+async def test_registered_tables_can_be_queried(ad_spend):
+    result = await ad_spend.query("SELECT platform, spend FROM ad_spend ORDER BY spend", 10)
+
+    assert result["data"]["rows"] == [["meta", 4.25], ["google", 10.5]]
+    assert result["truncated"] is False
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT * FROM read_csv('/etc/passwd')",
+        "COPY ad_spend TO '/tmp/ad_spend.csv'",
+        "ATTACH '/tmp/other.duckdb' AS other",
+        "INSTALL httpfs",
+        "LOAD httpfs",
+        "SET enable_external_access = true",
+        "SET lock_configuration = false",
+        "SELECT * FROM 'https://example.com/data.parquet'",
+    ],
+)
+async def test_file_url_and_extension_access_is_disabled(ad_spend, sql):
+    with pytest.raises(Exception):
+        await ad_spend.query(sql, 10)
@@ -0,0 +1,138 @@
+"""Tool and HTTP metrics: histograms, Prometheus rendering and tool instrumentation"""
+
+import httpx
+import pytest
+from conftest import completed_query
+
+import server
+
+
+@pytest.fixture
+def metrics(monkeypatch) -> server.Metrics:
+    fresh = server.Metrics()
+    monkeypatch.setattr(server, "metrics", fresh)
+    return fresh
+
+
+def test_endpoint_templates_collapse_ids():
+    assert server.endpoint_template("/api/card/12/query") == "/api/card/{id}/query"
+    assert server.endpoint_template("/api/dashboard/3") == "/api/dashboard/{id}"
+    assert server.endpoint_template("/api/dataset") == "/api/dataset"
+
+
+def test_histogram_quantiles_are_bucket_upper_bounds():
+    histogram = server.Histogram((0.1, 1, 10))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value)
+
+    assert histogram.counts == [1, 3, 4]
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.99) == 10
+    assert server.Histogram((1,)).quantile(0.5) is None
+
+
+def test_render_uses_the_prometheus_text_format(metrics):
+    metrics.inc("calls_total", {"tool": "execute_card", "outcome": "ok"})
+    metrics.inc("calls_total", {"tool": "execute_card", "outcome": "ok"})
+    metrics.add("in_flight", {}, 1)
+    metrics.observe("duration_seconds", {"tool": 'say "hi"'}, 0.2, buckets=(0.1, 1))
+
+    lines = metrics.render(gauges={"breaker_open": {(): 0}}).splitlines()
+
+    assert lines == [
+        "# TYPE calls_total counter",
+        'calls_total{outcome="ok",tool="execute_card"} 2',
+        "# TYPE in_flight gauge",
+        "in_flight 1",
+        "# TYPE breaker_open gauge",
+        "breaker_open 0",
+        "# TYPE duration_seconds histogram",
+        'duration_seconds_bucket{tool="say \\"hi\\"",le="0.1"} 0',
+        'duration_seconds_bucket{tool="say \\"hi\\"",le="1"} 1',
+        'duration_seconds_bucket{tool="say \\"hi\\"",le="+Inf"} 1',
+        'duration_seconds_sum{tool="say \\"hi\\""} 0.2',
+        'duration_seconds_count{tool="say \\"hi\\""} 1',
+    ]
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = server.Metrics(enabled=False)
+    metrics.inc("calls_total", {})
+    metrics.observe("duration_seconds", {}, 1)
+
+    assert metrics.render() == "\n"
+
+
+async def test_tool_calls_are_counted_by_outcome(metrics):
+    @server.instrumented
+    async def lookup(card_id: int) -> dict:
+        if card_id < 0:
+            raise ValueError("bad card")
+        return {"id": card_id}
+
+    await lookup(card_id=1)
+    with pytest.raises(ValueError):
+        await lookup(card_id=-1)
+
+    calls = metrics.counters["metabase_mcp_tool_calls_total"]
+    assert calls[metrics._key({"tool": "lookup", "outcome": "ok"})] == 1
+    assert calls[metrics._key({"tool": "lookup", "outcome": "error"})] == 1
+    assert (
+        metrics.histograms["metabase_mcp_tool_duration_seconds"][
+            metrics._key({"tool": "lookup"})
+        ].count
+        == 2
+    )
+    assert metrics.gauges["metabase_mcp_tool_in_flight"][metrics._key({"tool": "lookup"})] == 0
+
+
+async def test_response_sizes_are_sampled(metrics, monkeypatch):
+    monkeypatch.setattr(server.settings, "metrics_size_sample", 3)
+    encoded = []
+    json_size = server._json_size
+    monkeypatch.setattr(
+        server, "_json_size", lambda value: encoded.append(value) or json_size(value)
+    )
+
+    @server.instrumented
+    async def lookup(card_id: int) -> dict:
+        return {"id": card_id}
+
+    for card_id in range(7):
+        await lookup(card_id=card_id)
+
+    sizes = metrics.histograms["metabase_mcp_tool_response_bytes"][metrics._key({"tool": "lookup"})]
+    assert encoded == [{"id": 0}, {"id": 3}, {"id": 6}]
+    assert (sizes.count, sizes.sum) == (3, len(server.json_dumps({"id": 0})) * 3)
+
+
+async def test_response_sizes_can_be_turned_off(metrics, monkeypatch):
+    monkeypatch.setattr(server.settings, "metrics_size_sample", 0)
+
+    @server.instrumented
+    async def lookup() -> dict:
+        return {}
+
+    await lookup()
+
+    assert "metabase_mcp_tool_response_bytes" not in metrics.histograms
+
+
+async def test_http_requests_are_counted_by_endpoint_and_status(make_client, metrics):
+    def metabase(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/card/404/query":
+            return httpx.Response(404, text="Not found")
+        return httpx.Response(202, json=completed_query())
+
+    client = make_client(metabase)
+    await client.execute_card(12)
+    await client.execute_card(13)
+    with pytest.raises(Exception):
+        await client.execute_card(404)
+
+    requests = metrics.render()
+    assert (
+        'metabase_mcp_http_requests_total{endpoint="/card/{id}/query",instance="default",'
+        'method="POST",status="202"} 2'
+    ) in requests
+    assert 'method="POST",status="404"} 1' in requests
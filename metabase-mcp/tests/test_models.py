@@ -0,0 +1,144 @@
+"""Typed result and metadata models: column storage, round trips and slotted classes"""
+
+import array
+
+import pytest
+
+import server
+
+RESPONSE = {
+    "status": "completed",
+    "database_id": 1,
+    "started_at": "2025-09-01T00:00:00Z",
+    "row_count": 3,
+    "data": {
+        "cols": [
+            {
+                "name": "platform",
+                "base_type": "type/Text",
+                "semantic_type": None,
+                "source": "native",
+            },
+            {"name": "clicks", "base_type": "type/Integer"},
+            {"name": "spend", "base_type": "type/Float"},
+            {"name": "orders", "base_type": "type/Integer"},
+        ],
+        "rows": [
+            ["google", 120, 10.5, 3],
+            ["meta", 80, 4.25, None],
+            ["tiktok", 5, 1.0, 1],
+        ],
+        "native_form": {"query": "SELECT 1"},
+        "results_timezone": "UTC",
+    },
+}
+
+
+def result() -> server.QueryResult:
+    return server.QueryResult.from_response(RESPONSE)
+
+
+def test_numeric_columns_without_nulls_are_packed_into_arrays():
+    platform, clicks, spend, orders = result().values
+
+    assert platform == ["google", "meta", "tiktok"]
+    assert clicks == array.array("q", [120, 80, 5])
+    assert spend == array.array("d", [10.5, 4.25, 1.0])
+    assert orders == [3, None, 1]
+
+
+def test_mixed_bool_and_oversized_columns_stay_lists():
+    assert server._pack_column([1, 2.5]) == [1, 2.5]
+    assert server._pack_column([True, False]) == [True, False]
+    assert server._pack_column([2**70, 1]) == [2**70, 1]
+    assert server._pack_column([]) == []
+
+
+def test_to_dict_rebuilds_the_response_less_null_attributes():
+    rebuilt = result().to_dict()
+
+    assert rebuilt["data"]["rows"] == RESPONSE["data"]["rows"]
+    assert rebuilt["data"]["cols"][0] == {
+        "name": "platform",
+        "base_type": "type/Text",
+        "source": "native",
+    }
+    assert rebuilt["data"]["native_form"] == {"query": "SELECT 1"}
+    assert {key: value for key, value in rebuilt.items() if key != "data"} == {
+        key: value for key, value in RESPONSE.items() if key != "data"
+    }
+
+
+def test_rows_and_slices():
+    original = result()
+    sliced = original.slice(1, 3)
+
+    assert original.rows(0, 1) == [["google", 120, 10.5, 3]]
+    assert sliced.row_count == 2
+    assert sliced.rows() == [["meta", 80, 4.25, None], ["tiktok", 5, 1.0, 1]]
+    assert (sliced.columns, sliced.envelope) == (original.columns, original.envelope)
+
+
+def test_results_without_data():
+    failed = server.QueryResult.from_response({"status": "failed", "error": "Bad SQL"})
+    empty = server.QueryResult.from_response(
+        {"status": "completed", "data": {"cols": [{"name": "id"}], "rows": []}}
+    )
+
+    assert (failed.status, failed.error, failed.has_data) == ("failed", "Bad SQL", False)
+    assert failed.to_dict() == {"status": "failed", "error": "Bad SQL"}
+    assert empty.has_data and empty.row_count == 0
+    assert empty.to_dict()["data"] == {"cols": [{"name": "id"}], "rows": []}
+
+
+def test_packed_results_take_less_memory_than_lists():
+    rows = [[index, float(index)] for index in range(1000)]
+    cols = [{"name": "id"}, {"name": "spend"}]
+    packed = server.QueryResult.from_response({"data": {"cols": cols, "rows": rows}})
+    rows[0] = [None, None]
+    unpacked = server.QueryResult.from_response({"data": {"cols": cols, "rows": rows}})
+
+    assert packed.nbytes < unpacked.nbytes / 2
+
+
+def test_models_keep_unknown_keys_in_extra():
+    field = server.Field.from_dict({"id": 11, "name": "spend", "fingerprint": {"min": 0}})
+
+    assert (field.id, field.name, field.get("fingerprint")) == (11, "spend", {"min": 0})
+    assert field.get("missing", "default") == "default"
+    assert field.to_dict() == {"id": 11, "name": "spend", "fingerprint": {"min": 0}}
+    with pytest.raises(AttributeError):
+        field.fingerprint = None
+
+
+def test_tables_hold_field_models():
+    table = server.Table.from_dict(
+        {"id": 1, "db_id": 5, "name": "ad_spend", "fields": [{"id": 11, "name": "spend"}]}
+    )
+
+    assert isinstance(table.fields[0], server.Field)
+    assert table.to_dict() == {
+        "id": 1,
+        "db_id": 5,
+        "name": "ad_spend",
+        "fields": [{"id": 11, "name": "spend"}],
+    }
+
+
+def test_cards_are_reduced_to_their_summary():
+    card = server.Card.from_api(
+        {
+            "id": 7,
+            "name": "ROAS by platform",
+            "collection": {"id": 47, "name": "ROAS"},
+            "dataset_query": {"type": "native", "native": {"query": "SELECT spend"}},
+            "result_metadata": [{"name": "spend"}],
+        }
+    )
+
+    assert (card.collection_name, card.query_type, card.native_query) == (
+        "ROAS",
+        "native",
+        "SELECT spend",
+    )
+    assert "result_metadata" not in card.to_dict()
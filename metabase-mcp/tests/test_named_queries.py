@@ -0,0 +1,190 @@
+"""Named report queries: parsing report files, binding parameters and the registry"""
+
+import datetime
+import os
+
+import pytest
+
+import server
+
+REPORT = """-- Ad Performance
+-- Database: Supabase (ID: 5)
+-- Defaults: start_date = 30 days ago, end_date = today
+
+-- ============================================
+-- 1. Spend by Platform
+-- ============================================
+SELECT platform, SUM(spend)
+FROM ad_spend
+WHERE date BETWEEN {{start_date}} AND {{end_date}}
+    [[AND platform = {{platform}}]]
+GROUP BY platform;
+
+-- ============================================
+-- 2. Zero Revenue Campaigns (Last 7 Days)
+-- ============================================
+-- Defaults: start_date = 1 week ago
+SELECT campaign_key FROM ad_spend WHERE date >= {{start_date}} AND revenue = 0;
+
+-- ============================================
+-- 3. Maintenance
+-- ============================================
+-- REFRESH MATERIALIZED VIEW ad_spend;
+"""
+
+
+class FixedDate(datetime.date):
+    @classmethod
+    def today(cls):
+        return cls(2025, 9, 30)
+
+
+@pytest.fixture
+def today(monkeypatch):
+    monkeypatch.setattr(server.datetime, "date", FixedDate)
+
+
+def queries() -> dict[str, server.NamedQuery]:
+    return {query.name: query for query in server.parse_report(REPORT, "ads", "daily/ads.sql")}
+
+
+def test_sections_become_named_queries():
+    parsed = queries()
+
+    assert list(parsed) == ["ads.spend_by_platform", "ads.zero_revenue_campaigns_last_7_days"]
+    spend = parsed["ads.spend_by_platform"]
+    assert (spend.title, spend.source, spend.database_id) == (
+        "Spend by Platform",
+        "daily/ads.sql",
+        5,
+    )
+    assert spend.sql.startswith("SELECT platform")
+    assert spend.sql.endswith("GROUP BY platform")
+
+
+def test_section_defaults_override_the_file_defaults():
+    parsed = queries()
+
+    assert parsed["ads.spend_by_platform"].defaults == {
+        "start_date": "30 days ago",
+        "end_date": "today",
+    }
+    assert parsed["ads.zero_revenue_campaigns_last_7_days"].defaults["start_date"] == "1 week ago"
+
+
+def test_a_file_without_sections_is_one_query_named_after_it():
+    text = "-- Monthly payouts\n-- Database: Replica (ID: 2)\nSELECT * FROM payouts;\n"
+
+    (query,) = server.parse_report(text, "payouts", "monthly/payouts.sql")
+
+    assert (query.name, query.title, query.database_id) == ("payouts", "Monthly payouts", 2)
+    assert query.sql == "SELECT * FROM payouts"
+
+
+def test_optional_clauses_make_tags_optional():
+    info = queries()["ads.spend_by_platform"].info()
+
+    assert info["parameters"] == [
+        {"name": "start_date", "type": "date", "default": "30 days ago", "required": False},
+        {"name": "end_date", "type": "date", "default": "today", "required": False},
+        {"name": "platform", "type": "text", "default": None, "required": False},
+    ]
+
+
+def test_bind_resolves_defaults_and_relative_dates(today):
+    query = queries()["ads.spend_by_platform"]
+
+    resolved, template_tags, parameters = query.bind({"platform": "google"})
+
+    assert resolved == {"start_date": "2025-08-31", "end_date": "2025-09-30", "platform": "google"}
+    assert template_tags["start_date"] == {
+        "id": "start_date",
+        "name": "start_date",
+        "display-name": "Start Date",
+        "type": "date",
+        "required": True,
+    }
+    assert template_tags["platform"]["required"] is False
+    assert parameters[0] == {
+        "type": "date/single",
+        "target": ["variable", ["template-tag", "start_date"]],
+        "value": "2025-08-31",
+    }
+    assert parameters[2]["type"] == "category"
+
+
+def test_bind_leaves_out_unset_optional_tags(today):
+    query = queries()["ads.spend_by_platform"]
+
+    resolved, _, parameters = query.bind({"start_date": "yesterday", "end_date": "2025-09-29"})
+
+    assert resolved == {"start_date": "2025-09-29", "end_date": "2025-09-29"}
+    assert len(parameters) == 2
+
+
+def test_bind_rejects_unknown_missing_and_invalid_parameters():
+    query = server.NamedQuery("q", "Q", "q.sql", 5, "SELECT {{start_date}}", {})
+
+    with pytest.raises(ValueError, match="Unknown parameters for q: region; available: start"):
+        query.bind({"region": "eu"})
+    with pytest.raises(ValueError, match="Parameter start_date is required by q"):
+        query.bind({})
+    with pytest.raises(ValueError, match="Invalid date 'last month'"):
+        query.bind({"start_date": "last month"})
+
+
+def write(path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def test_registry_serves_the_metabase_copy_of_a_runnable_report(tmp_path):
+    write(tmp_path / "daily" / "ads.sql", REPORT.replace("{{start_date}}", "CURRENT_DATE"))
+    write(tmp_path / "daily" / "ads.metabase.sql", REPORT)
+    write(tmp_path / "monthly" / "payouts.sql", "-- Payouts\nSELECT 1;\n")
+
+    registry = server.NamedQueryRegistry(str(tmp_path))
+
+    assert sorted(registry.queries()) == [
+        "ads.spend_by_platform",
+        "ads.zero_revenue_campaigns_last_7_days",
+        "payouts",
+    ]
+    assert registry.get("ads.spend_by_platform").source == os.path.join("daily", "ads.metabase.sql")
+    with pytest.raises(ValueError, match="Unknown named query 'ads'; available: ads.spend"):
+        registry.get("ads")
+
+
+def test_registry_rereads_only_when_a_directory_changes(tmp_path, monkeypatch):
+    write(tmp_path / "daily" / "ads.sql", REPORT)
+    registry = server.NamedQueryRegistry(str(tmp_path))
+    loads = []
+    load = registry._load
+    monkeypatch.setattr(registry, "_load", lambda paths: loads.append(paths) or load(paths))
+
+    first = registry.queries()
+    assert registry.queries() is first
+    write(tmp_path / "daily" / "payouts.sql", "-- Payouts\nSELECT 1;\n")
+    os.utime(tmp_path / "daily", ns=(0, 1))
+
+    assert "payouts" in registry.queries()
+    assert len(loads) == 2
+
+
+def test_registry_can_be_disabled_or_empty(tmp_path):
+    assert server.NamedQueryRegistry("none").queries() == {}
+    assert server.NamedQueryRegistry(None).queries() == {}
+    assert server.NamedQueryRegistry(str(tmp_path / "missing")).queries() == {}
+
+
+def test_the_repository_reports_load():
+    registry = server.NamedQueryRegistry(server.REPORTS_DIR)
+    if not os.path.isdir(server.REPORTS_DIR):
+        pytest.skip("reports/ is not next to the package")
+
+    queries = registry.queries()
+
+    assert "roas_tracker.platform_comparison" in queries
+    assert queries["roas_tracker.platform_comparison"].database_id == 5
+    with open(os.path.join(server.REPORTS_DIR, "daily", "roas_tracker.sql")) as file:
+        assert "{{" not in file.read()
@@ -0,0 +1,151 @@
+"""Redis shared state: result cache and metadata catalog shared by replicas (fakeredis)"""
+
+import httpx
+import pytest
+from conftest import completed_query
+
+import server
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def replica(redis_server):
+    """Build RedisStates of replicas sharing one fake Redis server"""
+
+    def connect() -> server.RedisState:
+        state = server.RedisState("redis://localhost:6379/0", "metabase-mcp:test")
+        state.redis = fakeredis.FakeAsyncRedis(server=redis_server)
+        return state
+
+    return connect
+
+
+def result(rows: list[list] | None = None) -> server.QueryResult:
+    return server.QueryResult.from_response(completed_query(rows))
+
+
+def test_state_backends():
+    config = server.Settings()
+    config.redis_prefix = "mcp"
+
+    config.state_backend = "memory"
+    assert server.create_state(config, "http://metabase.test") is None
+    config.state_backend = "memcached"
+    with pytest.raises(ValueError, match="must be 'memory' or 'redis'"):
+        server.create_state(config, "http://metabase.test")
+    config.state_backend = "redis"
+    first = server.create_state(config, "http://metabase.test")
+    second = server.create_state(config, "http://metabase-staging.test")
+    assert first.key("cache", "all").startswith("mcp:")
+    assert first.namespace != second.namespace
+
+
+async def test_cached_results_are_shared_between_replicas(replica):
+    first = server.RedisResultCache(replica(), ttl=60, max_bytes=10_000)
+    second = server.RedisResultCache(replica(), ttl=60, max_bytes=10_000)
+    key = ("query", 1, "SELECT 1", "")
+
+    assert await second.get(key) is None
+    await first.set(key, result(), database_id=1)
+    cached = await second.get(key)
+
+    assert cached.rows() == [["google", 10.5], ["meta", 4.25]]
+    assert (second.hits, second.misses) == (1, 1)
+    assert 0 < await first.state.redis.pttl(first._entry_key(key)) <= 60_000
+
+
+async def test_results_over_the_size_cap_are_not_cached(replica):
+    cache = server.RedisResultCache(replica(), ttl=60, max_bytes=100)
+    rows = [[f"campaign-{index}", float(index)] for index in range(50)]
+
+    await cache.set(("query", 1, "SELECT *", ""), result(rows), database_id=1)
+
+    assert await cache.state.redis.keys("*") == []
+
+
+async def test_invalidation_by_database_card_or_everything(replica):
+    cache = server.RedisResultCache(replica(), ttl=60, max_bytes=10_000)
+    other = server.RedisResultCache(replica(), ttl=60, max_bytes=10_000)
+    await cache.set(("query", 1, "SELECT 1", ""), result(), database_id=1)
+    await cache.set(("card", 7, ""), result(), database_id=1)
+    await cache.set(("query", 2, "SELECT 2", ""), result(), database_id=2)
+
+    assert await other.invalidate(card_id=7) == 1
+    assert await other.invalidate(database_id=1) == 1
+    assert await other.get(("query", 2, "SELECT 2", "")) is not None
+    assert await other.invalidate() == 1
+    assert await other.invalidate() == 0
+
+
+async def test_redis_failures_degrade_to_misses(replica, redis_server):
+    cache = server.RedisResultCache(replica(), ttl=60, max_bytes=10_000)
+    redis_server.connected = False
+
+    await cache.set(("query", 1, "SELECT 1", ""), result(), database_id=1)
+    assert await cache.get(("query", 1, "SELECT 1", "")) is None
+    assert await cache.invalidate(database_id=1) == 0
+
+    assert cache.stats()["errors"] == 3
+    assert cache.misses == 1
+
+
+async def test_writes_succeed_when_invalidation_fails(make_client, replica, redis_server):
+    def metabase(request):
+        return httpx.Response(202, json=completed_query())
+
+    client = make_client(metabase)
+    client.state = replica()
+    client.cache = server.RedisResultCache(client.state, ttl=60, max_bytes=10_000)
+    redis_server.connected = False
+
+    response = await client.execute_query(1, "DELETE FROM ad_spend")
+
+    assert response.row_count == 2
+    assert client.state.error_count == 1
+
+
+async def test_catalog_tables_are_shared_between_replicas(replica):
+    writer = server.RedisCatalogStore(replica())
+    reader = server.RedisCatalogStore(replica())
+    tables = [
+        {"id": 1, "db_id": 5, "name": "ad_spend"},
+        {"id": 2, "db_id": 5, "name": "orders"},
+    ]
+
+    await writer.save_tables(5, tables, detailed=True, removed=set(), loaded_at=1000.0)
+    await writer.save_tables(5, [], detailed=True, removed={2}, loaded_at=2000.0)
+
+    loaded_at, rows = await reader.load_database(5)
+    assert loaded_at == 2000.0
+    assert rows == [(5, True, {"id": 1, "db_id": 5, "name": "ad_spend"})]
+    assert await reader.load_database(6) is None
+
+
+async def test_catalog_snapshot_includes_cards(replica):
+    store = server.RedisCatalogStore(replica())
+    cards = [{"id": 7, "name": "ROAS by platform"}]
+
+    assert (await store.load())["cards"] == []
+    await store.save_tables(5, [{"id": 1, "db_id": 5}], True, frozenset(), 1000.0)
+    await store.save_cards(cards, 1500.0)
+
+    snapshot = await store.load()
+    assert snapshot["databases"] == {5: 1000.0}
+    assert snapshot["tables"] == [(5, True, {"id": 1, "db_id": 5})]
+    assert (snapshot["cards"], snapshot["cards_at"]) == (cards, 1500.0)
+
+
+async def test_catalog_is_unavailable_while_redis_is_down(replica, redis_server):
+    store = server.RedisCatalogStore(replica())
+    redis_server.connected = False
+
+    assert await store.load() is None
+    assert await store.load_cards() is None
+    await store.save_cards([], 1500.0)
+    assert store.state.error_count == 3
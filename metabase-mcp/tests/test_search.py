@@ -0,0 +1,88 @@
+"""Search index ranking over tables, fields and cards"""
+
+import server
+
+TABLES = [
+    {
+        "id": 1,
+        "db_id": 1,
+        "schema": "public",
+        "name": "ad_spend",
+        "display_name": "Ad Spend",
+        "fields": [
+            {"id": 11, "name": "campaign_key", "display_name": "Campaign Key"},
+            {"id": 12, "name": "spend", "display_name": "Spend"},
+        ],
+    },
+    {
+        "id": 2,
+        "db_id": 1,
+        "schema": "public",
+        "name": "orders",
+        "display_name": "Orders",
+        "description": "Shopify orders with attributed revenue",
+        "fields": [{"id": 21, "name": "totalRevenue", "display_name": "Total Revenue"}],
+    },
+    {
+        "id": 3,
+        "db_id": 2,
+        "schema": "accounting",
+        "name": "invoices",
+        "display_name": "Invoices",
+        "fields": [{"id": 31, "name": "amount_due", "display_name": "Amount Due"}],
+    },
+]
+CARDS = [
+    {"id": 7, "name": "ROAS by platform", "database_id": 1, "native_query": "SELECT spend"},
+    {"id": 8, "name": "Old revenue report", "database_id": 1, "archived": True},
+]
+
+
+def index() -> server.SearchIndex:
+    tables = [server.Table.from_dict(table) for table in TABLES]
+    cards = [server.Card(**card) for card in CARDS]
+    return server.SearchIndex.build(tables, cards)
+
+
+def hits(results: list[dict]) -> list[tuple[str, int]]:
+    return [(result["kind"], result["id"]) for result in results]
+
+
+def test_names_rank_above_descriptions():
+    results = index().search("revenue")
+
+    assert hits(results)[:2] == [("field", 21), ("table", 2)]
+    assert results[0]["score"] > results[1]["score"]
+
+
+def test_snake_and_camel_case_names_are_split_into_words():
+    assert hits(index().search("campaign"))[0] == ("field", 11)
+    assert hits(index().search("total"))[0] == ("field", 21)
+
+
+def test_misspelled_terms_match_similar_words():
+    assert hits(index().search("invoces"))[0] == ("table", 3)
+    assert hits(index().search("campain key"))[0] == ("field", 11)
+
+
+def test_prefixes_match_longer_terms():
+    assert ("table", 2) in hits(index().search("ord"))
+
+
+def test_unrelated_queries_find_nothing():
+    assert index().search("zebra") == []
+
+
+def test_archived_cards_are_not_indexed():
+    assert ("card", 8) not in hits(index().search("old revenue report"))
+    assert hits(index().search("roas"))[0] == ("card", 7)
+
+
+def test_results_can_be_limited_to_a_database():
+    results = index().search("amount spend", database_id=2)
+
+    assert hits(results) == [("field", 31)]
+
+
+def test_top_k_limits_the_results():
+    assert len(index().search("spend", top_k=2)) == 2
@@ -0,0 +1,140 @@
+"""Session token login, sharing between concurrent callers and renewal on a 401"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import server
+
+SESSION_AUTH = {"api_key": None, "user_email": "analyst@example.com", "password": "secret"}
+
+
+class MetabaseWithSessions:
+    """Issues session tokens and accepts only the latest one"""
+
+    def __init__(self, login_delay: float = 0):
+        self.login_delay = login_delay
+        self.logins = 0
+        self.requests: list[httpx.Request] = []
+
+    @property
+    def current_token(self) -> str:
+        return f"token-{self.logins}"
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/session":
+            await asyncio.sleep(self.login_delay)
+            self.logins += 1
+            return httpx.Response(200, json={"id": self.current_token})
+
+        self.requests.append(request)
+        if request.headers.get("X-Metabase-Session") != self.current_token:
+            return httpx.Response(401, text="Unauthenticated")
+        return httpx.Response(200, json=[{"id": 1}])
+
+
+async def test_concurrent_first_calls_log_in_once(make_client):
+    metabase = MetabaseWithSessions(login_delay=0.01)
+    client = make_client(metabase, **SESSION_AUTH)
+
+    await asyncio.gather(*(client.request("GET", f"/card/{card_id}") for card_id in range(5)))
+
+    assert metabase.logins == 1
+    assert client.session.logins == 1
+    assert {request.headers["X-Metabase-Session"] for request in metabase.requests} == {"token-1"}
+
+
+async def test_rejected_token_is_renewed_and_the_request_retried(make_client):
+    metabase = MetabaseWithSessions()
+    client = make_client(metabase, **SESSION_AUTH)
+    await client.request("GET", "/card")
+
+    # The session expired server-side, e.g. after a Metabase restart
+    metabase.logins += 1
+
+    assert await client.request("GET", "/card") == [{"id": 1}]
+    assert client.session.logins == 2
+    assert client.session.token == "token-3"
+    assert [request.headers["X-Metabase-Session"] for request in metabase.requests] == [
+        "token-1",
+        "token-1",
+        "token-3",
+    ]
+
+
+async def test_a_second_401_is_returned_to_the_caller(make_client):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/session":
+            return httpx.Response(200, json={"id": "token"})
+        return httpx.Response(401, text="Unauthenticated")
+
+    client = make_client(handler, **SESSION_AUTH)
+
+    with pytest.raises(Exception, match="status 401"):
+        await client.request("GET", "/card")
+    assert client.session.logins == 2
+
+
+async def test_api_key_auth_does_not_retry_a_401(make_client):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(401, text="Unauthenticated")
+
+    client = make_client(handler)
+
+    with pytest.raises(Exception, match="status 401"):
+        await client.request("GET", "/card")
+    assert len(calls) == 1
+    assert calls[0].headers["X-API-KEY"] == "test-key"
+
+
+async def test_invalidating_a_replaced_token_keeps_the_new_one():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"id": "token-new"})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+        session = server.SessionManager(
+            http, "http://metabase.test", "analyst@example.com", "secret", 86400
+        )
+        assert await session.get_token() == "token-new"
+
+        session.invalidate("token-old")
+
+        assert session.token == "token-new"
+        assert await session.get_token() == "token-new"
+        assert session.logins == 1
+
+
+async def test_tokens_are_refreshed_after_the_refresh_interval(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    logins = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        logins.append(request)
+        return httpx.Response(200, json={"id": f"token-{len(logins)}"})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+        session = server.SessionManager(
+            http, "http://metabase.test", "analyst@example.com", "secret", 60
+        )
+        assert await session.get_token() == "token-1"
+        now[0] += 59
+        assert await session.get_token() == "token-1"
+        now[0] += 1
+        assert await session.get_token() == "token-2"
+
+
+async def test_failed_login_raises():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(401, json={"errors": {"password": "did not match"}})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+        session = server.SessionManager(
+            http, "http://metabase.test", "analyst@example.com", "wrong", 86400
+        )
+        with pytest.raises(Exception, match="Authentication failed: 401"):
+            await session.get_token()
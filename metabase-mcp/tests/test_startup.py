@@ -0,0 +1,69 @@
+"""Startup: importing the server is side-effect free and the client is built on first use"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import server
+
+SERVER_DIR = os.path.dirname(server.__file__)
+
+
+def run_python(code: str) -> str:
+    """Run code in a fresh interpreter with no Metabase configuration"""
+    env = {key: value for key, value in os.environ.items() if not key.startswith("METABASE_")}
+    env["METABASE_CATALOG_PATH"] = "none"
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=SERVER_DIR,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+def test_import_needs_no_configuration_and_builds_no_client():
+    output = run_python(
+        "import logging, server\n"
+        "print(len(server._metabase_clients), logging.getLogger().handlers == [])\n"
+        "try:\n"
+        "    server.get_client()\n"
+        "except ValueError as error:\n"
+        "    print(error)\n"
+    )
+
+    assert output.splitlines() == [
+        "0 True",
+        "METABASE_URL is required, and either METABASE_API_KEY or both "
+        "METABASE_USER_EMAIL and METABASE_PASSWORD must be provided",
+    ]
+
+
+def test_optional_heavy_dependencies_are_not_imported():
+    output = run_python(
+        "import sys, server\n"
+        "lazy = ('duckdb', 'numpy', 'pyarrow', 'redis', 'opentelemetry', 'sqlite3', 'difflib')\n"
+        "print([name for name in lazy if name in sys.modules])\n"
+    )
+
+    assert output == "[]\n"
+
+
+async def test_the_client_is_created_on_first_use_and_reused(monkeypatch):
+    monkeypatch.setattr(server, "_metabase_clients", {})
+
+    client = server.get_client()
+    try:
+        assert server._metabase_clients == {server.settings.default_instance: client}
+        assert server.get_client() is client
+        assert server.metabase_client is client
+    finally:
+        await client.close()
+
+
+def test_unknown_module_attributes_still_raise():
+    with pytest.raises(AttributeError, match="has no attribute 'missing'"):
+        server.missing
@@ -0,0 +1,127 @@
+"""CSV export streams: record parsing, paging and the cursor registry"""
+
+import httpx
+import pytest
+
+import server
+
+EXPORT = (
+    "campaign,notes,spend\r\n"
+    'Spring Sale,"multi-line\r\nnote, with a comma",10.5\r\n'
+    'Launch,"says ""hello""",4\r\n'
+    "Retargeting,,0\r\n"
+)
+
+
+async def lines(*values: str):
+    for value in values:
+        yield value
+
+
+async def records(*values: str) -> list[list[str]]:
+    return [record async for record in server._iter_csv_records(lines(*values))]
+
+
+async def test_records_are_split_into_fields():
+    assert await records("a,b,c", "1,2,3") == [["a", "b", "c"], ["1", "2", "3"]]
+
+
+async def test_quoted_newlines_are_joined_into_one_record():
+    parsed = await records("id,notes", '1,"first line', "", 'third line"', "2,plain")
+
+    assert parsed == [["id", "notes"], ["1", "first line\n\nthird line"], ["2", "plain"]]
+
+
+async def test_escaped_quotes_do_not_open_a_field():
+    assert await records('1,"says ""hi""",x', "2,y,z") == [
+        ["1", 'says "hi"', "x"],
+        ["2", "y", "z"],
+    ]
+
+
+async def test_blank_lines_between_records_are_skipped():
+    assert await records("a,b", "", "1,2", "") == [["a", "b"], ["1", "2"]]
+
+
+def csv_export(request: httpx.Request) -> httpx.Response:
+    assert request.url.path == "/api/dataset/csv"
+    return httpx.Response(200, content=EXPORT.encode())
+
+
+async def test_streams_are_read_page_by_page(make_client):
+    client = make_client(csv_export)
+
+    stream = await client.open_query_stream(1, "SELECT * FROM campaigns")
+    first = await stream.next_page(2)
+    second = await stream.next_page(2)
+
+    assert stream.columns == ["campaign", "notes", "spend"]
+    assert first == [
+        ["Spring Sale", "multi-line\nnote, with a comma", "10.5"],
+        ["Launch", 'says "hello"', "4"],
+    ]
+    assert second == [["Retargeting", "", "0"]]
+    assert stream.rows_read == 3
+    assert stream.done
+    assert await stream.next_page(2) == []
+
+
+async def test_failed_exports_raise(make_client):
+    client = make_client(lambda request: httpx.Response(400, text="Bad SQL"))
+
+    with pytest.raises(Exception, match="status 400: Bad SQL"):
+        await client.open_query_stream(1, "SELEC 1")
+
+
+async def open_stream(client) -> server.ResultStream:
+    return await client.open_query_stream(1, "SELECT * FROM campaigns")
+
+
+async def test_registry_closes_the_least_recently_used_stream(make_client, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    client = make_client(csv_export)
+    registry = server.StreamRegistry(max_open=2, idle_timeout=300)
+
+    first = await registry.add(await open_stream(client))
+    now[0] += 1
+    second = await registry.add(await open_stream(client))
+    now[0] += 1
+    (await registry.get(first)).last_used = now[0]
+    third = await registry.add(await open_stream(client))
+
+    assert len(registry) == 2
+    with pytest.raises(ValueError, match="Unknown or expired cursor"):
+        await registry.get(second)
+    assert await registry.get(first)
+    assert await registry.get(third)
+
+
+async def test_registry_expires_idle_streams(make_client, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    client = make_client(csv_export)
+    registry = server.StreamRegistry(max_open=8, idle_timeout=300)
+    stream = await open_stream(client)
+    cursor = await registry.add(stream)
+
+    now[0] += 301
+
+    with pytest.raises(ValueError, match="Unknown or expired cursor"):
+        await registry.get(cursor)
+    assert stream.done
+    assert stream.response.is_closed
+
+
+async def test_close_all_closes_every_response(make_client):
+    client = make_client(csv_export)
+    registry = server.StreamRegistry(max_open=8, idle_timeout=300)
+    streams = [await open_stream(client) for _ in range(3)]
+    for stream in streams:
+        await registry.add(stream)
+
+    await registry.close_all()
+
+    assert len(registry) == 0
+    assert all(stream.response.is_closed for stream in streams)
+    assert await registry.close("unknown") is False
@@ -0,0 +1,64 @@
+"""OpenTelemetry tracing: exporter setup, the trace file and shutdown"""
+
+import json
+import sys
+
+import pytest
+
+import server
+
+pytest.importorskip("opentelemetry.sdk")
+
+
+def test_tracing_is_off_unless_configured():
+    assert server.setup_tracing("") == (None, None)
+    with pytest.raises(ValueError, match="METABASE_TRACING must be 'otlp' or 'file'"):
+        server.setup_tracing("jaeger")
+
+
+def test_missing_sdk_disables_tracing(monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, "opentelemetry.sdk.trace", None)
+
+    assert server.setup_tracing("file") == (None, None)
+    assert "METABASE_TRACING=file needs opentelemetry-sdk" in caplog.text
+
+
+def test_file_spans_are_flushed_and_the_file_closed_on_shutdown(monkeypatch, tmp_path):
+    trace_file = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(server.settings, "trace_file", str(trace_file))
+    provider, tracer = server.setup_tracing("file")
+
+    with tracer.start_as_current_span("tool execute_card", attributes={"metabase.card_id": 7}):
+        with tracer.start_as_current_span("GET /card/{id}"):
+            pass
+    processor = provider._active_span_processor._span_processors[0]
+    provider.shutdown()
+
+    spans = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert [span["name"] for span in spans] == ["GET /card/{id}", "tool execute_card"]
+    assert spans[1]["attributes"] == {"metabase.card_id": 7}
+    assert spans[0]["parent_id"] == spans[1]["context"]["span_id"]
+    assert processor.span_exporter.out.closed
+
+
+class FailingClient:
+    async def close(self):
+        raise RuntimeError("connection reset")
+
+
+class Provider:
+    shut_down = False
+
+    def shutdown(self):
+        self.shut_down = True
+
+
+async def test_cleanup_shuts_tracing_down_even_when_closing_fails(monkeypatch):
+    provider = Provider()
+    monkeypatch.setattr(server, "tracer_provider", provider)
+    monkeypatch.setattr(server, "_metabase_clients", {"default": FailingClient()})
+
+    with pytest.raises(RuntimeError, match="connection reset"):
+        await server.cleanup()
+
+    assert provider.shut_down
@@ -0,0 +1,150 @@
+"""Post-processing of query results: filters, group_by sums, top-k and projection"""
+
+import pytest
+
+import server
+
+RESPONSE = {
+    "status": "completed",
+    "database_id": 1,
+    "row_count": 6,
+    "data": {
+        "cols": [
+            {"name": "platform", "display_name": "Platform", "base_type": "type/Text"},
+            {"name": "campaign", "base_type": "type/Text"},
+            {"name": "spend", "display_name": "Spend", "base_type": "type/Float"},
+            {"name": "orders", "base_type": "type/Integer"},
+        ],
+        "rows": [
+            ["google", "Spring Sale", 10.5, 3],
+            ["meta", "Retargeting", None, 1],
+            ["google", "Launch", 4.25, None],
+            ["tiktok", "Teaser", None, None],
+            ["meta", "Lookalike", 2.0, 2],
+            ["google", "Brand", 1.0, 5],
+        ],
+    },
+}
+
+
+@pytest.fixture(params=["numpy", "python"])
+def engine(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(server, "_load_numpy", lambda: None)
+    return request.param
+
+
+def result() -> server.QueryResult:
+    return server.QueryResult.from_response(RESPONSE)
+
+
+def rows(transformed: server.QueryResult) -> list[list]:
+    return transformed.rows()
+
+
+def test_no_steps_return_the_result_itself():
+    original = result()
+
+    assert server.transform_result(original) is original
+
+
+@pytest.mark.parametrize(
+    "condition, campaigns",
+    [
+        ({"column": "platform", "value": "meta"}, ["Retargeting", "Lookalike"]),
+        ({"column": "spend", "op": ">", "value": 2}, ["Spring Sale", "Launch"]),
+        ({"column": "spend", "op": "<=", "value": 2}, ["Lookalike", "Brand"]),
+        ({"column": "spend", "op": "is null"}, ["Retargeting", "Teaser"]),
+        ({"column": "platform", "op": "in", "value": ["tiktok"]}, ["Teaser"]),
+        ({"column": "campaign", "op": "contains", "value": "SALE"}, ["Spring Sale"]),
+    ],
+)
+def test_filters(engine, condition, campaigns):
+    transformed = server.transform_result(result(), filters=[condition], columns=["campaign"])
+
+    assert rows(transformed) == [[campaign] for campaign in campaigns]
+
+
+def test_every_filter_must_match(engine):
+    filters = [
+        {"column": "platform", "op": "!=", "value": "meta"},
+        {"column": "orders", "op": "not null"},
+    ]
+
+    transformed = server.transform_result(result(), filters=filters, columns=["campaign"])
+
+    assert rows(transformed) == [["Spring Sale"], ["Brand"]]
+
+
+@pytest.mark.parametrize("op", ["in", "not in"])
+def test_in_filters_need_a_list(op):
+    with pytest.raises(ValueError, match=f"Filter op '{op}' needs a list value"):
+        server.transform_result(result(), filters=[{"column": "platform", "op": op, "value": "g"}])
+
+
+def test_unknown_operators_and_columns_are_rejected():
+    with pytest.raises(ValueError, match="Filter op must be one of"):
+        server.transform_result(result(), filters=[{"column": "spend", "op": "~"}])
+    with pytest.raises(ValueError, match="Unknown column 'revenue'; available: platform"):
+        server.transform_result(result(), sort_by="revenue")
+
+
+def test_group_by_sums_numeric_columns_in_first_appearance_order(engine):
+    transformed = server.transform_result(result(), group_by=["platform"])
+
+    assert transformed.names == ["platform", "spend", "orders", "count"]
+    assert [field.display_name for field in transformed.columns][1] == "Sum of Spend"
+    assert rows(transformed) == [
+        ["google", 15.75, 8, 3],
+        ["meta", 2.0, 3, 2],
+        ["tiktok", None, None, 1],
+    ]
+
+
+def test_group_by_several_columns(engine):
+    transformed = server.transform_result(
+        result(),
+        filters=[{"column": "platform", "value": "google"}],
+        group_by=["platform", "campaign"],
+        columns=["campaign", "spend", "count"],
+    )
+
+    assert rows(transformed) == [["Spring Sale", 10.5, 1], ["Launch", 4.25, 1], ["Brand", 1.0, 1]]
+
+
+def test_top_k_sorts_with_nulls_last(engine):
+    top = server.transform_result(result(), sort_by="spend", limit=3, columns=["campaign"])
+    bottom = server.transform_result(
+        result(), sort_by="spend", descending=False, columns=["campaign"]
+    )
+
+    assert rows(top) == [["Spring Sale"], ["Launch"], ["Lookalike"]]
+    assert rows(bottom) == [
+        ["Brand"],
+        ["Lookalike"],
+        ["Launch"],
+        ["Spring Sale"],
+        ["Retargeting"],
+        ["Teaser"],
+    ]
+
+
+def test_limit_without_sort_keeps_the_first_rows():
+    transformed = server.transform_result(result(), limit=2, columns=["platform", "orders"])
+
+    assert rows(transformed) == [["google", 3], ["meta", 1]]
+    with pytest.raises(ValueError, match="limit must not be negative"):
+        server.transform_result(result(), limit=-1)
+
+
+def test_the_envelope_records_the_transform(engine):
+    original = result()
+
+    transformed = server.transform_result(original, group_by=["platform"])
+
+    assert transformed.envelope["row_count"] == 3
+    assert transformed.envelope["database_id"] == 1
+    assert transformed.envelope["transform"] == {"input_rows": 6, "engine": engine}
+    assert original.row_count == 6
@@ -1,6 +1,7 @@
 -- Monthly Accounts Payable Report for Bubble Goods
 -- Shows monthly activity only - NOT cumulative liability  
 -- Key: "Total AP Owed" = Monthly GMV activity minus commission and refunds
+-- Database: Bubble Production Read Replica (ID: 2)
 
 SELECT 
     b.name AS "Brand Name",
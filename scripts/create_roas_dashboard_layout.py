@@ -175,17 +175,19 @@ async def test_cards():
     print("🧪 Testing cards with live data...")
     
     working_cards = []
-    for card_name, card_id in CARD_IDS.items():
-        try:
-            result = await metabase_client.request("POST", f"/card/{card_id}/query")
-            if result.get('status') == 'completed' and result.get('data', {}).get('rows'):
-                row_count = len(result['data']['rows'])
-                print(f"   ✅ {card_name}: {row_count} rows")
-                working_cards.append(card_name)
-            else:
-                print(f"   ⚠️ {card_name}: No data returned")
-        except Exception as e:
-            print(f"   ❌ {card_name}: Error - {e}")
+    outcomes = await metabase_client.execute_many(
+        [{"card_id": card_id} for card_id in CARD_IDS.values()]
+    )
+    for card_name, outcome in zip(CARD_IDS, outcomes):
+        result = outcome.get('result')
+        if outcome['status'] == 'completed' and result is not None and result.row_count:
+            row_count = result.row_count
+            print(f"   ✅ {card_name}: {row_count} rows")
+            working_cards.append(card_name)
+        elif outcome['status'] == 'completed':
+            print(f"   ⚠️ {card_name}: No data returned")
+        else:
+            print(f"   ❌ {card_name}: Error - {outcome['error']}")
     
     return working_cards
 
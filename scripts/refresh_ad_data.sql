@@ -2,6 +2,8 @@
 -- Ad Performance Data Refresh Script
 -- Run this daily to update ROAS metrics
 -- Database: Supabase
+-- After it runs, call the metabase-mcp `invalidate_cache` tool with
+-- database_id=5 so agents stop seeing cached pre-refresh results
 -- ============================================
 
 -- Step 1: Refresh the materialized view